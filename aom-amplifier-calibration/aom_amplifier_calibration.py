@@ -1,16 +1,23 @@
 import logging
 import sys
-from time import sleep
 
+import cancellation
+import instrument_pool
 import numpy as np
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows import ManagedWindow
-from pymeasure.experiment import Procedure, Results
-from pymeasure.experiment.parameters import FloatParameter, ListParameter
-from pymeasure.experiment.results import unique_filename
+import pm_acquisition
+import step_timing
+from pymeasure.experiment import Procedure
+from pymeasure.experiment.parameters import (
+    FloatParameter,
+    IntegerParameter,
+    ListParameter,
+)
 from pymeasure.instruments.rohdeschwarz.hmp import HMP4040
 from pymeasure.instruments.thorlabs import ThorlabsPM100USB
 
+PM_ADDRESS = "USB0::0x1313::0x8078::P0029762::INSTR"
+HMP_ADDRESS = "ASRL11::INSTR"
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
@@ -50,7 +57,14 @@ class AOMAmplifierProcedure(Procedure):
         maximum=10.0,
     )
 
-    DATA_COLUMNS = ["Voltage", "Power"]
+    pm_averaging = IntegerParameter(
+        "Power meter averaging count", default=1, minimum=1, maximum=10000
+    )
+    pm_samples = IntegerParameter(
+        "Power meter samples per step", default=1, minimum=1, maximum=1000
+    )
+
+    DATA_COLUMNS = ["Voltage", "Power", "Power Std"]
 
     def get_voltages(self):
         voltages = np.arange(
@@ -60,15 +74,29 @@ class AOMAmplifierProcedure(Procedure):
         )
         return voltages
 
+    def get_resources(self):
+        return [PM_ADDRESS, HMP_ADDRESS]
+
     def startup(self):
-        self.pm = ThorlabsPM100USB("USB0::0x1313::0x8078::P0029762::INSTR")
-        self.hmp = HMP4040("ASRL11::INSTR")
+        self.pm = instrument_pool.get(
+            PM_ADDRESS,
+            ThorlabsPM100USB,
+            check=instrument_pool.query_id,
+        )
+        self.hmp = instrument_pool.get(
+            HMP_ADDRESS, HMP4040, check=instrument_pool.query_id
+        )
+        self.acquisition = pm_acquisition.PowerMeterAcquisition(
+            self.pm, averaging=self.pm_averaging
+        )
+        self.timer = step_timing.StepTimer(self)
         self.hmp.selected_channel = self.hmp_channel
 
     def get_estimates(self):
         n_points = len(self.get_voltages())
+        duration = step_timing.estimate_duration(self, n_points, self.step_time)
         estimates = [
-            ("Duration / s", f"{n_points * self.step_time:.1f}"),
+            ("Duration / s", f"{duration:.1f}"),
         ]
         return estimates
 
@@ -76,51 +104,37 @@ class AOMAmplifierProcedure(Procedure):
         voltages = self.get_voltages()
 
         for i, v in enumerate(voltages):
+            self.timer.start_step()
             self.emit("progress", 100 * (i / len(voltages)))
             self.hmp.voltage = v
-            sleep(self.step_time)
-            p = self.pm.power
-            self.emit("results", {"Voltage": v, "Power": p})
-
-        self.hmp.voltage = self.start_voltage
-
-        if self.should_stop():
-            log.warning("Caught the stop flag in the procedure")
-            return
-
-
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=AOMAmplifierProcedure,
-            inputs=[
-                "start_voltage",
-                "stop_voltage",
-                "voltage_step",
-                "step_time",
-                "hmp_channel",
-            ],
-            displays=["start_voltage", "stop_voltage", "voltage_step"],
-            x_axis="Voltage",
-            y_axis="Power",
-            enable_file_input=True,
-        )
-        self.setWindowTitle("AOM Amplifier Calibration")
+            self.timer.lap("write")
+            if not cancellation.wait(self, self.step_time):
+                log.warning("Caught the stop flag in the procedure")
+                break
+            self.timer.lap("settle")
+            burst = self.acquisition.read_burst(self.pm_samples)
+            self.timer.lap("read")
+            self.emit(
+                "results", {"Voltage": v, "Power": burst.mean, "Power Std": burst.std}
+            )
+            self.timer.lap("emit")
+
+    def shutdown(self):
+        # first, resetting the instruments can fail
+        if hasattr(self, "timer"):
+            self.timer.finish()
+        if hasattr(self, "hmp"):
+            self.hmp.voltage = self.start_voltage
 
-    def queue(self, *, procedure=None):
-        directory = self.directory
-        filename = unique_filename(directory, prefix="AOMAmplifierCalibration")
 
-        if procedure is None:
-            procedure = self.make_procedure()
-        results = Results(procedure, filename)
-
-        experiment = self.new_experiment(results)
+def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
 
-        self.manager.queue(experiment)
+    from aom_amplifier_calibration_gui import MainWindow
 
+    remote_procedures.enable_from_environment()
 
-def main():
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
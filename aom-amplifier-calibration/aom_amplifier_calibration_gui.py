@@ -0,0 +1,38 @@
+from pymeasure.display.windows import ManagedWindow
+from pymeasure.experiment import Results
+from pymeasure.experiment.results import unique_filename
+
+from aom_amplifier_calibration import AOMAmplifierProcedure
+
+
+class MainWindow(ManagedWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=AOMAmplifierProcedure,
+            inputs=[
+                "start_voltage",
+                "stop_voltage",
+                "voltage_step",
+                "step_time",
+                "hmp_channel",
+                "pm_averaging",
+                "pm_samples",
+            ],
+            displays=["start_voltage", "stop_voltage", "voltage_step"],
+            x_axis="Voltage",
+            y_axis="Power",
+            enable_file_input=True,
+        )
+        self.setWindowTitle("AOM Amplifier Calibration")
+
+    def queue(self, *, procedure=None):
+        directory = self.directory
+        filename = unique_filename(directory, prefix="AOMAmplifierCalibration")
+
+        if procedure is None:
+            procedure = self.make_procedure()
+        results = Results(procedure, filename)
+
+        experiment = self.new_experiment(results)
+
+        self.manager.queue(experiment)
@@ -0,0 +1,250 @@
+import logging
+import sys
+
+import cancellation
+import instrument_pool
+import numpy as np
+from pymeasure.experiment.parameters import (
+    FloatParameter,
+    IntegerParameter,
+    ListParameter,
+)
+
+from aom_amplifier_calibration import HMP_ADDRESS, PM_ADDRESS, AOMAmplifierProcedure
+
+QRF_ADDRESS = "192.168.123.51"
+
+COARSE, FINE = 0, 1
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+# the vendor driver is imported when connecting, so simulations run without it
+def connect_qrf(address):
+    from mog_qrf import QRF
+
+    return QRF(address)
+
+
+def check_qrf(qrf):
+    qrf.freq(1)
+
+
+def coarse_nodes(n, factor):
+    """Every `factor`-th of `n` grid indices, including the last one."""
+    return np.unique(np.append(np.arange(0, n, factor), n - 1))
+
+
+def _cells(nodes):
+    return list(zip(nodes[:-1], nodes[1:])) or [(nodes[0], nodes[0])]
+
+
+def below_threshold(power, rows, columns, threshold):
+    """Mask of the grid points in coarse cells with all corners below `threshold`.
+
+    `power` is the grid with the coarse pass measured at `rows` x `columns`.
+    Cells with a corner that was not measured are kept.
+    """
+    mask = np.zeros(power.shape, dtype=bool)
+    for r0, r1 in _cells(rows):
+        for c0, c1 in _cells(columns):
+            if np.all(power[np.ix_([r0, r1], [c0, c1])] < threshold):
+                mask[r0 : r1 + 1, c0 : c1 + 1] = True
+    return mask
+
+
+def serpentine(mask):
+    """Indices of the True grid points row by row, every other row reversed.
+
+    Only rows with points count, so consecutive rows always change direction.
+    """
+    reverse = False
+    for i, row in enumerate(mask):
+        columns = np.flatnonzero(row)
+        if len(columns) == 0:
+            continue
+        for j in columns[::-1] if reverse else columns:
+            yield i, j
+        reverse = not reverse
+
+
+def _alias(name):
+    return property(lambda self: getattr(self, name))
+
+
+class AOMFrequencyMapProcedure(AOMAmplifierProcedure):
+    """Diffraction efficiency map over the amplifier voltage and the RF frequency.
+
+    The QRF frequency is stepped on the outer axis, the HMP4040 voltage on the
+    inner axis in alternating directions. With a coarse factor above one, a coarse
+    grid is measured first and the cells of the coarse grid with the power at all
+    their corners below the threshold are left out of the fine pass.
+    """
+
+    start_frequency = FloatParameter(
+        "Start frequency of the ramp",
+        units="MHz",
+        default=60.0,
+        minimum=4.0,
+        maximum=250.0,
+    )
+
+    stop_frequency = FloatParameter(
+        "Stop frequency of the ramp",
+        units="MHz",
+        default=100.0,
+        minimum=4.0,
+        maximum=250.0,
+    )
+
+    frequency_step = FloatParameter(
+        "Size of the frequency step",
+        units="MHz",
+        default=1.0,
+        minimum=0.00001,
+        maximum=100.0,
+    )
+
+    qrf_channel = ListParameter("QRF channel", default=1, choices=[1, 2, 3, 4])
+
+    frequency_step_time = FloatParameter(
+        "Wait time after frequency steps",
+        units="s",
+        default=0.5,
+        minimum=0.001,
+        maximum=60.0,
+    )
+
+    coarse_factor = IntegerParameter(
+        "Grid spacing of the coarse pass", default=1, minimum=1, maximum=1000
+    )
+
+    power_threshold = FloatParameter(
+        "Skip coarse cells below",
+        units="W",
+        default=0.0,
+        minimum=0.0,
+        maximum=10.0,
+    )
+
+    DATA_COLUMNS = ["Frequency", "Voltage", "Power", "Power Std", "Pass"]
+
+    # the heatmap of ManagedImageWindow looks the grid up by the column names
+    Frequency_start = _alias("start_frequency")
+    Frequency_end = _alias("stop_frequency")
+    Frequency_step = _alias("frequency_step")
+    Voltage_start = _alias("start_voltage")
+    Voltage_end = _alias("stop_voltage")
+    Voltage_step = _alias("voltage_step")
+
+    def get_frequencies(self):
+        return np.arange(
+            self.start_frequency,
+            self.stop_frequency + self.frequency_step,
+            self.frequency_step,
+        )
+
+    def get_resources(self):
+        return [PM_ADDRESS, HMP_ADDRESS, QRF_ADDRESS]
+
+    def startup(self):
+        super().startup()
+        log.info("Connecting to MOGlabs QRF")
+        self.qrf = instrument_pool.get(QRF_ADDRESS, connect_qrf, check=check_qrf)
+
+    def get_estimates(self):
+        n_frequencies = len(self.get_frequencies())
+        n_points = n_frequencies * len(self.get_voltages())
+        duration = n_points * self.step_time + n_frequencies * self.frequency_step_time
+        estimates = [
+            ("Points", f"{n_points}"),
+            ("Maximum duration / s", f"{duration:.1f}"),
+        ]
+        return estimates
+
+    def measure(self, mask, frequencies, voltages, power, grid_pass, done, total):
+        """Measure the grid points in `mask`, returns False if stopped."""
+        frequency_index = None
+        for i, j in serpentine(mask):
+            self.timer.start_step()
+            self.emit("progress", 100 * done / total)
+            if i != frequency_index:
+                self.qrf.freq(self.qrf_channel, frequencies[i])
+                frequency_index = i
+                settle_time = self.frequency_step_time
+            else:
+                settle_time = self.step_time
+            self.hmp.voltage = voltages[j]
+            self.timer.lap("write")
+            if not cancellation.wait(self, settle_time):
+                log.warning("Caught the stop flag in the procedure")
+                return False
+            self.timer.lap("settle")
+            burst = self.acquisition.read_burst(self.pm_samples)
+            self.timer.lap("read")
+            power[i, j] = burst.mean
+            self.emit(
+                "results",
+                {
+                    "Frequency": frequencies[i],
+                    "Voltage": voltages[j],
+                    "Power": burst.mean,
+                    "Power Std": burst.std,
+                    "Pass": grid_pass,
+                },
+            )
+            self.timer.lap("emit")
+            done += 1
+        return True
+
+    def execute(self):
+        frequencies = self.get_frequencies()
+        voltages = self.get_voltages()
+        power = np.full((len(frequencies), len(voltages)), np.nan)
+
+        rows = coarse_nodes(len(frequencies), self.coarse_factor)
+        columns = coarse_nodes(len(voltages), self.coarse_factor)
+        coarse = np.zeros(power.shape, dtype=bool)
+        coarse[np.ix_(rows, columns)] = True
+
+        log.info(f"Coarse pass over {coarse.sum()} of {power.size} points")
+        if not self.measure(
+            coarse, frequencies, voltages, power, COARSE, 0, power.size
+        ):
+            return
+
+        fine = ~coarse
+        if self.power_threshold > 0:
+            fine &= ~below_threshold(power, rows, columns, self.power_threshold)
+        log.info(
+            f"Fine pass over {fine.sum()} points, "
+            f"skipping {power.size - coarse.sum() - fine.sum()}"
+        )
+        n_coarse = coarse.sum()
+        self.measure(
+            fine, frequencies, voltages, power, FINE, n_coarse, n_coarse + fine.sum()
+        )
+
+    def shutdown(self):
+        super().shutdown()
+        if hasattr(self, "qrf"):
+            self.qrf.freq(self.qrf_channel, self.start_frequency)
+
+
+def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
+
+    from aom_frequency_map_gui import MainWindow
+
+    remote_procedures.enable_from_environment()
+
+    app = QtWidgets.QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    sys.exit(app.exec())
+
+
+if __name__ == "__main__":
+    main()
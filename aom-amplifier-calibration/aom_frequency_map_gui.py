@@ -0,0 +1,53 @@
+from pymeasure.display.windows.managed_image_window import ManagedImageWindow
+from pymeasure.experiment import Results
+from pymeasure.experiment.results import unique_filename
+
+from aom_frequency_map import AOMFrequencyMapProcedure
+
+
+class MainWindow(ManagedImageWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=AOMFrequencyMapProcedure,
+            inputs=[
+                "start_frequency",
+                "stop_frequency",
+                "frequency_step",
+                "frequency_step_time",
+                "qrf_channel",
+                "start_voltage",
+                "stop_voltage",
+                "voltage_step",
+                "step_time",
+                "hmp_channel",
+                "coarse_factor",
+                "power_threshold",
+                "pm_averaging",
+                "pm_samples",
+            ],
+            displays=[
+                "start_frequency",
+                "stop_frequency",
+                "frequency_step",
+                "start_voltage",
+                "stop_voltage",
+                "voltage_step",
+            ],
+            x_axis="Voltage",
+            y_axis="Frequency",
+            z_axis="Power",
+            enable_file_input=True,
+        )
+        self.setWindowTitle("AOM Frequency Map")
+
+    def queue(self, *, procedure=None):
+        directory = self.directory
+        filename = unique_filename(directory, prefix="AOMFrequencyMap")
+
+        if procedure is None:
+            procedure = self.make_procedure()
+        results = Results(procedure, filename)
+
+        experiment = self.new_experiment(results)
+
+        self.manager.queue(experiment)
@@ -1,15 +1,21 @@
 from datetime import datetime
 from time import sleep
 
-import pandas as pd
 from meer_tec import TEC, USB
+from pm_acquisition import PowerMeterAcquisition
 from pymeasure.instruments.thorlabs import ThorlabsPM100USB
 
+# 10 samples averaged over 30 ms each take about 0.3 s of the 1 s interval
+PM_AVERAGING = 10
+PM_SAMPLES = 10
+
 
 def main():
+    import pandas as pd
 
     # Connect to the power meter
     pm = ThorlabsPM100USB("USB0::0x1313::0x8078::P0032734::INSTR")
+    acquisition = PowerMeterAcquisition(pm, averaging=PM_AVERAGING)
     usb = USB("COM17")
     tec = TEC(usb, 0)
 
@@ -18,9 +24,11 @@ def main():
         i += 1
         sleep(1)
 
+        burst = acquisition.read_burst(PM_SAMPLES)
         data = {
             "time": [datetime.now()],
-            "power": [pm.power],
+            "power": [burst.mean],
+            "power_std": [burst.std],
             "t_heater": [tec.object_temperature],
             "t_cell": [tec.sink_temperature],
         }
@@ -1,19 +1,18 @@
 import logging
 import sys
 from datetime import datetime, timedelta
-from time import sleep
+from pathlib import Path
 
-import allantools
 import numpy as np
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
 from pymeasure.experiment import Procedure
 from pymeasure.experiment.parameters import (
     FloatParameter,
     IntegerParameter,
     ListParameter,
     Metadata,
+    Parameter,
 )
+from pymeasure.experiment.results import unique_filename
 from pymeasure.instruments.pendulum.cnt91 import (
     CNT91,
     MAX_BUFFER_SIZE,
@@ -22,18 +21,111 @@ from pymeasure.instruments.pendulum.cnt91 import (
     MIN_GATE_TIME,
 )
 
+import cancellation
+import instrument_pool
+import results_files
+
+COUNTER_ADDRESS = "USB0::0x14EB::0x0091::517306::INSTR"
+# samples processed at once when averaging the raw data file
+CHUNK_SIZE = 1_000_000
+MAX_SAMPLES = 1_000_000_000
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
+def octave_taus(n_samples):
+    """Averaging factors 1, 2, 4, ... for which the overlapping ADEV is defined.
+
+    Unlike allantools' `taus="all"`, only octaves are used, so the number of
+    taus grows with the logarithm of the number of samples.
+    """
+    taus = []
+    m = 1
+    while 2 * m <= n_samples - 1:
+        taus.append(m)
+        m *= 2
+    return np.array(taus, dtype=int)
+
+
+def block_phase(freqs, tau0, offset):
+    """Phase of a block of contiguous samples, integrating `freqs - offset`.
+
+    Subtracting an offset close to the mean frequency keeps the phase small and
+    does not change the Allan deviation.
+    """
+    phase = np.zeros(len(freqs) + 1)
+    np.cumsum(tau0 * (np.asarray(freqs) - offset), out=phase[1:])
+    return phase
+
+
+def second_differences(phase, m):
+    """Sum of the squared second differences of `phase` at lag `m` and their number."""
+    difference = phase[2 * m :] - 2 * phase[m:-m] + phase[: -2 * m]
+    return np.sum(difference**2), len(difference)
+
+
+def blockwise_adev(blocks, tau0, taus, offset):
+    """Overlapping Allan deviation of time series recorded in separate blocks.
+
+    There is dead time between the blocks, so the second differences are only
+    taken within each block and summed over all blocks. A tau is only used in
+    blocks that are long enough for it, NaN if there is none.
+    """
+    totals = np.zeros(len(taus))
+    counts = np.zeros(len(taus), dtype=int)
+    for block in blocks:
+        phase = block_phase(block, tau0, offset)
+        for k, m in enumerate(taus):
+            if len(phase) > 2 * m:
+                total, n = second_differences(phase, m)
+                totals[k] += total
+                counts[k] += n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(totals / (2 * (taus * tau0) ** 2 * counts))
+
+
+def long_adev(freqs, tau0, taus, offset, factor):
+    """Overlapping Allan deviation of the whole time series at taus longer than a block.
+
+    The second differences are taken of the means of `factor` consecutive
+    samples, so they overlap in steps of `factor` and the `taus` have to be
+    multiples of it. The dead time between the blocks is short compared to these
+    taus and is neglected.
+    """
+    n_means = len(freqs) // factor
+    means = np.fromiter(
+        decimate(freqs[: n_means * factor], factor), dtype=np.float64, count=n_means
+    )
+    phase = block_phase(means, factor * tau0, offset)
+    adev = np.full(len(taus), np.nan)
+    for k, m in enumerate(taus):
+        if len(phase) > 2 * (m // factor):
+            total, n = second_differences(phase, m // factor)
+            adev[k] = np.sqrt(total / (2 * (m * tau0) ** 2 * n))
+    return adev
+
+
+def decimate(freqs, factor, chunk_size=CHUNK_SIZE):
+    """Yield the means of `factor` consecutive samples."""
+    chunk_size = max(chunk_size // factor, 1) * factor
+    for start in range(0, len(freqs), chunk_size):
+        chunk = np.asarray(freqs[start : start + chunk_size])
+        n_full = len(chunk) // factor * factor
+        yield from chunk[:n_full].reshape(-1, factor).mean(axis=1)
+        if n_full < len(chunk):
+            yield chunk[n_full:].mean()
+
+
 class CounterTimeseriesProcedure(Procedure):
     start_time = Metadata("Start time", default="")
+    raw_file = Metadata("Raw data file", default="")
 
     n_samples = IntegerParameter(
         "Number of samples",
         default=1000,
         minimum=MIN_BUFFER_SIZE,
-        maximum=MAX_BUFFER_SIZE,
+        maximum=MAX_SAMPLES,
     )
     gate_time = FloatParameter(
         "Gate time",
@@ -55,22 +147,53 @@ class CounterTimeseriesProcedure(Procedure):
         maximum=1e15,
         default=384.230_406_37e12,
     )
+    # empty for the directory of the results file
+    raw_directory = Parameter("Raw data directory", default="")
 
     DATA_COLUMNS = ["Time", "Frequency", "Tau", "Allan Deviation"]
 
+    def get_resources(self):
+        return [COUNTER_ADDRESS]
+
     def startup(self):
         log.info("Connecting to Pendulum CNT9x")
-        self.counter = CNT91("USB0::0x14EB::0x0091::517306::INSTR")
+        self.counter = instrument_pool.get(
+            COUNTER_ADDRESS,
+            CNT91,
+            check=instrument_pool.query_id,
+        )
         self.start_time = datetime.now().isoformat()
+        directory = self.raw_directory
+        if not directory:
+            results = results_files.results_filename(self)
+            directory = Path(results).parent if results else "."
+        self.raw_file = unique_filename(
+            directory, prefix="cnt91-", ext="f8", datetimeformat="%Y%m%d-%H%M%S"
+        )
 
     def get_estimates(self):
         duration = self.n_samples * self.gate_time
         estimates = [
             ("Duration / s", f"{duration}"),
             ("Finised at", f"{datetime.now() + timedelta(seconds=duration)}"),
+            ("Raw data / MB", f"{8 * self.n_samples / 1e6:.1f}"),
         ]
         return estimates
 
+    def recorded_blocks(self, freqs):
+        """The blocks of contiguous samples, until the procedure is stopped."""
+        for start in range(0, len(freqs), MAX_BUFFER_SIZE):
+            if self.should_stop():
+                return
+            yield freqs[start : start + MAX_BUFFER_SIZE]
+
+    def abort_buffering(self):
+        """Stop a buffered measurement that is still running on the counter."""
+        if getattr(self, "buffering", False):
+            log.info("Aborting the buffered measurement")
+            self.counter.write(":ABORT")
+            self.buffering = False
+
     def execute(self):
         log.info("Recording time series.")
 
@@ -82,65 +205,97 @@ class CounterTimeseriesProcedure(Procedure):
             trigger_source = None
 
         log.info("Start buffering data. Measurement duration is {}s".format(duration))
-        buffer_start = datetime.now()
-        self.counter.buffer_frequency_time_series(
-            self.channel,
-            self.n_samples,
-            gate_time=self.gate_time,
-            trigger_source=trigger_source,
-            back_to_back=True,
+        log.info(f"Writing the raw data to {self.raw_file}")
+        # the time axis is implicit, sample i was taken at i * gate_time
+        freqs = np.memmap(
+            self.raw_file, dtype=np.float64, mode="w+", shape=(self.n_samples,)
         )
-        log.info("Waiting for data to be buffered")
-        while (datetime.now() - buffer_start).total_seconds() < duration:
-            self.emit(
-                "progress",
-                100 * (datetime.now() - buffer_start).total_seconds() / duration,
+        n_recorded = 0
+        # the counter buffers at most MAX_BUFFER_SIZE samples, longer time series
+        # are recorded in blocks with a short dead time in between
+        while n_recorded < self.n_samples:
+            n_block = min(MAX_BUFFER_SIZE, self.n_samples - n_recorded)
+            n_buffered = max(n_block, MIN_BUFFER_SIZE)
+            block_duration = n_buffered * self.gate_time
+            buffer_start = datetime.now()
+            self.counter.buffer_frequency_time_series(
+                self.channel,
+                n_buffered,
+                gate_time=self.gate_time,
+                trigger_source=trigger_source,
+                back_to_back=True,
             )
-            sleep(1)
-
-        log.info("Read buffered data")
-        freqs = self.counter.read_buffer(n=self.n_samples)
-        times = np.linspace(0, duration, num=len(freqs))
+            self.buffering = True
+            log.debug("Waiting for data to be buffered")
+            elapsed = 0
+            while elapsed < block_duration:
+                self.emit(
+                    "progress",
+                    100 * (n_recorded + elapsed / self.gate_time) / self.n_samples,
+                )
+                if not cancellation.wait(self, min(1, block_duration - elapsed)):
+                    break
+                elapsed = (datetime.now() - buffer_start).total_seconds()
+            if self.should_stop():
+                # the block that is still being buffered is discarded
+                log.warning("Caught the stop flag in the procedure")
+                self.abort_buffering()
+                break
+            block = self.counter.read_buffer(n=n_buffered)[:n_block]
+            self.buffering = False
+            freqs[n_recorded : n_recorded + n_block] = block
+            n_recorded += n_block
+        freqs.flush()
+        freqs = freqs[:n_recorded]
+        if n_recorded < MIN_BUFFER_SIZE:
+            return
 
-        allan_dev = allantools.oadev(
-            freqs, rate=1 / self.gate_time, data_type="freq", taus="all"
+        log.info("Calculating the Allan deviation")
+        taus = octave_taus(n_recorded)
+        offset = np.mean(freqs[:MAX_BUFFER_SIZE])
+        # taus up to half the buffer size fit into a block, longer ones are
+        # calculated over the whole file from means of the longest of those
+        n_short = len(octave_taus(min(n_recorded, MAX_BUFFER_SIZE)))
+        short = blockwise_adev(
+            self.recorded_blocks(freqs), self.gate_time, taus[:n_short], offset
         )
+        long = long_adev(
+            freqs, self.gate_time, taus[n_short:], offset, factor=taus[n_short - 1]
+        )
+        adev = np.concatenate([short, long]) / self.base_freq
+        taus = taus * self.gate_time
 
-        # pad with nans so adev data has the same length as the raw data in order to
-        # store them in a csv later
-        taus = list(allan_dev[0]) + (len(freqs) - len(allan_dev[0])) * [np.nan]
-        adev = list(allan_dev[1]) + (len(freqs) - len(allan_dev[1])) * [np.nan]
-        adev = np.array(adev) / self.base_freq
-
-        for t, f, tau, ad in zip(times, freqs, taus, adev):
-
+        # the results file gets at most MAX_BUFFER_SIZE rows, longer time series
+        # are averaged, the full data is in the raw data file
+        factor = -(-n_recorded // MAX_BUFFER_SIZE)
+        for i, f in enumerate(decimate(freqs, factor)):
+            tau, ad = (taus[i], adev[i]) if i < len(taus) else (np.nan, np.nan)
+            t = (
+                i * factor + (min(factor, n_recorded - i * factor) - 1) / 2
+            ) * self.gate_time
             self.emit(
                 "results",
                 {"Time": t, "Frequency": f, "Tau": tau, "Allan Deviation": ad},
             )
+            if self.should_stop():
+                return
 
-        if self.should_stop():
-            log.warning("Caught the stop flag in the procedure")
-            return
+    def shutdown(self):
+        # also after an error while buffering
+        self.abort_buffering()
 
 
-class MainWindow(ManagedDockWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=CounterTimeseriesProcedure,
-            inputs=["n_samples", "gate_time", "channel", "trigger_source", "base_freq"],
-            displays=["n_samples", "gate_time"],
-            x_axis=["Time", "Tau"],
-            y_axis=["Frequency", "Allan Deviation"],
-            enable_file_input=True,
-            sequencer=True,
-            sequencer_inputs=["n_samples", "gate_time"],
-        )
-        self.setWindowTitle("Frequency time series")
-        self.filename = r"cnt91-gatetime{Gate time}s"
+def main():
+    from cnt91_ts_gui import MainWindow
+    from pymeasure.display.Qt import QtWidgets
 
+    import remote_procedures
+    import shm_bus
+
+    # with a procedure server, the acquisition runs there instead
+    if not remote_procedures.enable_from_environment() and shm_bus.process_enabled():
+        shm_bus.enable()
 
-def main():
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,26 @@
+from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+
+from cnt91_ts import CounterTimeseriesProcedure
+
+
+class MainWindow(ManagedDockWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=CounterTimeseriesProcedure,
+            inputs=[
+                "n_samples",
+                "gate_time",
+                "channel",
+                "trigger_source",
+                "base_freq",
+                "raw_directory",
+            ],
+            displays=["n_samples", "gate_time"],
+            x_axis=["Time", "Tau"],
+            y_axis=["Frequency", "Allan Deviation"],
+            enable_file_input=True,
+            sequencer=True,
+            sequencer_inputs=["n_samples", "gate_time"],
+        )
+        self.setWindowTitle("Frequency time series")
+        self.filename = r"cnt91-gatetime{Gate time}s"
@@ -1,22 +1,45 @@
 import logging
 import sys
-from time import sleep
 
+import cancellation
+import instrument_pool
 import numpy as np
-from meer_tec.interfaces import USB
-from meer_tec.tec import TEC
-from mog_qrf import QRF
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows import ManagedWindow
-from pymeasure.experiment import Procedure, Results
-from pymeasure.experiment.parameters import FloatParameter, ListParameter
-from pymeasure.experiment.results import unique_filename
+import pm_acquisition
+import step_timing
+from pymeasure.experiment import Procedure
+from pymeasure.experiment.parameters import (
+    FloatParameter,
+    IntegerParameter,
+    ListParameter,
+)
 from pymeasure.instruments.thorlabs import ThorlabsPM100USB
 
+QRF_ADDRESS = "192.168.123.51"
+PM_ADDRESS = "USB0::0x1313::0x8078::P0032734::INSTR"
+TEC_PORT = "COM3"
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
+# the vendor drivers are imported when connecting, so simulations run without them
+def connect_tec(port):
+    from meer_tec.interfaces import USB
+    from meer_tec.tec import TEC
+
+    return TEC(USB(port), 0)
+
+
+def connect_qrf(address):
+    from mog_qrf import QRF
+
+    return QRF(address)
+
+
+def check_qrf(qrf):
+    qrf.freq(1)
+
+
 class FilterCellProcedure(Procedure):
     start_frequency = FloatParameter(
         "Start frequency of the ramp",
@@ -76,33 +99,69 @@ class FilterCellProcedure(Procedure):
         maximum=600.0,
     )
 
-    DATA_COLUMNS = ["Frequency", "Power"]
+    pm_averaging = IntegerParameter(
+        "Power meter averaging count", default=1, minimum=1, maximum=10000
+    )
+    pm_samples = IntegerParameter(
+        "Power meter samples per step", default=1, minimum=1, maximum=1000
+    )
+
+    DATA_COLUMNS = ["Frequency", "Power", "Power Std"]
+
+    def get_resources(self):
+        return [QRF_ADDRESS, PM_ADDRESS, TEC_PORT]
 
     def startup(self):
         log.info("Connecting to MOGlabs QRF")
-        self.qrf = QRF("192.168.123.51")
-        self.pm = ThorlabsPM100USB("USB0::0x1313::0x8078::P0032734::INSTR")
-        self.usb = USB("COM3")
-        self.tec = TEC(self.usb, 0)
+        self.qrf = instrument_pool.get(QRF_ADDRESS, connect_qrf, check=check_qrf)
+        self.pm = instrument_pool.get(
+            PM_ADDRESS,
+            ThorlabsPM100USB,
+            check=instrument_pool.query_id,
+        )
+        self.acquisition = pm_acquisition.PowerMeterAcquisition(
+            self.pm, averaging=self.pm_averaging
+        )
+        self.tec = instrument_pool.get(
+            TEC_PORT,
+            connect_tec,
+            check=instrument_pool.reads("target_object_temperature"),
+        )
+        self.timer = step_timing.StepTimer(self)
 
-    def execute(self):
+    def get_frequencies(self):
+        frequency_step = self.frequency_step
         if self.stop_frequency < self.start_frequency:
-            self.frequency_step = -self.frequency_step
-        freqs = np.arange(
+            frequency_step = -frequency_step
+        return np.arange(
             self.start_frequency,
-            self.stop_frequency + self.frequency_step,
-            self.frequency_step,
+            self.stop_frequency + frequency_step,
+            frequency_step,
         )
 
+    def get_estimates(self):
+        n_points = len(self.get_frequencies())
+        sweep = step_timing.estimate_duration(self, n_points, self.step_time)
+        heating = self.max_heat_time + self.thermalization_time
+        estimates = [
+            ("Sweep duration / s", f"{sweep:.1f}"),
+            ("Maximum duration / s", f"{sweep + heating:.1f}"),
+        ]
+        return estimates
+
+    def execute(self):
+        freqs = self.get_frequencies()
+
         total_duration = (
             self.max_heat_time + self.thermalization_time + self.step_time * len(freqs)
         )
 
         self.qrf.set_timeout(2 * total_duration)
         self.qrf.freq(self.qrf_channel, self.start_frequency)
-        sleep(
-            1
-        )  # to avoid a sudden frequency change at the beginning of the measurement
+        # to avoid a sudden frequency change at the beginning of the measurement
+        if not cancellation.wait(self, 1):
+            log.warning("Caught the stop flag in the procedure")
+            return
 
         temp_changed = False
         if self.cell_temperature != self.tec.target_object_temperature:
@@ -119,13 +178,17 @@ class FilterCellProcedure(Procedure):
         elapsed_time = 0
         while not self.tec.is_stable == 2:
             elapsed_time += 1
-            sleep(1)
+            if not cancellation.wait(self, 1):
+                log.warning("Caught the stop flag in the procedure")
+                return
             if elapsed_time >= self.max_heat_time:
                 log.error("Temperature of the filter cell did not stabilize in time.")
                 break
         if temp_changed:
             log.info("Waiting for the filter cell to thermalize.")
-            sleep(self.thermalization_time)
+            if not cancellation.wait(self, self.thermalization_time):
+                log.warning("Caught the stop flag in the procedure")
+                return
 
         if self.tec.is_stable == 2:
             log.info("Temperature of the filter cell stabilized.")
@@ -133,61 +196,37 @@ class FilterCellProcedure(Procedure):
         log.info("Start recording absorption spectrum.")
 
         for f in freqs:
+            self.timer.start_step()
             self.qrf.freq(self.qrf_channel, f)
-            p = self.pm.power
-            sleep(self.step_time)
-            self.emit("results", {"Frequency": f, "Power": p})
-        self.qrf.freq(self.qrf_channel, self.start_frequency)
-        self.usb.close()
-
-        if self.should_stop():
-            log.warning("Caught the stop flag in the procedure")
-            self.usb.close()
-            return
-
-
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=FilterCellProcedure,
-            inputs=[
-                "qrf_channel",
-                "start_frequency",
-                "stop_frequency",
-                "frequency_step",
-                "step_time",
-                "cell_temperature",
-                "max_heat_time",
-                "thermalization_time",
-            ],
-            displays=["cell_temperature", "start_frequency", "stop_frequency"],
-            x_axis="Frequency",
-            y_axis="Power",
-            enable_file_input=True,
-            sequencer=True,
-            sequencer_inputs=[
-                "cell_temperature",
-                "start_frequency",
-                "stop_frequency",
-                "frequency_step",
-            ],
-        )
-        self.setWindowTitle("Absorption spectrum")
+            self.timer.lap("write")
+            burst = self.acquisition.read_burst(self.pm_samples)
+            self.timer.lap("read")
+            stopped = not cancellation.wait(self, self.step_time)
+            self.timer.lap("settle")
+            self.emit(
+                "results", {"Frequency": f, "Power": burst.mean, "Power Std": burst.std}
+            )
+            self.timer.lap("emit")
+            if stopped:
+                log.warning("Caught the stop flag in the procedure")
+                break
 
-    def queue(self, *, procedure=None):
-        directory = self.directory
-        filename = unique_filename(directory, prefix="AbsorptionSpectrum")
+    def shutdown(self):
+        # first, resetting the instruments can fail
+        if hasattr(self, "timer"):
+            self.timer.finish()
+        if hasattr(self, "qrf"):
+            self.qrf.freq(self.qrf_channel, self.start_frequency)
 
-        if procedure is None:
-            procedure = self.make_procedure()
-        results = Results(procedure, filename)
 
-        experiment = self.new_experiment(results)
+def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
 
-        self.manager.queue(experiment)
+    from filter_cells_gui import MainWindow
 
+    remote_procedures.enable_from_environment()
 
-def main():
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
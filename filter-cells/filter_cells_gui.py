@@ -0,0 +1,48 @@
+from pymeasure.display.windows import ManagedWindow
+from pymeasure.experiment import Results
+from pymeasure.experiment.results import unique_filename
+
+from filter_cells import FilterCellProcedure
+
+
+class MainWindow(ManagedWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=FilterCellProcedure,
+            inputs=[
+                "qrf_channel",
+                "start_frequency",
+                "stop_frequency",
+                "frequency_step",
+                "step_time",
+                "cell_temperature",
+                "max_heat_time",
+                "thermalization_time",
+                "pm_averaging",
+                "pm_samples",
+            ],
+            displays=["cell_temperature", "start_frequency", "stop_frequency"],
+            x_axis="Frequency",
+            y_axis="Power",
+            enable_file_input=True,
+            sequencer=True,
+            sequencer_inputs=[
+                "cell_temperature",
+                "start_frequency",
+                "stop_frequency",
+                "frequency_step",
+            ],
+        )
+        self.setWindowTitle("Absorption spectrum")
+
+    def queue(self, *, procedure=None):
+        directory = self.directory
+        filename = unique_filename(directory, prefix="AbsorptionSpectrum")
+
+        if procedure is None:
+            procedure = self.make_procedure()
+        results = Results(procedure, filename)
+
+        experiment = self.new_experiment(results)
+
+        self.manager.queue(experiment)
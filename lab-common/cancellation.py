@@ -0,0 +1,19 @@
+"""Waiting in procedures without delaying a stop request."""
+
+import time
+
+STOP_POLL_INTERVAL = 0.1
+
+
+def wait(procedure, duration, interval=STOP_POLL_INTERVAL):
+    """Sleep for `duration` s, checking `procedure.should_stop()` every `interval`.
+
+    Returns False if the procedure was stopped before the time was up.
+    """
+    end = time.monotonic() + duration
+    while not procedure.should_stop():
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            return True
+        time.sleep(min(interval, remaining))
+    return False
@@ -0,0 +1,126 @@
+"""Queue of experiments that run concurrently when their instruments differ.
+
+This is the scheduler of `lab-procedures queue FILE.json`. The managed windows
+of the GUIs keep pymeasure's manager, which runs one experiment at a time: each
+window queues experiments of a single procedure, and those share their
+instruments.
+"""
+
+import logging
+import time
+
+from pymeasure.experiment import Procedure, Worker
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def get_resources(procedure):
+    """Instrument addresses used by a procedure.
+
+    Procedures declare them with a `get_resources` method. None means that the
+    resources are unknown and the procedure has to run on its own.
+    """
+    if not hasattr(procedure, "get_resources"):
+        return None
+    return frozenset(procedure.get_resources())
+
+
+def conflicts(resources, other):
+    if resources is None or other is None:
+        return True
+    return bool(resources & other)
+
+
+class _Job:
+    def __init__(self, results):
+        self.results = results
+        self.procedure = results.procedure
+        self.resources = get_resources(self.procedure)
+        self.worker = None
+        self.start = None
+        self.duration = None
+
+    @property
+    def name(self):
+        return self.procedure.__class__.__name__
+
+
+class ResourceScheduler:
+    """Run queued experiments concurrently if they use different instruments.
+
+    An experiment is started as soon as none of its resources is used by a running
+    experiment or by an experiment queued before it, so experiments sharing an
+    instrument still run in the order they were queued.
+    """
+
+    def __init__(self, poll_interval=0.1):
+        self.poll_interval = poll_interval
+        self.pending = []
+        self.running = []
+        self.finished = []
+
+    def queue(self, results):
+        self.pending.append(_Job(results))
+
+    def _startable(self):
+        blocked = []
+        for job in self.pending:
+            busy = [j.resources for j in self.running] + blocked
+            if not any(conflicts(job.resources, other) for other in busy):
+                yield job
+            blocked.append(job.resources)
+
+    def _start(self, job):
+        log.info(f"Starting {job.name} on {', '.join(sorted(job.resources or []))}")
+        self.pending.remove(job)
+        job.worker = Worker(job.results)
+        job.start = time.monotonic()
+        job.worker.start()
+        self.running.append(job)
+
+    def _collect(self):
+        for job in list(self.running):
+            if not job.worker.is_alive():
+                job.duration = time.monotonic() - job.start
+                self.running.remove(job)
+                self.finished.append(job)
+                status = Procedure.STATUS_STRINGS[job.procedure.status]
+                log.info(f"{job.name} {status.lower()} after {job.duration:.1f} s")
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            while self.pending or self.running:
+                for job in list(self._startable()):
+                    self._start(job)
+                time.sleep(self.poll_interval)
+                self._collect()
+        except KeyboardInterrupt:
+            log.warning("Stopping all running experiments")
+            self.pending.clear()
+            for job in self.running:
+                job.worker.stop()
+            for job in self.running:
+                job.worker.join(timeout=None)
+            self._collect()
+        return self.report(time.monotonic() - start)
+
+    def report(self, wall_time):
+        busy_time = sum(job.duration for job in self.finished)
+        n_finished = sum(
+            job.procedure.status == Procedure.FINISHED for job in self.finished
+        )
+        report = {
+            "experiments": len(self.finished),
+            "finished": n_finished,
+            "wall time / s": wall_time,
+            "sum of durations / s": busy_time,
+            "concurrency": busy_time / wall_time if wall_time else 0.0,
+            "experiments / h": (
+                3600 * len(self.finished) / wall_time if wall_time else 0.0
+            ),
+        }
+        for key, value in report.items():
+            log.info(f"{key}: {value:.4g}")
+        return report
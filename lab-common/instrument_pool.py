@@ -0,0 +1,256 @@
+"""Process-wide pool of instrument connections.
+
+Procedures get their instruments with `get(address, factory)` instead of
+constructing them in `startup`. The connection is created on first use and handed
+out again to every later procedure in the same process, so queued experiments skip
+the connection setup. Access to each instrument is serialized with a lock and a
+connection that fails with an I/O error is re-established on the next `get`.
+"""
+
+import atexit
+import enum
+import logging
+import numbers
+import operator
+import threading
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+CONNECTION_ERRORS = (OSError,)
+try:
+    from pyvisa.errors import VisaIOError
+
+    CONNECTION_ERRORS += (VisaIOError,)
+except ImportError:
+    pass
+
+_entries = {}
+_entries_lock = threading.Lock()
+_overrides = {}
+_connect_hooks = []
+
+
+def query_id(instrument):
+    """Health check for SCPI instruments."""
+    instrument.id
+
+
+def reads(name):
+    """Health check for other drivers, reads the attribute `name`."""
+
+    def check(instrument):
+        getattr(instrument, name)
+
+    return check
+
+
+def _name(factory):
+    return f"{factory.__module__}.{factory.__qualname__}"
+
+
+def close(instrument):
+    for name in ["adapter", "interface"]:
+        if hasattr(instrument, name):
+            instrument = getattr(instrument, name)
+    for method in ["close", "disconnect"]:
+        if hasattr(instrument, method):
+            getattr(instrument, method)()
+            return
+
+
+class _Entry:
+    def __init__(self, address, factory, check):
+        self.address = address
+        self.factory = factory
+        self.check = check
+        self.lock = threading.RLock()
+        self.instrument = None
+
+    def connect(self):
+        log.info(f"Connecting to {self.address}")
+        instrument = self.factory(self.address)
+        for hook in _connect_hooks:
+            instrument = hook(self.address, instrument)
+        self.instrument = instrument
+
+    def disconnect(self):
+        if self.instrument is None:
+            return
+        log.info(f"Disconnecting from {self.address}")
+        try:
+            close(self.instrument)
+        except Exception:
+            log.exception(f"Could not close the connection to {self.address}")
+        self.instrument = None
+
+    def is_healthy(self):
+        if self.instrument is None:
+            return False
+        if self.check is None:
+            return True
+        try:
+            self.check(self.instrument)
+        except Exception:
+            log.warning(f"Health check of {self.address} failed")
+            return False
+        return True
+
+    def call(self, function, *args, **kwargs):
+        """Call `function(instrument, *args, **kwargs)` while holding the lock."""
+        with self.lock:
+            if self.instrument is None:
+                self.connect()
+            try:
+                return function(self.instrument, *args, **kwargs)
+            except CONNECTION_ERRORS:
+                log.warning(f"Connection to {self.address} failed, will reconnect")
+                self.disconnect()
+                raise
+
+
+def _is_data(value):
+    """Whether `value` is plain data that is returned as is instead of proxied."""
+    if value is None or isinstance(value, (str, bytes, numbers.Number, enum.Enum)):
+        return True
+    if hasattr(value, "__array_interface__"):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_data(item) for item in value)
+    if isinstance(value, dict):
+        return all(_is_data(item) for item in value.values())
+    return False
+
+
+class PooledInstrument:
+    """Proxy that forwards to the pooled instrument while holding its lock.
+
+    Use it as a context manager to hold the lock for several operations. Objects
+    and containers reached through attributes or items, e.g.
+    `qrf.channels[1].power`, are proxied as well and looked up again on the
+    current connection on every access, so they also survive a reconnect.
+    Objects returned by method calls are proxied with the lock only.
+    """
+
+    def __init__(self, entry, resolve=None):
+        object.__setattr__(self, "_entry", entry)
+        object.__setattr__(self, "_resolve", resolve or (lambda instrument: instrument))
+
+    def _call(self, function, *args):
+        resolve = self._resolve
+        return self._entry.call(lambda instrument: function(resolve(instrument), *args))
+
+    def _child(self, value, resolve):
+        if _is_data(value):
+            return value
+        return PooledInstrument(self._entry, resolve)
+
+    def __getattr__(self, name):
+        value = self._call(getattr, name)
+        if callable(value) and not isinstance(value, type):
+
+            def method(*args, **kwargs):
+                result = self._call(lambda obj: getattr(obj, name)(*args, **kwargs))
+                return self._child(result, lambda instrument: result)
+
+            return method
+        parent = self._resolve
+        return self._child(value, lambda instrument: getattr(parent(instrument), name))
+
+    def __setattr__(self, name, value):
+        self._call(setattr, name, value)
+
+    def __getitem__(self, key):
+        value = self._call(operator.getitem, key)
+        parent = self._resolve
+        return self._child(value, lambda instrument: parent(instrument)[key])
+
+    def __setitem__(self, key, value):
+        self._call(operator.setitem, key, value)
+
+    def __len__(self):
+        return self._call(len)
+
+    def __iter__(self):
+        # mappings iterate over their keys, sequences over their proxied items
+        is_mapping, n = self._call(lambda obj: (hasattr(obj, "keys"), len(obj)))
+        if is_mapping:
+            return iter(self._call(lambda obj: list(obj.keys())))
+        return (self[i] for i in range(n))
+
+    def __contains__(self, item):
+        return self._call(operator.contains, item)
+
+    def __enter__(self):
+        self._entry.lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._entry.lock.release()
+
+    def __repr__(self):
+        value = self._entry.call(self._resolve) if self._entry.instrument else None
+        return f"<PooledInstrument {self._entry.address}: {value!r}>"
+
+
+def get(address, factory, check=None):
+    """Return a shared connection to the instrument at `address`.
+
+    `factory(address)` creates the instrument if there is no healthy connection yet.
+    `check(instrument)` is called on every `get` and should raise if the connection
+    is dead.
+    """
+    factory = _overrides.get(address, factory)
+    with _entries_lock:
+        entry = _entries.get(address)
+        if entry is None:
+            entry = _entries[address] = _Entry(address, factory, check)
+
+    with entry.lock:
+        if _name(entry.factory) != _name(factory):
+            # the same device opened with a different driver
+            entry.disconnect()
+            entry.factory = factory
+            entry.check = check
+        if not entry.is_healthy():
+            entry.disconnect()
+            entry.connect()
+    return PooledInstrument(entry)
+
+
+def override(address, factory):
+    """Use `factory` instead of the factory given to `get`, e.g. for simulations."""
+    release(address)
+    _overrides[address] = factory
+
+
+def clear_override(address):
+    release(address)
+    _overrides.pop(address, None)
+
+
+def add_connect_hook(hook):
+    """Call `hook(address, instrument)` on every new connection.
+
+    The hook returns the instrument to put into the pool, e.g. a wrapper around it.
+    """
+    _connect_hooks.append(hook)
+
+
+def remove_connect_hook(hook):
+    _connect_hooks.remove(hook)
+
+
+def release(address):
+    """Close the connection to `address`, the next `get` reconnects."""
+    with _entries_lock:
+        entry = _entries.pop(address, None)
+    if entry is not None:
+        with entry.lock:
+            entry.disconnect()
+
+
+@atexit.register
+def close_all():
+    for address in list(_entries):
+        release(address)
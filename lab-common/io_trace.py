@@ -0,0 +1,316 @@
+"""Record the instrument I/O of a session and replay it without the instruments.
+
+While recording, every pooled instrument is wrapped in a proxy that writes each
+attribute read, attribute write and method call, with its arguments, result and
+timing, to a trace file. Objects returned by the instrument, e.g. `qrf.channels`,
+are wrapped as well. The trace is a stream of pickled tuples
+
+    (address, operation, path, args, kwargs, result, error, start, duration)
+
+with `operation` one of "get", "set" and "call" and `path` the attribute path
+relative to the instrument, e.g. "channels[4].power".
+
+Replaying installs proxies for all recorded addresses in `instrument_pool` that
+answer with the recorded results, waiting the recorded duration times
+`latency_scale`. Each address is replayed in order and a procedure that does not
+issue the same requests with the same arguments raises a `ReplayError`, so a
+changed `execute` loop can be checked against a recorded session.
+"""
+
+import logging
+import pickle
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+import instrument_pool
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+VERSION = 1
+PLAIN_TYPES = (
+    type(None),
+    bool,
+    int,
+    float,
+    complex,
+    str,
+    bytes,
+    np.ndarray,
+    np.generic,
+)
+
+
+class _Nested:
+    """Marker for results that are objects and are recorded attribute by attribute."""
+
+
+NESTED = _Nested()
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+class MissingAttributeError(ReplayError, AttributeError):
+    """An attribute that is not read next in the trace, `hasattr` is False for it."""
+
+
+def is_plain(value):
+    if isinstance(value, PLAIN_TYPES):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(is_plain(item) for item in value)
+    if isinstance(value, dict):
+        return all(is_plain(k) and is_plain(v) for k, v in value.items())
+    return False
+
+
+def _picklable_error(error):
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(repr(error))
+
+
+class TraceWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.n_records = 0
+        pickle.dump({"version": VERSION, "created": time.time()}, self.file)
+
+    def write(self, record):
+        with self.lock:
+            if self.file.closed:
+                return
+            pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.n_records += 1
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        log.info(f"Wrote {self.n_records} instrument operations to {self.filename}")
+
+
+def read_trace(filename):
+    """Return the header and the list of records of a trace file."""
+    records = []
+    with open(filename, "rb") as f:
+        header = pickle.load(f)
+        if header.get("version") != VERSION:
+            raise ValueError(f"{filename} has an unsupported trace version")
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+    return header, records
+
+
+class _Recorder:
+    def __init__(self, target, writer, address, path=""):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_writer", writer)
+        object.__setattr__(self, "_address", address)
+        object.__setattr__(self, "_path", path)
+
+    def _child_path(self, name):
+        return f"{self._path}.{name}" if self._path else name
+
+    def _write(self, operation, path, args, kwargs, result, error, start):
+        self._writer.write(
+            (
+                self._address,
+                operation,
+                path,
+                args,
+                kwargs,
+                result,
+                error,
+                start - self._writer.start,
+                time.monotonic() - start,
+            )
+        )
+
+    def _record(self, operation, path, function, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        start = time.monotonic()
+        try:
+            result = function()
+        except Exception as e:
+            self._write(operation, path, args, kwargs, None, _picklable_error(e), start)
+            raise
+        if is_plain(result):
+            self._write(operation, path, args, kwargs, result, None, start)
+            return result
+        if operation == "get" and callable(result):
+            # methods are recorded when they are called
+            return _RecordingMethod(result, self._writer, self._address, path)
+        if operation != "get":
+            self._write(operation, path, args, kwargs, NESTED, None, start)
+        return _Recorder(result, self._writer, self._address, path)
+
+    def __getattr__(self, name):
+        return self._record(
+            "get", self._child_path(name), lambda: getattr(self._target, name)
+        )
+
+    def __setattr__(self, name, value):
+        self._record(
+            "set",
+            self._child_path(name),
+            lambda: setattr(self._target, name, value),
+            args=(value,),
+        )
+
+    def __getitem__(self, key):
+        return self._record("get", f"{self._path}[{key!r}]", lambda: self._target[key])
+
+    def __repr__(self):
+        return f"<Recording {self._address} {self._path}: {self._target!r}>"
+
+
+class _RecordingMethod(_Recorder):
+    def __call__(self, *args, **kwargs):
+        return self._record(
+            "call",
+            self._path,
+            lambda: self._target(*args, **kwargs),
+            args=args,
+            kwargs=kwargs,
+        )
+
+
+def record(filename):
+    """Record the I/O of all instruments connected from now on to `filename`.
+
+    Returns the `TraceWriter`, close it when the session is over.
+    """
+    writer = TraceWriter(filename)
+
+    def hook(address, instrument):
+        log.info(f"Recording the I/O of {address}")
+        return _Recorder(instrument, writer, address)
+
+    instrument_pool.add_connect_hook(hook)
+    writer.hook = hook
+    return writer
+
+
+def stop_recording(writer):
+    instrument_pool.remove_connect_hook(writer.hook)
+    writer.close()
+
+
+class _Tape:
+    """The recorded operations of one instrument."""
+
+    def __init__(self, address, records, latency_scale, check_arguments):
+        self.address = address
+        self.records = deque(records)
+        self.latency_scale = latency_scale
+        self.check_arguments = check_arguments
+        self.lock = threading.RLock()
+
+    def peek(self):
+        return self.records[0] if self.records else None
+
+    def pop(self, operation, path, args=(), kwargs=None):
+        with self.lock:
+            if not self.records:
+                raise ReplayError(f"{self.address}: {operation} {path} after the trace")
+            record = self.records.popleft()
+        _, r_operation, r_path, r_args, r_kwargs, result, error, _, duration = record
+        if (r_operation, r_path) != (operation, path):
+            raise ReplayError(
+                f"{self.address}: expected {r_operation} {r_path}, "
+                f"got {operation} {path}"
+            )
+        if self.check_arguments and pickle.dumps((args, kwargs or {})) != pickle.dumps(
+            (r_args, r_kwargs)
+        ):
+            raise ReplayError(
+                f"{self.address}: {operation} {path} with {args} {kwargs or {}}, "
+                f"recorded with {r_args} {r_kwargs}"
+            )
+        if self.latency_scale:
+            time.sleep(duration * self.latency_scale)
+        if error is not None:
+            raise error
+        return result
+
+
+class _Replayer:
+    def __init__(self, tape, path=""):
+        object.__setattr__(self, "_tape", tape)
+        object.__setattr__(self, "_path", path)
+
+    def _resolve(self, path):
+        record = self._tape.peek()
+        r_path = record[2] if record is not None else None
+        if r_path == path:
+            operation = record[1]
+            if operation == "call":
+                return _ReplayMethod(self._tape, path)
+            if operation == "get":
+                return self._result(self._tape.pop("get", path), path)
+            raise ReplayError(f"{self._tape.address}: expected set {path}, got get")
+        if r_path is not None and r_path.startswith((f"{path}.", f"{path}[")):
+            return _Replayer(self._tape, path)
+        if record is None:
+            raise MissingAttributeError(
+                f"{self._tape.address}: get {path} after the trace"
+            )
+        raise MissingAttributeError(
+            f"{self._tape.address}: expected {record[1]} {r_path}, got get {path}"
+        )
+
+    def _result(self, result, path):
+        if isinstance(result, _Nested):
+            return _Replayer(self._tape, path)
+        return result
+
+    def __getattr__(self, name):
+        return self._resolve(f"{self._path}.{name}" if self._path else name)
+
+    def __setattr__(self, name, value):
+        path = f"{self._path}.{name}" if self._path else name
+        self._tape.pop("set", path, args=(value,))
+
+    def __getitem__(self, key):
+        return self._resolve(f"{self._path}[{key!r}]")
+
+    def __repr__(self):
+        return f"<Replay {self._tape.address} {self._path}>"
+
+
+class _ReplayMethod(_Replayer):
+    def __call__(self, *args, **kwargs):
+        result = self._tape.pop("call", self._path, args=args, kwargs=kwargs)
+        return self._result(result, self._path)
+
+
+def replay(filename, latency_scale=1.0, check_arguments=True):
+    """Answer the requests to all instruments in the trace from the trace.
+
+    `latency_scale` is 1 to wait as long as the instruments took during the
+    recording and 0 to answer immediately.
+    """
+    header, records = read_trace(filename)
+    by_address = defaultdict(list)
+    for record in records:
+        by_address[record[0]].append(record)
+
+    for address, address_records in by_address.items():
+        tape = _Tape(address, address_records, latency_scale, check_arguments)
+        log.info(f"Replaying {len(address_records)} operations of {address}")
+        instrument_pool.override(address, lambda address, tape=tape: _Replayer(tape))
+    return list(by_address)
@@ -0,0 +1,168 @@
+"""Averaged and burst readout of Thorlabs PM100 power meters.
+
+`ThorlabsPM100USB.power` sends `MEAS:POW?`, which reconfigures the meter and
+returns a single sample per round trip. `PowerMeterAcquisition` configures the
+averaging count, the wavelength and the power measurement once and then reads N
+samples with one message of chained `READ?` queries:
+
+    acquisition = PowerMeterAcquisition(pm, averaging=10)
+    burst = acquisition.read_burst(20)
+    burst.mean, burst.std, burst.samples
+
+Only the settings that differ from those read back from the meter are written.
+`pm-acquisition` compares the SNR per measurement time of both readouts on a
+connected or simulated meter.
+"""
+
+import argparse
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# duration of a single sample of the PM100, the averaging count multiplies it
+SAMPLE_TIME = 3e-3
+# limit of chained queries in one message, to stay below the input buffer size
+MAX_QUERIES = 50
+# maximum measurement time per message, to stay well below the VISA timeout, a
+# single sample with a high averaging count can take longer, the timeout is then
+# raised accordingly
+MAX_MESSAGE_TIME = 0.5
+# added to the VISA timeout for the communication overhead in s
+TIMEOUT_MARGIN = 1.0
+
+Burst = namedtuple("Burst", ["samples", "mean", "std"])
+
+
+def burst_duration(n_samples, averaging=1):
+    """Measurement time of a burst without the communication overhead in s."""
+    return n_samples * averaging * SAMPLE_TIME
+
+
+class PowerMeterAcquisition:
+    def __init__(self, pm, averaging=1, wavelength=None):
+        self.pm = pm
+        self.averaging = 1
+        self.configure(averaging, wavelength)
+
+    def configure(self, averaging=None, wavelength=None):
+        """Set the averaging count and the wavelength in nm if they changed.
+
+        The current settings are read from the meter, another procedure or the
+        front panel may have changed them since the last run.
+        """
+        self.pm.write("CONF:POW")
+        current = int(self.pm.values("SENS:AVER:COUN?")[0])
+        if averaging is not None and int(averaging) != current:
+            log.debug(f"Setting the averaging count to {int(averaging)}")
+            self.pm.write(f"SENS:AVER:COUN {int(averaging)}")
+            current = int(averaging)
+        if wavelength is not None and wavelength != self.pm.wavelength:
+            self.pm.wavelength = wavelength
+        self.averaging = max(current, 1)
+        self._extend_timeout()
+
+    def _extend_timeout(self):
+        """Raise the VISA timeout above the duration of the longest message."""
+        connection = getattr(getattr(self.pm, "adapter", None), "connection", None)
+        timeout = getattr(connection, "timeout", None)
+        if timeout is None:
+            return
+        duration = burst_duration(self.queries_per_message, self.averaging)
+        required = 1e3 * (2 * duration + TIMEOUT_MARGIN)
+        if timeout < required:
+            log.info(f"Raising the VISA timeout to {required:.0f} ms")
+            connection.timeout = required
+
+    @property
+    def queries_per_message(self):
+        n = int(MAX_MESSAGE_TIME / burst_duration(1, self.averaging))
+        return min(max(n, 1), MAX_QUERIES)
+
+    def read(self):
+        """A single averaged power reading in W."""
+        return self.pm.values("READ?")[0]
+
+    def read_burst(self, n_samples):
+        """Read `n_samples` averaged samples with as few messages as possible."""
+        samples = np.empty(n_samples)
+        position = 0
+        while position < n_samples:
+            n = min(self.queries_per_message, n_samples - position)
+            values = self.pm.values(";:".join(["READ?"] * n), separator=";")
+            samples[position : position + n] = values
+            position += n
+        std = samples.std(ddof=1) if n_samples > 1 else np.nan
+        return Burst(samples, samples.mean(), std)
+
+
+def _snr(samples, duration):
+    """Mean, relative noise and SNR of the mean of one second of samples."""
+    mean = np.mean(samples)
+    relative_noise = np.std(samples, ddof=1) / abs(mean)
+    time_per_sample = duration / len(samples)
+    return mean, relative_noise, 1 / (relative_noise * np.sqrt(time_per_sample))
+
+
+def benchmark(pm, duration=2.0, averaging_counts=(1, 10, 100), burst_size=20):
+    """Compare repeated `pm.power` reads to bursts at several averaging counts.
+
+    The figure of merit is the SNR the mean of the samples taken in 1 s reaches,
+    assuming white noise.
+    """
+    results = {}
+
+    samples = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        samples.append(pm.power)
+    results["power property"] = _snr(samples, time.perf_counter() - start)
+
+    acquisition = PowerMeterAcquisition(pm)
+    for averaging in averaging_counts:
+        acquisition.configure(averaging=averaging)
+        samples = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            samples.extend(acquisition.read_burst(burst_size).samples)
+        name = f"burst, averaging {averaging}"
+        results[name] = _snr(samples, time.perf_counter() - start)
+    acquisition.configure(averaging=1)
+
+    print(f"{'readout':<24}{'mean / W':>12}{'noise':>10}{'SNR in 1 s':>12}")
+    for name, (mean, relative_noise, snr) in results.items():
+        print(f"{name:<24}{mean:>12.4e}{relative_noise:>10.2e}{snr:>12.0f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the SNR per time of PM100 readout modes."
+    )
+    parser.add_argument("address", help="VISA address of the power meter")
+    parser.add_argument("-t", "--duration", type=float, default=2.0)
+    parser.add_argument("-a", "--averaging", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("-n", "--burst-size", type=int, default=20)
+    parser.add_argument(
+        "--simulate", action="store_true", help="use a simulated power meter"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.simulate:
+        from sim_instruments import SimPowerMeter
+
+        pm = SimPowerMeter(lambda: 1e-3)
+    else:
+        from pymeasure.instruments.thorlabs import ThorlabsPM100USB
+
+        pm = ThorlabsPM100USB(args.address)
+    benchmark(pm, args.duration, args.averaging, args.burst_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+import argparse
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PROCEDURES = {
+    "aom-amplifier-calibration": "aom_amplifier_calibration:AOMAmplifierProcedure",
+    "aom-frequency-map": "aom_frequency_map:AOMFrequencyMapProcedure",
+    "filter-cells": "filter_cells:FilterCellProcedure",
+    "cnt91-ts": "cnt91_ts:CounterTimeseriesProcedure",
+    "linien-spectrum": "linien_spectrum:LinienSpectrumProcedure",
+    "mot-telescope-calibration": "mot_telescope_calibration:ReadoutPowerLevelProcedure",
+    "qrf-vs-pm": "qrf_vs_pm:ReadoutPowerLevelProcedure",
+    "mot-telescope-combined": "combined_calibration:CombinedReadoutProcedure",
+    "optical-spectrum": "optical_spectrum:ReadoutPowerLevelProcedure",
+    "pi-curve": "pi_curve:PICharacteristicsProcedure",
+    "scope-readout": "oscilloscope_readout:ScopeReadoutProcedure",
+}
+
+# parameters for measuring the stop latency, so that the procedures take long enough
+STOP_LATENCY_PARAMETERS = {
+    "cnt91-ts": {"n_samples": 100_000},
+    "pi-curve": {"n_steps": 1000, "delay": 1.0},
+}
+
+# how often `run` checks that the worker is still alive
+MONITOR_INTERVAL = 0.5
+
+# in a checkout of the repository, the procedures can be used without installing them
+REPOSITORY = Path(__file__).resolve().parent.parent
+
+
+def add_repository_to_path():
+    for directory in sorted(REPOSITORY.iterdir()):
+        if (directory / "pyproject.toml").exists() and str(directory) not in sys.path:
+            sys.path.append(str(directory))
+
+
+def resolve(name):
+    """Return `module:Class` for a procedure name, class name or `module:Class`."""
+    if ":" in name:
+        return name
+    if name in PROCEDURES:
+        return PROCEDURES[name]
+    matches = [spec for spec in PROCEDURES.values() if spec.endswith(f":{name}")]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        raise ValueError(f"{name} is ambiguous, use one of {', '.join(matches)}")
+    raise ValueError(f"Unknown procedure {name}")
+
+
+def load_procedure_class(name):
+    module_name, class_name = resolve(name).rsplit(":", 1)
+    if module_name.endswith(".py"):
+        path = Path(module_name)
+        sys.path.append(str(path.parent))
+        module = importlib.import_module(path.stem)
+    else:
+        try:
+            module = importlib.import_module(module_name)
+        except ModuleNotFoundError as e:
+            if e.name != module_name:
+                raise
+            add_repository_to_path()
+            module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def read_parameters(filename, procedure_class):
+    """Read parameter values from a JSON file or the header of a results file."""
+    if Path(filename).suffix == ".json":
+        with open(filename) as f:
+            return json.load(f)
+
+    from pymeasure.experiment import Results
+
+    results = Results.load(filename, procedure_class=procedure_class)
+    return results.procedure.parameter_values()
+
+
+def make_procedure(procedure_class, parameters_file=None, parameters=()):
+    procedure = procedure_class()
+    values = {}
+    if parameters_file is not None:
+        values.update(read_parameters(parameters_file, procedure_class))
+    for parameter in parameters:
+        key, _, value = parameter.partition("=")
+        values[key.strip()] = value.strip()
+    procedure.set_parameters(values)
+    return procedure
+
+
+def run(procedure, filename):
+    from pymeasure.experiment import Procedure, Results, Worker
+
+    results = Results(procedure, filename)
+    worker = Worker(results)
+    worker.start()
+    log.info(f"Running {procedure.__class__.__name__}, writing to {filename}")
+
+    while True:
+        try:
+            item = worker.monitor_queue.get(timeout=MONITOR_INTERVAL)
+        except queue.Empty:
+            if not worker.is_alive():
+                # an error in the procedure's shutdown ends the worker before it
+                # stops the results recorder and signals the end
+                worker.recorder.stop()
+                worker.stop()
+                break
+            continue
+        except KeyboardInterrupt:
+            log.warning("Stopping the procedure")
+            worker.stop()
+            continue
+        if item is None:
+            break
+        topic, record = item
+        if topic == "progress":
+            print(f"\r{record:5.1f} %", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    worker.join(timeout=None)
+
+    status = Procedure.STATUS_STRINGS[procedure.status]
+    log.info(f"{procedure.__class__.__name__} {status.lower()}")
+    return procedure.status == Procedure.FINISHED
+
+
+def simulate(procedure, latency=None):
+    import sim_instruments
+
+    return sim_instruments.install(procedure, latency=latency)
+
+
+def trace_io(record=None, replay=None, latency_scale=1.0):
+    """Start recording or replaying the instrument I/O, returns the trace writer."""
+    import io_trace
+
+    if replay is not None:
+        io_trace.replay(replay, latency_scale=latency_scale)
+    if record is not None:
+        return io_trace.record(record)
+    return None
+
+
+def run_remotely(procedure, address):
+    import remote_procedures
+
+    return remote_procedures.install(
+        procedure, remote_procedures.parse_address(address)
+    )
+
+
+def run_queue(filename, directory, simulated=False, latency=None, remote=None):
+    """Run the experiments listed in a JSON file, concurrently where possible.
+
+    The file contains a list of `{"procedure": ..., "parameters": {...}}`.
+    """
+    from pymeasure.experiment import Results
+    from pymeasure.experiment.results import unique_filename
+
+    from experiment_scheduler import ResourceScheduler
+
+    with open(filename) as f:
+        jobs = json.load(f)
+
+    scheduler = ResourceScheduler()
+    for job in jobs:
+        procedure_class = load_procedure_class(job["procedure"])
+        procedure = procedure_class()
+        procedure.set_parameters(job.get("parameters", {}))
+        if simulated:
+            simulate(procedure, latency)
+        if remote is not None:
+            run_remotely(procedure, remote)
+        prefix = job.get("prefix", procedure_class.__name__)
+        scheduler.queue(Results(procedure, unique_filename(directory, prefix=prefix)))
+    report = scheduler.run()
+    return report["finished"] == report["experiments"]
+
+
+def stop_latency(procedure, filename, after):
+    """Stop a running procedure after `after` s and return the time until it ended.
+
+    Returns None if the procedure ended on its own before.
+    """
+    from pymeasure.experiment import Results, Worker
+
+    worker = Worker(Results(procedure, filename))
+    worker.start()
+    # Worker.join stops the worker after the timeout and does not wait for the
+    # thread to end, so the plain Thread.join is used
+    threading.Thread.join(worker, timeout=after)
+    if not worker.is_alive():
+        return None
+    start = time.perf_counter()
+    worker.stop()
+    threading.Thread.join(worker)
+    return time.perf_counter() - start
+
+
+def benchmark_stop_latency(names, after=2.0, repeat=3, latency=None):
+    """Measure how fast the procedures react to a stop request, with simulations."""
+    import numpy as np
+
+    names = names or list(PROCEDURES)
+    print(f"{'procedure':<28}{'min / ms':>10}{'median / ms':>13}{'max / ms':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            procedure_class = load_procedure_class(name)
+            latencies = []
+            for i in range(repeat):
+                procedure = procedure_class()
+                procedure.set_parameters(STOP_LATENCY_PARAMETERS.get(name, {}))
+                simulate(procedure, latency)
+                filename = str(Path(directory) / f"{procedure_class.__name__}{i}.csv")
+                latencies.append(stop_latency(procedure, filename, after))
+            stopped = [t for t in latencies if t is not None]
+            if not stopped:
+                print(f"{name:<28}{'finished before the stop request':>33}")
+                continue
+            print(
+                f"{name:<28}{1e3 * min(stopped):>10.0f}"
+                f"{1e3 * np.median(stopped):>13.0f}{1e3 * max(stopped):>10.0f}"
+            )
+
+
+def import_time(statement, env, repeat):
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"{statement}; print(time.perf_counter() - t)"
+    )
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode:
+            return float("nan")
+        times.append(float(output.stdout))
+    return min(times)
+
+
+def benchmark_imports(repeat=5):
+    """Compare the cold start of each procedure module with and without its GUI."""
+    add_repository_to_path()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    print(f"{'module':<28}{'headless / ms':>15}{'with GUI / ms':>15}{'saved':>8}")
+    for spec in dict.fromkeys(PROCEDURES.values()):
+        module = spec.split(":")[0]
+        gui_module = f"{module}_gui"
+        if importlib.util.find_spec(gui_module) is None:
+            gui_module = "pymeasure.display.windows"
+        headless = import_time(f"import {module}", env, repeat)
+        gui = import_time(f"import {module}, {gui_module}", env, repeat)
+        print(
+            f"{module:<28}{1e3 * headless:>15.0f}{1e3 * gui:>15.0f}"
+            f"{1 - headless / gui:>8.0%}"
+        )
+
+
+def list_procedures():
+    for name, spec in PROCEDURES.items():
+        print(f"{name:<28}{spec}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the lab procedures from the command line, without a GUI."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="list the available procedures")
+
+    run_parser = subparsers.add_parser("run", help="run a procedure")
+    run_parser.add_argument(
+        "procedure", help="procedure name, class name or module:Class"
+    )
+    run_parser.add_argument(
+        "-p",
+        "--parameter",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="set a parameter, can be given multiple times",
+    )
+    run_parser.add_argument(
+        "-f",
+        "--parameters-file",
+        help="JSON file or results file to read the parameters from",
+    )
+    run_parser.add_argument(
+        "-d", "--directory", default=".", help="directory for the results file"
+    )
+    run_parser.add_argument("--prefix", default=None, help="results file prefix")
+    run_parser.add_argument(
+        "--archive",
+        choices=["parquet", "arrow"],
+        default=None,
+        help="also store the results in this format",
+    )
+
+    queue_parser = subparsers.add_parser(
+        "queue", help="run a queue of procedures, concurrently where possible"
+    )
+    queue_parser.add_argument("queue", help="JSON file with the queued procedures")
+    queue_parser.add_argument(
+        "-d", "--directory", default=".", help="directory for the results files"
+    )
+
+    for subparser in [run_parser, queue_parser]:
+        subparser.add_argument(
+            "--simulate",
+            action="store_true",
+            help="use simulated instruments instead of the real ones",
+        )
+        subparser.add_argument(
+            "--latency",
+            type=float,
+            default=None,
+            help="latency of every simulated instrument access in s",
+        )
+        subparser.add_argument(
+            "--profile",
+            action="store_true",
+            help="time the steps of the sweeps and write a summary next to the results",
+        )
+        subparser.add_argument(
+            "--record", metavar="TRACE", help="record the instrument I/O to a file"
+        )
+        subparser.add_argument(
+            "--replay",
+            metavar="TRACE",
+            help="replay the instrument I/O from a file instead of using instruments",
+        )
+        subparser.add_argument(
+            "--replay-latency",
+            type=float,
+            default=1.0,
+            help="scale of the recorded latencies when replaying, 0 to skip them",
+        )
+        subparser.add_argument(
+            "--remote",
+            metavar="HOST:PORT",
+            help="run on a procedure server, see remote-procedures",
+        )
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark-imports", help="measure the cold start time of the procedures"
+    )
+    benchmark_parser.add_argument("-n", "--repeat", type=int, default=5)
+
+    stop_parser = subparsers.add_parser(
+        "stop-latency",
+        help="measure how fast simulated procedures react to a stop request",
+    )
+    stop_parser.add_argument(
+        "procedures", nargs="*", help="procedures to measure, all by default"
+    )
+    stop_parser.add_argument(
+        "--after", type=float, default=2.0, help="stop after this many seconds"
+    )
+    stop_parser.add_argument("-n", "--repeat", type=int, default=3)
+    stop_parser.add_argument(
+        "--latency",
+        type=float,
+        default=None,
+        help="latency of every simulated instrument access in s",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_procedures()
+    elif args.command == "benchmark-imports":
+        benchmark_imports(args.repeat)
+    elif args.command == "stop-latency":
+        benchmark_stop_latency(args.procedures, args.after, args.repeat, args.latency)
+    else:
+        from pymeasure.log import console_log
+
+        console_log(logging.getLogger(), level=logging.INFO)
+        if args.profile:
+            import step_timing
+
+            step_timing.enable_profiling()
+        if args.simulate and args.replay:
+            parser.error("--simulate and --replay can not be combined")
+        if args.remote and (args.simulate or args.replay or args.record):
+            parser.error(
+                "--remote can not be combined with --simulate, --record or --replay,"
+                " the server uses the instruments"
+            )
+        trace = trace_io(args.record, args.replay, args.replay_latency)
+        try:
+            if args.command == "queue":
+                success = run_queue(
+                    args.queue,
+                    args.directory,
+                    args.simulate,
+                    args.latency,
+                    args.remote,
+                )
+            else:
+                from pymeasure.experiment.results import unique_filename
+
+                procedure_class = load_procedure_class(args.procedure)
+                procedure = make_procedure(
+                    procedure_class, args.parameters_file, args.parameter
+                )
+                if args.simulate:
+                    simulate(procedure, args.latency)
+                if args.remote is not None:
+                    run_remotely(procedure, args.remote)
+                prefix = args.prefix or procedure_class.__name__
+                filename = unique_filename(args.directory, prefix=prefix)
+                success = run(procedure, filename)
+                if args.archive is not None:
+                    import results_archive
+
+                    results_archive.convert(filename, format=args.archive)
+        finally:
+            if trace is not None:
+                import io_trace
+
+                io_trace.stop_recording(trace)
+        sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
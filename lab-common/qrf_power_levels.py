@@ -0,0 +1,15 @@
+"""RF power levels in dBm that the MOGlabs QRF can set."""
+
+from pathlib import Path
+
+import numpy as np
+
+POWER_LEVELS_FILE = Path(__file__).parent / "possible_power_values_qrf.txt"
+
+
+def get_power_values(start, stop):
+    """The settable power levels between `start` and `stop`, ascending."""
+    all_power_levels = np.loadtxt(POWER_LEVELS_FILE)
+    rf_powers = all_power_levels[all_power_levels >= start]
+    rf_powers = rf_powers[rf_powers <= stop]
+    return rf_powers
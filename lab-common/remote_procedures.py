@@ -0,0 +1,786 @@
+"""Run the procedures on the lab PC next to the instruments and operate them remotely.
+
+    remote-procedures serve --host 0.0.0.0 -d D:/data     # on the lab PC
+    lab-procedures run aom-amplifier-calibration --remote labpc:5890
+    LAB_PROCEDURES_REMOTE=labpc:5890 aom-amplifier-calibration
+
+The server runs the submitted procedures one after the other with its own
+instrument pool and results files. On the client, `install` replaces `startup`,
+`execute` and `shutdown` of a procedure: startup submits the run and waits until
+it started on the server, execute emits the streamed rows and progress locally.
+The local worker, results file and plots work as usual, so the runner and the
+managed windows act as thin clients.
+
+Every frame is a 5 byte header, the frame type and the payload length, followed
+by the payload. Control messages and events are JSON. Result rows are sent in
+blocks of little-endian float64 behind a binary header, or as JSON if a block
+contains non-numeric values. The events and blocks of a run are numbered and kept
+on the server. The server only sends while the client has credit, which the
+client returns as it processes the items, so a slow client does not fill the
+socket buffers. After a lost connection, the client reconnects and resubscribes
+to its runs from the first item it did not receive.
+
+The server only listens on localhost by default and has no authentication, so
+it only runs the procedures registered in `procedure_runner.PROCEDURES`.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+VERSION = 1
+DEFAULT_PORT = 5890
+REMOTE_VARIABLE = "LAB_PROCEDURES_REMOTE"
+HEADER = struct.Struct("<BI")
+# run, sequence number, rows and columns in front of the float64 values
+BLOCK_HEADER = struct.Struct("<IQII")
+BLOCK_ROWS = 512
+BLOCK_INTERVAL = 0.05
+WINDOW = 32
+MAX_FINISHED_RUNS = 50
+RECONNECT_DELAYS = [0.1, 0.2, 0.5, 1.0, 2.0, 5.0]
+POLL_INTERVAL = 0.1
+
+HELLO, SUBMIT, SUBMITTED, SUBSCRIBE, CREDIT, STOP, EVENT, BLOCK, JSON_BLOCK, ERROR = (
+    range(10)
+)
+
+# values of `Procedure.status`, to avoid importing pymeasure for the constants
+FINISHED, FAILED, ABORTED = 0, 1, 2
+
+
+class RemoteError(RuntimeError):
+    pass
+
+
+def server_address():
+    """`(host, port)` from the environment variable, or None."""
+    value = os.environ.get(REMOTE_VARIABLE, "")
+    return parse_address(value) if value else None
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, DEFAULT_PORT
+    return host, int(port)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def encode_json(frame_type, message):
+    return frame_type, json.dumps(message, default=_json_default).encode()
+
+
+def encode_block(run_id, seq, rows, columns):
+    try:
+        values = np.array(
+            [[float(row[column]) for column in columns] for row in rows], dtype="<f8"
+        )
+    except (KeyError, TypeError, ValueError):
+        rows = [[row.get(column) for column in columns] for row in rows]
+        return encode_json(JSON_BLOCK, {"run": run_id, "seq": seq, "rows": rows})
+    return BLOCK, BLOCK_HEADER.pack(run_id, seq, *values.shape) + values.tobytes()
+
+
+def decode_block(payload):
+    run_id, seq, n_rows, n_columns = BLOCK_HEADER.unpack_from(payload)
+    values = np.frombuffer(payload, dtype="<f8", offset=BLOCK_HEADER.size)
+    return run_id, seq, values.reshape(n_rows, n_columns)
+
+
+def send_frame(sock, frame_type, payload):
+    sock.sendall(HEADER.pack(frame_type, len(payload)) + payload)
+
+
+def _recv_exactly(sock, n):
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    position = 0
+    while position < n:
+        received = sock.recv_into(view[position:])
+        if not received:
+            raise ConnectionError("Connection closed")
+        position += received
+    return buffer
+
+
+def recv_frame(sock):
+    frame_type, length = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return frame_type, _recv_exactly(sock, length)
+
+
+class _Run:
+    """A submitted procedure and the numbered items it produced."""
+
+    def __init__(self, run_id, procedure):
+        self.id = run_id
+        self.procedure = procedure
+        self.columns = list(procedure.DATA_COLUMNS)
+        self.items = []
+        self.condition = threading.Condition()
+        self.pending = []
+        self.pending_since = None
+        self.finished = False
+        self.stop_requested = False
+        self.worker = None
+
+    def _append(self, frame):
+        self.items.append(frame)
+        self.condition.notify_all()
+
+    def _flush(self):
+        if self.pending:
+            self._append(
+                encode_block(self.id, len(self.items), self.pending, self.columns)
+            )
+            self.pending = []
+
+    def event(self, topic, data=None):
+        with self.condition:
+            self._flush()
+            message = {"run": self.id, "seq": len(self.items), "topic": topic}
+            self._append(encode_json(EVENT, {**message, "data": data}))
+
+    def add_row(self, row):
+        with self.condition:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.append(row)
+            if len(self.pending) >= BLOCK_ROWS:
+                self._flush()
+
+    def flush_if_due(self):
+        with self.condition:
+            if self.pending and time.monotonic() - self.pending_since >= BLOCK_INTERVAL:
+                self._flush()
+
+    def finish(self):
+        self.event("done")
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+
+class _RunLogHandler(logging.Handler):
+    """Forwards the log records of the worker thread of a run."""
+
+    def __init__(self, run, thread_id):
+        super().__init__(logging.INFO)
+        self.run = run
+        self.thread_id = thread_id
+
+    def emit(self, record):
+        if record.thread != self.thread_id:
+            return
+        try:
+            message = {
+                "name": record.name,
+                "level": record.levelno,
+                "message": record.getMessage(),
+            }
+            self.run.event("log", message)
+        except Exception:
+            self.handleError(record)
+
+
+class _Subscription:
+    def __init__(self, run, seq, credit):
+        self.run = run
+        self.seq = seq
+        self.credit = credit
+        self.closed = False
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_lock = threading.Lock()
+        self.subscriptions = {}
+        self.send(*encode_json(HELLO, {"version": VERSION}))
+        log.info(f"Client {self.client_address} connected")
+
+    def send(self, frame_type, payload):
+        with self.send_lock:
+            send_frame(self.request, frame_type, payload)
+
+    def handle(self):
+        server = self.server.procedure_server
+        while True:
+            try:
+                frame_type, payload = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            message = json.loads(payload)
+            if frame_type == SUBMIT:
+                try:
+                    run_id = server.submit(message["procedure"], message["parameters"])
+                except Exception as e:
+                    log.exception(f"Could not queue {message['procedure']}")
+                    self.send(
+                        *encode_json(
+                            ERROR, {"request": message["request"], "message": repr(e)}
+                        )
+                    )
+                else:
+                    self.send(
+                        *encode_json(
+                            SUBMITTED, {"request": message["request"], "run": run_id}
+                        )
+                    )
+            elif frame_type == SUBSCRIBE:
+                self.subscribe(message["run"], message["from"], message["credit"])
+            elif frame_type == CREDIT:
+                subscription = self.subscriptions.get(message["run"])
+                if subscription is not None:
+                    with subscription.run.condition:
+                        subscription.credit += message["credit"]
+                        subscription.run.condition.notify_all()
+            elif frame_type == STOP:
+                server.stop(message["run"])
+
+    def subscribe(self, run_id, seq, credit):
+        run = self.server.procedure_server.runs.get(run_id)
+        if run is None:
+            message = {"run": run_id, "seq": seq, "topic": "unknown", "data": None}
+            self.send(*encode_json(EVENT, message))
+            return
+        self.close_subscription(run_id)
+        subscription = self.subscriptions[run_id] = _Subscription(run, seq, credit)
+        threading.Thread(target=self.stream, args=(subscription,), daemon=True).start()
+
+    def close_subscription(self, run_id):
+        subscription = self.subscriptions.pop(run_id, None)
+        if subscription is not None:
+            with subscription.run.condition:
+                subscription.closed = True
+                subscription.run.condition.notify_all()
+
+    def stream(self, subscription):
+        run = subscription.run
+        while True:
+            with run.condition:
+                while not subscription.closed and (
+                    subscription.seq >= len(run.items) or subscription.credit <= 0
+                ):
+                    if run.finished and subscription.seq >= len(run.items):
+                        return
+                    run.condition.wait(POLL_INTERVAL)
+                if subscription.closed:
+                    return
+                frame = run.items[subscription.seq]
+                subscription.seq += 1
+                subscription.credit -= 1
+            try:
+                self.send(*frame)
+            except OSError:
+                return
+
+    def finish(self):
+        for run_id in list(self.subscriptions):
+            self.close_subscription(run_id)
+        log.info(f"Client {self.client_address} disconnected")
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ProcedureServer:
+    """Runs submitted procedures one at a time and streams their results."""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=DEFAULT_PORT,
+        directory=".",
+        simulate=False,
+        latency=None,
+        procedures=None,
+    ):
+        from procedure_runner import PROCEDURES
+
+        self.directory = Path(directory)
+        # `module:Class` of the procedures clients may run
+        self.procedures = set(PROCEDURES.values() if procedures is None else procedures)
+        self.simulate = simulate
+        self.latency = latency
+        self.runs = OrderedDict()
+        self._queue = queue.Queue()
+        self._run_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.tcp_server = _TCPServer((host, port), _ConnectionHandler)
+        self.tcp_server.procedure_server = self
+        self._executor = threading.Thread(target=self._execute, daemon=True)
+
+    @property
+    def address(self):
+        return self.tcp_server.server_address
+
+    def submit(self, spec, parameters):
+        from pymeasure.experiment import Procedure
+
+        from procedure_runner import load_procedure_class
+
+        # never import modules named by a client, they could be any file
+        if spec not in self.procedures:
+            raise ValueError(f"{spec} is not a procedure of this server")
+        procedure_class = load_procedure_class(spec)
+        if not (
+            isinstance(procedure_class, type) and issubclass(procedure_class, Procedure)
+        ):
+            raise ValueError(f"{spec} is not a procedure")
+        procedure = procedure_class()
+        procedure.set_parameters(parameters)
+        if self.simulate:
+            import sim_instruments
+
+            sim_instruments.install(procedure, latency=self.latency)
+        with self._lock:
+            run = _Run(next(self._run_ids), procedure)
+            self.runs[run.id] = run
+        run.event("queued", {"position": self._queue.qsize()})
+        self._queue.put(run)
+        log.info(f"Queued run {run.id} of {spec}")
+        return run.id
+
+    def stop(self, run_id):
+        run = self.runs.get(run_id)
+        if run is None:
+            return
+        run.stop_requested = True
+        if run.worker is not None:
+            run.worker.stop()
+
+    def _execute(self):
+        while True:
+            run = self._queue.get()
+            if run is None:
+                return
+            if run.stop_requested:
+                run.event("status", ABORTED)
+            else:
+                try:
+                    self._run(run)
+                except Exception:
+                    log.exception(f"Run {run.id} failed")
+                    run.event("status", FAILED)
+            run.finish()
+            self._forget_finished_runs()
+
+    def _run(self, run):
+        from pymeasure.experiment import Results, Worker
+        from pymeasure.experiment.results import unique_filename
+
+        procedure = run.procedure
+        self.directory.mkdir(parents=True, exist_ok=True)
+        filename = unique_filename(self.directory, prefix=type(procedure).__name__)
+        worker = Worker(Results(procedure, filename))
+        emit = worker.emit
+
+        def publish(topic, record):
+            emit(topic, record)
+            if topic == "results":
+                run.add_row(record)
+            elif topic in ("status", "progress", "error"):
+                run.event(topic, record)
+
+        worker.emit = publish
+        evaluate_metadata = procedure.evaluate_metadata
+
+        def evaluate_and_publish_metadata():
+            evaluate_metadata()
+            metadata = {
+                name: getattr(procedure, name) for name in procedure.metadata_objects()
+            }
+            run.event("started", {"metadata": metadata, "filename": filename})
+
+        procedure.evaluate_metadata = evaluate_and_publish_metadata
+
+        run.worker = worker
+        worker.start()
+        handler = _RunLogHandler(run, worker.ident)
+        logging.getLogger().addHandler(handler)
+        try:
+            while worker.is_alive():
+                threading.Thread.join(worker, BLOCK_INTERVAL)
+                run.flush_if_due()
+        finally:
+            logging.getLogger().removeHandler(handler)
+
+    def _forget_finished_runs(self):
+        with self._lock:
+            finished = [run_id for run_id, run in self.runs.items() if run.finished]
+            for run_id in finished[:-MAX_FINISHED_RUNS]:
+                del self.runs[run_id]
+
+    def start(self):
+        """Serve in a background thread."""
+        self._executor.start()
+        threading.Thread(target=self.tcp_server.serve_forever, daemon=True).start()
+        log.info(f"Serving procedures on {self.address[0]}:{self.address[1]}")
+
+    def serve_forever(self):
+        self._executor.start()
+        log.info(f"Serving procedures on {self.address[0]}:{self.address[1]}")
+        self.tcp_server.serve_forever()
+
+    def shutdown(self):
+        for run in list(self.runs.values()):
+            self.stop(run.id)
+        self._queue.put(None)
+        self.tcp_server.shutdown()
+        self.tcp_server.server_close()
+
+
+class RemoteRun:
+    """Items of a run received by the client, in order."""
+
+    def __init__(self, client, run_id):
+        self.client = client
+        self.id = run_id
+        self.items = queue.Queue()
+        self.next_seq = 0
+        self._processed = 0
+
+    def receive(self, seq, item):
+        if seq < self.next_seq:
+            return  # sent again after resubscribing
+        if seq > self.next_seq:
+            log.warning(f"Run {self.id} skipped items {self.next_seq} to {seq - 1}")
+        self.next_seq = seq + 1
+        self.items.put(item)
+
+    def get(self, timeout=POLL_INTERVAL):
+        """The next item, `(kind, data)`, or None after `timeout`."""
+        try:
+            item = self.items.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._processed += 1
+        if self._processed >= WINDOW // 2:
+            self.client.grant(self.id, self._processed)
+            self._processed = 0
+        return item
+
+
+class RemoteClient:
+    """Connection to a `ProcedureServer` that reconnects when it is lost."""
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, address, timeout=10.0):
+        self.address = address
+        self.timeout = timeout
+        self.runs = {}
+        self._requests = {}
+        self._request_ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closed = False
+        self.sock = None
+        self._connect()
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    @classmethod
+    def get(cls, address):
+        """Shared client for `address`."""
+        with cls._clients_lock:
+            client = cls._clients.get(address)
+            if client is None or client._closed:
+                client = cls._clients[address] = cls(address)
+            return client
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        frame_type, payload = recv_frame(sock)
+        hello = json.loads(payload)
+        if frame_type != HELLO or hello.get("version") != VERSION:
+            sock.close()
+            raise RemoteError(f"{self.address} is not a compatible procedure server")
+        sock.settimeout(None)
+        self.sock = sock
+        for run in list(self.runs.values()):
+            self._send(
+                *encode_json(
+                    SUBSCRIBE, {"run": run.id, "from": run.next_seq, "credit": WINDOW}
+                )
+            )
+        self._connected.set()
+        log.info(f"Connected to the procedure server {self.address[0]}")
+
+    def _reconnect(self):
+        self._connected.clear()
+        for request in list(self._requests.values()):
+            # a submit in flight might or might not have reached the server
+            request["error"] = "Lost the connection to the procedure server"
+            request["event"].set()
+        for delay in itertools.chain(RECONNECT_DELAYS, itertools.repeat(5.0)):
+            if self._closed:
+                return
+            time.sleep(delay)
+            try:
+                self._connect()
+                return
+            except (OSError, RemoteError) as e:
+                log.warning(f"Could not reconnect to {self.address[0]}: {e}")
+
+    def _send(self, frame_type, payload):
+        with self._send_lock:
+            send_frame(self.sock, frame_type, payload)
+
+    def send(self, frame_type, message):
+        if not self._connected.wait(self.timeout):
+            raise RemoteError(f"Not connected to {self.address[0]}")
+        self._send(*encode_json(frame_type, message))
+
+    def _receive(self):
+        while not self._closed:
+            try:
+                frame_type, payload = recv_frame(self.sock)
+            except (ConnectionError, OSError):
+                if self._closed:
+                    return
+                log.warning(f"Lost the connection to {self.address[0]}, reconnecting")
+                self._reconnect()
+                continue
+            self._dispatch(frame_type, payload)
+
+    def _dispatch(self, frame_type, payload):
+        if frame_type == BLOCK:
+            run_id, seq, rows = decode_block(payload)
+            run = self.runs.get(run_id)
+            if run is not None:
+                run.receive(seq, ("rows", rows))
+            return
+        message = json.loads(payload)
+        if frame_type in (SUBMITTED, ERROR):
+            request = self._requests.get(message["request"])
+            if request is not None:
+                request["run"] = message.get("run")
+                request["error"] = message.get("message")
+                request["event"].set()
+        elif frame_type == JSON_BLOCK:
+            run = self.runs.get(message["run"])
+            if run is not None:
+                run.receive(message["seq"], ("rows", message["rows"]))
+        elif frame_type == EVENT:
+            run = self.runs.get(message["run"])
+            if run is not None:
+                run.receive(message["seq"], (message["topic"], message["data"]))
+
+    def submit(self, procedure):
+        """Queue `procedure` on the server, returns the `RemoteRun`."""
+        cls = type(procedure)
+        request_id = next(self._request_ids)
+        request = self._requests[request_id] = {"event": threading.Event()}
+        try:
+            self.send(
+                SUBMIT,
+                {
+                    "request": request_id,
+                    "procedure": f"{cls.__module__}:{cls.__name__}",
+                    "parameters": procedure.parameter_values(),
+                },
+            )
+            if not request["event"].wait(self.timeout):
+                raise RemoteError("The procedure server did not answer")
+        finally:
+            del self._requests[request_id]
+        if request.get("error"):
+            raise RemoteError(request["error"])
+        run = self.runs[request["run"]] = RemoteRun(self, request["run"])
+        self.send(SUBSCRIBE, {"run": run.id, "from": 0, "credit": WINDOW})
+        return run
+
+    def grant(self, run_id, credit):
+        try:
+            self.send(CREDIT, {"run": run_id, "credit": credit})
+        except (OSError, RemoteError):
+            pass  # the subscription starts with a full window after a reconnect
+
+    def stop(self, run_id):
+        self.send(STOP, {"run": run_id})
+
+    def forget(self, run_id):
+        self.runs.pop(run_id, None)
+
+    def close(self):
+        self._closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def _handle_event(procedure, topic, data, stop_sent):
+    """Forward an event to the local procedure, returns True when the run ended."""
+    if topic == "progress":
+        procedure.emit("progress", data)
+    elif topic == "log":
+        logging.getLogger(data["name"]).log(data["level"], data["message"])
+    elif topic == "error":
+        procedure.remote_error = data
+    elif topic == "status":
+        if data == FAILED:
+            raise RemoteError(
+                getattr(procedure, "remote_error", None) or "The run failed"
+            )
+        if data == ABORTED and not stop_sent:
+            raise RemoteError("The run was aborted on the server")
+    elif topic == "unknown":
+        raise RemoteError("The server does not know the run")
+    return topic == "done"
+
+
+def _items(procedure, client, run):
+    """Items of the run, sends a stop request when the procedure should stop."""
+    stop_sent = False
+    while True:
+        if procedure.should_stop() and not stop_sent:
+            log.info(f"Stopping run {run.id} on the server")
+            client.stop(run.id)
+            stop_sent = True
+        item = run.get()
+        if item is not None:
+            yield item, stop_sent
+
+
+def install(procedure, address):
+    """Let `procedure` run on the procedure server at `(host, port)`."""
+    state = {}
+
+    def remote_startup():
+        client = RemoteClient.get(address)
+        run = client.submit(procedure)
+        state.update(client=client, run=run, metadata={})
+        for (topic, data), stop_sent in _items(procedure, client, run):
+            if topic == "started":
+                state["metadata"] = data["metadata"]
+                log.info(f"Run {run.id} started, the server writes {data['filename']}")
+                return
+            if topic == "queued":
+                log.info(f"Run {run.id} is queued behind {data['position']} runs")
+            elif _handle_event(procedure, topic, data, stop_sent):
+                state["done"] = True
+                return
+
+    def remote_evaluate_metadata():
+        metadata_objects = procedure.metadata_objects()
+        for name, value in state["metadata"].items():
+            metadata = metadata_objects[name]
+            # evaluated on the server, an fget would access the instruments here
+            metadata.fget = None
+            setattr(procedure, name, metadata.evaluate(new_value=value))
+
+    def remote_execute():
+        if state.get("done"):
+            return
+        client, run = state["client"], state["run"]
+        columns = procedure.DATA_COLUMNS
+        try:
+            for (topic, data), stop_sent in _items(procedure, client, run):
+                if topic == "rows":
+                    for row in data:
+                        procedure.emit("results", dict(zip(columns, row)))
+                elif _handle_event(procedure, topic, data, stop_sent):
+                    return
+        finally:
+            client.forget(run.id)
+
+    procedure.startup = remote_startup
+    procedure.evaluate_metadata = remote_evaluate_metadata
+    procedure.execute = remote_execute
+    procedure.shutdown = lambda: None
+    return procedure
+
+
+def enable(address):
+    """Let the managers of the managed windows run their procedures remotely."""
+    import pymeasure.display.manager
+    from pymeasure.experiment import Worker
+
+    def remote_worker(results, *args, **kwargs):
+        install(results.procedure, address)
+        return Worker(results, *args, **kwargs)
+
+    pymeasure.display.manager.Worker = remote_worker
+    log.info(f"Running the procedures on {address[0]}:{address[1]}")
+
+
+def enable_from_environment():
+    """Call `enable` if `LAB_PROCEDURES_REMOTE` is set, returns whether it was."""
+    address = server_address()
+    if address is None:
+        return False
+    enable(address)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the procedures to remote clients."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="run the procedure server")
+    serve_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address to listen on, 0.0.0.0 for all interfaces",
+    )
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument(
+        "-d", "--directory", default=".", help="directory for the results files"
+    )
+    serve_parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="use simulated instruments instead of the real ones",
+    )
+    serve_parser.add_argument(
+        "--latency",
+        type=float,
+        default=None,
+        help="latency of every simulated instrument access in s",
+    )
+    args = parser.parse_args()
+
+    from pymeasure.log import console_log
+
+    console_log(logging.getLogger(), level=logging.INFO)
+    server = ProcedureServer(
+        args.host, args.port, args.directory, args.simulate, args.latency
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Store results files as Parquet or Arrow IPC instead of CSV.
+
+    results-archive convert D:/data/FilterCell*.csv -o D:/archive
+    results-archive compact D:/data -o D:/archive/dataset
+    results-archive benchmark D:/data
+
+The procedure class and the parameters from the CSV header are kept in the
+schema metadata of the converted files. Compacting merges all runs of the same
+procedure into one dataset per procedure, `procedure=<class>/`, with the run
+and the numeric parameters as extra columns. Needs pyarrow, which is imported
+only when needed.
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from results_index import read_header
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PROCEDURE_KEY = b"pymeasure.procedure"
+PARAMETERS_KEY = b"pymeasure.parameters"
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is needed for the archive, install lab-common[archive]"
+        ) from e
+    return pyarrow
+
+
+def read_table(filename, header=None):
+    """Read a pymeasure CSV file into an Arrow table with the header as metadata."""
+    _pyarrow()
+    from pyarrow import csv
+
+    header = header or read_header(filename)
+    if header is None:
+        raise ValueError(f"{filename} is not a pymeasure results file")
+    table = csv.read_csv(
+        filename, read_options=csv.ReadOptions(skip_rows=header["data_start"])
+    )
+    parameters = [
+        {"section": section, "name": name, "value": value}
+        for section, name, value, _, _ in header["parameters"]
+    ]
+    metadata = {
+        PROCEDURE_KEY: header["procedure"].encode(),
+        PARAMETERS_KEY: json.dumps(parameters).encode(),
+    }
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+
+def table_from_results(results):
+    """Arrow table of a pymeasure `Results` object, e.g. to write it directly."""
+    pa = _pyarrow()
+    procedure = results.procedure
+    parameters = [
+        {"section": "Parameters", "name": parameter.name, "value": str(parameter)}
+        for parameter in procedure.parameter_objects().values()
+    ]
+    cls = type(procedure)
+    table = pa.Table.from_pandas(results.data, preserve_index=False)
+    return table.replace_schema_metadata(
+        {
+            PROCEDURE_KEY: f"{cls.__module__}.{cls.__name__}".encode(),
+            PARAMETERS_KEY: json.dumps(parameters).encode(),
+        }
+    )
+
+
+def write_table(table, filename, format="parquet", compression="zstd"):
+    pa = _pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, filename, compression=compression)
+    elif format == "arrow":
+        # uncompressed, so the file can be memory mapped
+        with pa.OSFile(str(filename), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown format {format}")
+
+
+def load(filename):
+    """Read a converted file, returns the table and its parameters."""
+    pa = _pyarrow()
+    if Path(filename).suffix == FORMATS["arrow"]:
+        with pa.memory_map(str(filename)) as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(filename)
+    metadata = table.schema.metadata or {}
+    parameters = json.loads(metadata.get(PARAMETERS_KEY, b"[]"))
+    return table, {p["name"]: p["value"] for p in parameters}
+
+
+def convert(filename, directory=None, format="parquet", compression="zstd"):
+    filename = Path(filename)
+    directory = Path(directory) if directory is not None else filename.parent
+    directory.mkdir(parents=True, exist_ok=True)
+    output = directory / filename.with_suffix(FORMATS[format]).name
+    write_table(read_table(filename), output, format, compression)
+    return output
+
+
+def _results_files(directories):
+    for directory in directories:
+        for filename in sorted(Path(directory).rglob("*.csv")):
+            header = read_header(filename)
+            if header is not None and header["columns"] is not None:
+                yield filename, header
+
+
+def compact(directories, output, compression="zstd"):
+    """Merge all runs of a procedure into one Parquet file per procedure."""
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+
+    runs = defaultdict(list)
+    for filename, header in _results_files(directories):
+        runs[header["procedure"]].append((filename, header))
+
+    outputs = []
+    for procedure, files in runs.items():
+        tables = []
+        for filename, header in files:
+            table = read_table(filename, header)
+            n = table.num_rows
+            table = table.append_column("run", pa.array([filename.stem] * n))
+            for _, name, _, number, _ in header["parameters"]:
+                if number is not None and name not in table.column_names:
+                    table = table.append_column(name, pa.array([number] * n))
+            tables.append(table.replace_schema_metadata(None))
+        try:
+            table = pa.concat_tables(tables, promote_options="default")
+        except TypeError:  # pyarrow < 14
+            table = pa.concat_tables(tables, promote=True)
+
+        directory = Path(output) / f"procedure={procedure}"
+        directory.mkdir(parents=True, exist_ok=True)
+        filename = directory / "part-0.parquet"
+        pq.write_table(table, filename, compression=compression)
+        log.info(f"Compacted {len(files)} runs of {procedure} into {filename}")
+        outputs.append(filename)
+    return outputs
+
+
+def _timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(directories, repeat=3):
+    """Compare loading the CSV files with pandas to loading the converted files."""
+    import pandas as pd
+
+    files = [filename for filename, _ in _results_files(directories)]
+    if not files:
+        log.warning("No results files found")
+        return {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        converted = {
+            format: [convert(f, directory, format) for f in files] for format in FORMATS
+        }
+
+        def read_csv():
+            for f in files:
+                pd.read_csv(f, comment="#")
+
+        def read_converted(format):
+            for f in converted[format]:
+                load(f)[0].to_pandas()
+
+        results = {
+            "csv (pandas)": (
+                _timed(read_csv, repeat),
+                sum(f.stat().st_size for f in files),
+            ),
+        }
+        for format in FORMATS:
+            results[format] = (
+                _timed(lambda: read_converted(format), repeat),
+                sum(f.stat().st_size for f in converted[format]),
+            )
+
+    print(f"{len(files)} files")
+    print(f"{'format':<16}{'load / s':>10}{'size / MB':>12}{'speedup':>9}")
+    csv_time = results["csv (pandas)"][0]
+    for format, (duration, size) in results.items():
+        print(
+            f"{format:<16}{duration:>10.3f}{size / 1e6:>12.2f}"
+            f"{csv_time / duration:>9.1f}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert results files to Parquet or Arrow and compact them."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert results files")
+    convert_parser.add_argument("files", nargs="+")
+    convert_parser.add_argument(
+        "-o", "--directory", default=None, help="output directory"
+    )
+    convert_parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+
+    compact_parser = subparsers.add_parser(
+        "compact", help="merge the runs of each procedure into a dataset"
+    )
+    compact_parser.add_argument("directories", nargs="+")
+    compact_parser.add_argument("-o", "--output", required=True)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="compare the loading time to pandas.read_csv"
+    )
+    benchmark_parser.add_argument("directories", nargs="+")
+    benchmark_parser.add_argument("-n", "--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "convert":
+        for filename in args.files:
+            log.info(f"Wrote {convert(filename, args.directory, args.format)}")
+    elif args.command == "compact":
+        compact(args.directories, args.output)
+    else:
+        benchmark(args.directories, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
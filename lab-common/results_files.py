@@ -0,0 +1,23 @@
+"""Files that procedures write next to their results file.
+
+A pymeasure worker binds `procedure.emit` to itself when it starts, so a running
+procedure can find the results file it writes to, in the GUI as well as in the
+runner or the procedure server.
+"""
+
+from pathlib import Path
+
+
+def results_filename(procedure):
+    """The results file the worker running `procedure` writes to, or None."""
+    worker = getattr(procedure.emit, "__self__", None)
+    results = getattr(worker, "results", None)
+    return getattr(results, "data_filename", None)
+
+
+def companion(procedure, suffix):
+    """The results file of `procedure` with `suffix` instead of its own, or None."""
+    filename = results_filename(procedure)
+    if filename is None:
+        return None
+    return Path(filename).with_suffix(suffix)
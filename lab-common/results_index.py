@@ -0,0 +1,292 @@
+"""SQLite index of the procedure parameters stored in the headers of results files.
+
+    results-index scan D:/data
+    results-index query -P FilterCell -w "Temperature of the filter cell=60" \\
+        -w "Start frequency of the ramp>=150" -w "Stop frequency of the ramp<=200"
+
+Scanning only parses files that are new or whose modification time or size
+changed since the last scan, and drops files that were deleted.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DEFAULT_DATABASE = Path.home() / ".lab-procedures" / "results_index.sqlite"
+SUFFIXES = {".csv", ".txt", ".dat"}
+SECTIONS = {"Parameters", "Metadata"}
+CONDITION = re.compile(
+    r"^(?P<name>.+?)\s*(?P<operator>>=|<=|!=|=|<|>)\s*(?P<value>.*)$"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    procedure TEXT,
+    columns TEXT,
+    n_rows INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    number REAL,
+    units TEXT
+);
+CREATE INDEX IF NOT EXISTS parameters_name_number ON parameters (name, number);
+CREATE INDEX IF NOT EXISTS parameters_file ON parameters (file_id);
+CREATE INDEX IF NOT EXISTS files_procedure ON files (procedure);
+"""
+
+
+def parse_value(text):
+    """Split `60.0 C` into the number 60.0 and the units C."""
+    try:
+        return float(text), None
+    except ValueError:
+        pass
+    number, _, units = text.rpartition(" ")
+    try:
+        return float(number), units
+    except ValueError:
+        return None, None
+
+
+def read_header(filename):
+    """Parse the header that pymeasure writes in front of the data.
+
+    Returns a dict with the `procedure` class, the `parameters` as a list of
+    `(section, name, value, number, units)`, the data `columns` and the line
+    number `data_start` of the column names, or None if the file has no
+    pymeasure header.
+    """
+    header = {"procedure": None, "parameters": [], "columns": None}
+    section = None
+    with open(filename, errors="replace") as f:
+        for i, line in enumerate(f):
+            line = line.rstrip("\r\n")
+            if not line.startswith("#"):
+                header["columns"] = line.split(",") if line else None
+                header["data_start"] = i
+                break
+            content = line[1:]
+            if content.startswith("Procedure:"):
+                header["procedure"] = content.partition(":")[2].strip().strip("<>")
+            elif content.rstrip(":") in SECTIONS:
+                section = content.rstrip(":")
+            elif content.startswith("\t") and section is not None:
+                name, _, value = content.strip().partition(":")
+                value = value.strip()
+                number, units = parse_value(value)
+                header["parameters"].append((section, name, value, number, units))
+            else:
+                section = None
+    if header["procedure"] is None:
+        return None
+    return header
+
+
+def count_rows(filename, data_start):
+    n_lines = 0
+    last = b"\n"
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            n_lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        n_lines += 1
+    return max(n_lines - data_start - 1, 0)
+
+
+class ResultsIndex:
+    def __init__(self, database=DEFAULT_DATABASE):
+        Path(database).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(database))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _add(self, path, stat):
+        try:
+            header = read_header(path)
+        except OSError:
+            log.exception(f"Could not read {path}")
+            return
+        columns = n_rows = procedure = None
+        if header is not None:
+            procedure = header["procedure"]
+            if header["columns"] is not None:
+                columns = ",".join(header["columns"])
+                n_rows = count_rows(path, header["data_start"])
+        # replacing the row also deletes the old parameters
+        self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        cursor = self.connection.execute(
+            "INSERT INTO files (path, mtime_ns, size, procedure, columns, n_rows, "
+            "indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                stat.st_mtime_ns,
+                stat.st_size,
+                procedure,
+                columns,
+                n_rows,
+                time.time(),
+            ),
+        )
+        file_id = cursor.lastrowid
+        if header is not None:
+            self.connection.executemany(
+                "INSERT INTO parameters (file_id, section, name, value, number, units) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(file_id, *parameter) for parameter in header["parameters"]],
+            )
+
+    def scan(self, directories):
+        """Index new and changed files, returns the number of added, updated and
+        removed files."""
+        known = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in self.connection.execute(
+                "SELECT path, mtime_ns, size FROM files"
+            )
+        }
+        added = updated = removed = 0
+        with self.connection:
+            for directory in directories:
+                directory = Path(directory).resolve()
+                seen = set()
+                for root, _, filenames in os.walk(directory):
+                    for filename in filenames:
+                        if Path(filename).suffix.lower() not in SUFFIXES:
+                            continue
+                        path = os.path.join(root, filename)
+                        seen.add(path)
+                        stat = os.stat(path)
+                        if path not in known:
+                            added += 1
+                        elif known[path] != (stat.st_mtime_ns, stat.st_size):
+                            updated += 1
+                        else:
+                            continue
+                        self._add(path, stat)
+                prefix = os.path.join(str(directory), "")
+                deleted = [p for p in known if p.startswith(prefix) and p not in seen]
+                self.connection.executemany(
+                    "DELETE FROM files WHERE path = ?", [(p,) for p in deleted]
+                )
+                removed += len(deleted)
+        log.info(f"Indexed {added} new and {updated} changed files, removed {removed}")
+        return added, updated, removed
+
+    def query(self, procedure=None, conditions=()):
+        """Find results files.
+
+        `procedure` is a pattern for the procedure class, e.g. "FilterCell".
+        `conditions` are strings like "Temperature of the filter cell=60", the
+        parameter name may contain `%` as wildcard. Numbers are compared
+        numerically, everything else as text.
+        """
+        sql = (
+            "SELECT path, procedure, n_rows, mtime_ns FROM files "
+            "WHERE procedure IS NOT NULL"
+        )
+        arguments = []
+        if procedure is not None:
+            sql += " AND procedure LIKE ?"
+            arguments.append(f"%{procedure}%")
+        for condition in conditions:
+            match = CONDITION.match(condition)
+            if match is None:
+                raise ValueError(f"Invalid condition {condition}")
+            name, operator, value = match.group("name", "operator", "value")
+            number, _ = parse_value(value.strip())
+            column = "number" if number is not None else "value"
+            sql += (
+                " AND id IN (SELECT file_id FROM parameters "
+                f"WHERE name LIKE ? AND {column} {operator} ?)"
+            )
+            arguments += [name.strip(), number if number is not None else value.strip()]
+        sql += " ORDER BY mtime_ns"
+        return self.connection.execute(sql, arguments).fetchall()
+
+    def parameters(self, path):
+        return self.connection.execute(
+            "SELECT p.name, p.value FROM parameters p JOIN files f ON p.file_id = f.id "
+            "WHERE f.path = ?",
+            (str(Path(path).resolve()),),
+        ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index the parameters of results files and search them."
+    )
+    parser.add_argument(
+        "--database", default=DEFAULT_DATABASE, help="index database file"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="update the index")
+    scan_parser.add_argument("directories", nargs="+")
+
+    query_parser = subparsers.add_parser("query", help="search the index")
+    query_parser.add_argument(
+        "-P", "--procedure", help="part of the procedure class name"
+    )
+    query_parser.add_argument(
+        "-w",
+        "--where",
+        action="append",
+        default=[],
+        metavar="NAME<OP>VALUE",
+        help="parameter condition with one of =, !=, <, <=, >, >=, can be repeated",
+    )
+    query_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="also print the parameters"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with ResultsIndex(args.database) as index:
+        if args.command == "scan":
+            start = time.perf_counter()
+            index.scan(args.directories)
+            log.info(f"Scan took {time.perf_counter() - start:.2f} s")
+        else:
+            start = time.perf_counter()
+            rows = index.query(args.procedure, args.where)
+            for path, procedure, n_rows, mtime_ns in rows:
+                modified = time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(mtime_ns / 1e9)
+                )
+                print(f"{modified}  {n_rows:>8}  {procedure}  {path}")
+                if args.verbose:
+                    for name, value in index.parameters(path):
+                        print(f"    {name}: {value}")
+            log.info(
+                f"{len(rows)} files in {1e3 * (time.perf_counter() - start):.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
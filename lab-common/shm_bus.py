@@ -0,0 +1,479 @@
+"""Run procedures of a GUI in a separate acquisition process.
+
+In the managed windows, the worker thread that runs the procedure shares the GIL
+with the Qt plotting, so heavy redraws delay the instrument timing of
+`emit`-intensive loops. With the acquisition process enabled, the procedures run
+in a child process that keeps its own instrument pool across experiments:
+
+- the results rows are published into a shared-memory `RingBuffer`,
+- status, progress and log records and the stop request go through a pipe,
+- the GUI process only maps the ring buffer and plots from it.
+
+The results file is still written by the acquisition process. Enable it with the
+environment variable `LAB_PROCEDURES_ACQUISITION_PROCESS=1`, which replaces the
+pymeasure `Worker` of the manager by `ProcessWorker` and the `Results` of the
+managed windows by `BusResults`. Only numeric columns are carried by the ring
+buffer, text columns are read from the file when the run is over.
+
+`shm-bus benchmark` measures the timing jitter of an acquisition loop without a
+GUI, with the GUI load in the same process and with it in another process.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from pymeasure.experiment import Procedure, Results
+from pymeasure.thread import StoppableThread
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PROCESS_VARIABLE = "LAB_PROCEDURES_ACQUISITION_PROCESS"
+DEFAULT_CAPACITY = 1 << 20
+# write count, capacity and number of columns in front of the rows
+HEADER_SIZE = 3
+POLL_INTERVAL = 0.1
+
+
+def process_enabled():
+    return os.environ.get(PROCESS_VARIABLE, "") not in ("", "0")
+
+
+class RingBuffer:
+    """Rows of floats in shared memory, with a single writer and any readers.
+
+    The writer stores the row before it increments the write count, readers copy
+    the rows up to the count and drop the ones the writer overwrote meanwhile.
+    """
+
+    def __init__(self, memory, created):
+        self.memory = memory
+        self.created = created
+        header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=memory.buf)
+        self.capacity, self.n_columns = int(header[1]), int(header[2])
+        self._count = header[:1]
+        self._rows = np.ndarray(
+            (self.capacity, self.n_columns),
+            dtype=np.float64,
+            buffer=memory.buf,
+            offset=HEADER_SIZE * 8,
+        )
+
+    @classmethod
+    def create(cls, n_columns, capacity=DEFAULT_CAPACITY):
+        size = 8 * (HEADER_SIZE + capacity * n_columns)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=memory.buf)
+        header[:] = [0, capacity, n_columns]
+        return cls(memory, created=True)
+
+    @classmethod
+    def attach(cls, name):
+        # the acquisition process is started by multiprocessing and shares the
+        # resource tracker with its parent, which unlinks the memory
+        return cls(shared_memory.SharedMemory(name=name), created=False)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def count(self):
+        return int(self._count[0])
+
+    def write(self, row):
+        count = int(self._count[0])
+        self._rows[count % self.capacity] = row
+        self._count[0] = count + 1
+
+    def read(self, cursor):
+        """Rows written since `cursor`, the new cursor and the number of lost rows."""
+        count = self.count
+        lost = max(count - cursor - self.capacity, 0)
+        start = cursor + lost
+        indices = np.arange(start, count) % self.capacity
+        rows = self._rows[indices]
+        # rows the writer overwrote while they were copied
+        overwritten = max(self.count - self.capacity - start, 0)
+        if overwritten:
+            rows = rows[overwritten:]
+            lost += overwritten
+        return rows, count, lost
+
+    def close(self):
+        # the arrays hold views of the buffer, release them first
+        del self._rows, self._count
+        self.memory.close()
+        if self.created:
+            self.memory.unlink()
+
+
+def to_row(record, columns):
+    row = np.full(len(columns), np.nan)
+    for i, column in enumerate(columns):
+        try:
+            row[i] = record[column]
+        except (KeyError, TypeError, ValueError):
+            pass
+    return row
+
+
+class BusResults(Results):
+    """Results that read new rows from a ring buffer while one is attached.
+
+    Without a ring buffer, or after `detach`, the data is read from the file as
+    usual.
+    """
+
+    def __init__(self, procedure, data_filename):
+        super().__init__(procedure, data_filename)
+        self._init_bus()
+
+    def _init_bus(self):
+        self._bus = None
+        self._bus_cursor = 0
+        self._bus_rows = None
+        self._bus_length = 0
+        self._bus_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        for name in ["_bus", "_bus_rows", "_bus_lock"]:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._init_bus()
+
+    def attach(self, bus):
+        with self._bus_lock:
+            self._bus = bus
+            self._bus_cursor = bus.count
+            self._bus_rows = np.empty((1024, bus.n_columns))
+            self._bus_length = 0
+
+    def detach(self):
+        """Stop reading from the ring buffer and reload the finished file."""
+        with self._bus_lock:
+            self._bus = None
+            self._bus_rows = None
+            try:
+                self.reload()
+            except Exception:
+                log.exception(f"Could not reload {self.data_filename}")
+
+    @property
+    def data(self):
+        with self._bus_lock:
+            if self._bus is None:
+                return super().data
+            rows, self._bus_cursor, lost = self._bus.read(self._bus_cursor)
+            if lost:
+                log.warning(f"The plot missed {lost} rows of the ring buffer")
+            end = self._bus_length + len(rows)
+            if end > len(self._bus_rows):
+                grown = np.empty((max(end, 2 * len(self._bus_rows)), rows.shape[1]))
+                grown[: self._bus_length] = self._bus_rows[: self._bus_length]
+                self._bus_rows = grown
+            self._bus_rows[self._bus_length : end] = rows
+            self._bus_length = end
+            return pd.DataFrame(
+                self._bus_rows[:end], columns=self.procedure.DATA_COLUMNS
+            )
+
+
+class _PipeHandler(logging.Handler):
+    def __init__(self, connection, send_lock):
+        super().__init__()
+        self.connection = connection
+        self.send_lock = send_lock
+
+    def emit(self, record):
+        try:
+            # format now, the arguments and the traceback might not pickle
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            with self.send_lock:
+                self.connection.send(("log", record))
+        except Exception:
+            self.handleError(record)
+
+
+def _run_experiment(results, bus_name, is_last, connection, send_lock):
+    # imported here so the acquisition process starts without pymeasure's
+    # worker module if it is never used
+    from pymeasure.experiment import Worker
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    bus = RingBuffer.attach(bus_name)
+    columns = results.procedure.DATA_COLUMNS
+    worker = Worker(results)
+    worker.is_last = lambda: is_last
+    emit = worker.emit
+
+    def publish(topic, record):
+        emit(topic, record)
+        if topic == "results":
+            bus.write(to_row(record, columns))
+        elif topic in ("status", "progress"):
+            send((topic, record))
+
+    worker.emit = publish
+    worker.start()
+    while worker.is_alive():
+        if connection.poll(POLL_INTERVAL):
+            message = connection.recv()
+            if message[0] == "stop":
+                worker.stop()
+    threading.Thread.join(worker)
+    bus.close()
+    send(("done", None))
+
+
+def _acquisition_process(connection):
+    """Main loop of the acquisition process."""
+    send_lock = threading.Lock()
+    handler = _PipeHandler(connection, send_lock)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message[0] == "run":
+            _, results, bus_name, is_last = message
+            try:
+                _run_experiment(results, bus_name, is_last, connection, send_lock)
+            except Exception:
+                log.exception("Could not run the experiment")
+                with send_lock:
+                    connection.send(("status", Procedure.FAILED))
+                    connection.send(("done", None))
+        elif message[0] == "exit":
+            break
+
+
+class AcquisitionProcess:
+    """Child process that runs one experiment at a time.
+
+    The process, and with it the instrument pool, lives until the GUI exits.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_acquisition_process, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.send_lock = threading.Lock()
+        log.info(f"Started the acquisition process {self.process.pid}")
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None or not cls._instance.process.is_alive():
+                cls._instance = cls()
+            return cls._instance
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+    def close(self):
+        try:
+            self.send(("exit",))
+        except OSError:
+            pass
+        self.process.join(5)
+
+
+class ProcessWorker(StoppableThread):
+    """Replaces the pymeasure `Worker` of the manager.
+
+    Runs the experiment in the `AcquisitionProcess` and relays status, progress
+    and log records to the monitor queue of the manager.
+    """
+
+    def __init__(self, results, log_queue=None, log_level=logging.INFO, port=None):
+        super().__init__()
+        from queue import Queue
+
+        self.results = results
+        self.results.procedure.check_parameters()
+        self.results.procedure.status = Procedure.QUEUED
+        self.monitor_queue = Queue()
+        self.log_level = log_level
+        self.process = AcquisitionProcess.get()
+
+    def is_last(self):
+        raise NotImplementedError("should be monkey patched by a manager")
+
+    def stop(self):
+        if not self.should_stop() and self.is_alive():
+            try:
+                self.process.send(("stop",))
+            except OSError:
+                log.exception("Could not send the stop request")
+        super().stop()
+
+    def run(self):
+        procedure = self.results.procedure
+        bus = RingBuffer.create(len(procedure.DATA_COLUMNS))
+        if isinstance(self.results, BusResults):
+            self.results.attach(bus)
+        try:
+            self.process.send(("run", self.results, bus.name, self.is_last()))
+            self._relay()
+        except (EOFError, OSError):
+            log.exception("Lost the connection to the acquisition process")
+            self.monitor_queue.put(("status", Procedure.FAILED))
+        finally:
+            if isinstance(self.results, BusResults):
+                self.results.detach()
+            bus.close()
+            self.monitor_queue.put(None)
+            super().stop()
+
+    def _relay(self):
+        connection = self.process.connection
+        while True:
+            if not connection.poll(POLL_INTERVAL):
+                if not self.process.process.is_alive():
+                    raise EOFError("The acquisition process exited")
+                continue
+            topic, record = connection.recv()
+            if topic == "done":
+                return
+            if topic == "log":
+                if record.levelno >= self.log_level:
+                    logging.getLogger(record.name).handle(record)
+                continue
+            if topic == "status":
+                self.results.procedure.status = record
+            self.monitor_queue.put((topic, record))
+
+
+def enable():
+    """Run the experiments of all managers in this process in the acquisition
+    process."""
+    import pymeasure.display.manager
+    import pymeasure.display.windows.managed_window
+
+    pymeasure.display.manager.Worker = ProcessWorker
+    pymeasure.display.windows.managed_window.Results = BusResults
+    log.info("Running the procedures in a separate acquisition process")
+
+
+def _tick_loop(period, n_ticks, bus=None):
+    """Run `n_ticks` steps of `period` s and return the step intervals."""
+    times = np.empty(n_ticks)
+    deadline = time.perf_counter()
+    for i in range(n_ticks):
+        deadline += period
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        times[i] = time.perf_counter()
+        if bus is not None:
+            bus.write((i, times[i]))
+    return np.diff(times)
+
+
+def _child_tick_loop(period, n_ticks, bus_name, connection):
+    bus = RingBuffer.attach(bus_name)
+    connection.send(_tick_loop(period, n_ticks, bus))
+    bus.close()
+
+
+def _plot_load(bus, stop_event):
+    """Stand-in for the redraws of the GUI: convert all rows to Python objects."""
+    cursor = 0
+    points = []
+    while not stop_event.is_set():
+        rows, cursor, _ = bus.read(cursor)
+        points.extend(rows.tolist())
+        # redrawing touches every point, as pyqtgraph does with the full curve
+        sum(x * y for x, y in points[-100_000:])
+
+
+def _measure(mode, period, n_ticks):
+    bus = RingBuffer.create(2, capacity=max(n_ticks, 1))
+    stop_event = threading.Event()
+    load = threading.Thread(target=_plot_load, args=(bus, stop_event))
+    try:
+        if mode == "no GUI":
+            return _tick_loop(period, n_ticks, bus)
+        load.start()
+        if mode == "GUI in process":
+            return _tick_loop(period, n_ticks, bus)
+        context = multiprocessing.get_context("spawn")
+        connection, child_connection = context.Pipe()
+        process = context.Process(
+            target=_child_tick_loop,
+            args=(period, n_ticks, bus.name, child_connection),
+        )
+        process.start()
+        intervals = connection.recv()
+        process.join()
+        return intervals
+    finally:
+        stop_event.set()
+        if load.is_alive():
+            load.join()
+        bus.close()
+
+
+def benchmark(period=1e-3, n_ticks=5000):
+    """Timing jitter of an acquisition loop with and without GUI load."""
+    results = {}
+    print(f"{'mode':<24}{'p50 / ms':>10}{'p99 / ms':>10}{'max / ms':>10}")
+    for mode in ["no GUI", "GUI in process", "GUI in other process"]:
+        jitter = np.abs(_measure(mode, period, n_ticks) - period)
+        results[mode] = jitter
+        p50, p99 = np.percentile(jitter, [50, 99])
+        print(
+            f"{mode:<24}{1e3 * p50:>10.3f}{1e3 * p99:>10.3f}"
+            f"{1e3 * jitter.max():>10.3f}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the timing jitter of acquisition with GUI load."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="jitter with and without a GUI process"
+    )
+    benchmark_parser.add_argument(
+        "-p", "--period", type=float, default=1e-3, help="step period in s"
+    )
+    benchmark_parser.add_argument("-n", "--ticks", type=int, default=5000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    benchmark(args.period, args.ticks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,691 @@
+"""Simulated instruments for running the procedures without the lab.
+
+The simulations implement the attributes and methods the procedures use, wait a
+configurable latency on every access like a real bus transaction would, and add
+noise to a simple physics model of the setup. `install(procedure)` swaps them in
+through `instrument_pool.override` when the procedure starts, using the addresses
+the procedure declares, so the procedure code itself is unchanged:
+
+    procedure = AOMAmplifierProcedure()
+    sim_instruments.install(procedure, latency=0.01)
+
+The runner does this for every procedure when called with `--simulate`.
+"""
+
+import logging
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+
+import instrument_pool
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# typical round trip times of the real instruments in s
+LATENCY = {
+    "pm": 0.003,
+    "hmp": 0.02,
+    "qrf": 0.005,
+    "tec": 0.01,
+    "counter": 0.005,
+    "scope": 0.02,
+    "osa": 0.01,
+    "adbox": 0.01,
+    "laser": 0.02,
+    "linien": 0.05,
+}
+NOISE = 0.01
+
+
+class SimInstrument:
+    kind = None
+
+    def __init__(self, latency=None, noise=NOISE, seed=None):
+        self.latency = LATENCY.get(self.kind, 0.0) if latency is None else latency
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def _io(self, extra=0.0):
+        time.sleep(self.latency + extra)
+
+    @property
+    def id(self):
+        self._io()
+        return f"Simulated,{self.__class__.__name__},0,0"
+
+    def close(self):
+        pass
+
+
+class SimPowerMeter(SimInstrument):
+    """Thorlabs PM100USB, `model()` returns the optical power in W.
+
+    Understands the SCPI commands of `pm_acquisition`, the averaging count
+    lowers the noise and lengthens the measurement like on the real meter.
+    """
+
+    kind = "pm"
+    sample_time = 3e-3
+
+    def __init__(self, model, dark_power=1e-9, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.dark_power = dark_power
+        self.averaging = 1
+        self._wavelength = 780.0
+
+    def _sample(self):
+        noise = self.noise / np.sqrt(self.averaging)
+        power = self.model() * (1 + noise * self.rng.standard_normal())
+        return power + self.dark_power * self.rng.standard_normal()
+
+    def _measurement_time(self, n=1):
+        return n * self.averaging * self.sample_time
+
+    @property
+    def power(self):
+        self._io(self._measurement_time())
+        return self._sample()
+
+    @property
+    def wavelength(self):
+        self._io()
+        return self._wavelength
+
+    @wavelength.setter
+    def wavelength(self, value):
+        self._io()
+        self._wavelength = value
+
+    def write(self, command):
+        self._io()
+        for part in command.split(";"):
+            name, _, value = part.strip(":").partition(" ")
+            if name.upper() == "SENS:AVER:COUN":
+                self.averaging = max(int(value), 1)
+
+    def values(self, command, separator=","):
+        queries = [part.strip(":") for part in command.split(";")]
+        if [query.upper() for query in queries] == ["SENS:AVER:COUN?"]:
+            self._io()
+            return [float(self.averaging)]
+        if any(query.upper() != "READ?" for query in queries):
+            raise ValueError(f"Unsupported query {command}")
+        self._io(self._measurement_time(len(queries)))
+        reply = separator.join(str(self._sample()) for _ in queries)
+        return [float(value) for value in reply.split(separator)]
+
+
+class SimHMP4040(SimInstrument):
+    kind = "hmp"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._channel = 1
+        self.voltages = {channel: 0.0 for channel in range(1, 5)}
+
+    @property
+    def selected_channel(self):
+        self._io()
+        return self._channel
+
+    @selected_channel.setter
+    def selected_channel(self, channel):
+        self._io()
+        self._channel = int(channel)
+
+    @property
+    def voltage(self):
+        self._io()
+        return self.voltages[self._channel]
+
+    @voltage.setter
+    def voltage(self, value):
+        self._io()
+        self.voltages[self._channel] = float(value)
+
+
+class SimQRFChannel:
+    def __init__(self, qrf):
+        self._qrf = qrf
+        self._power = -50.0
+        self.frequency = 80.0
+
+    @property
+    def power(self):
+        self._qrf._io()
+        return self._power
+
+    @power.setter
+    def power(self, value):
+        self._qrf._io()
+        self._power = float(value)
+
+
+class SimQRF(SimInstrument):
+    """MOGlabs QRF with the interfaces of both `mog_qrf` and `mogdevice`."""
+
+    kind = "qrf"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = {channel: SimQRFChannel(self) for channel in range(1, 5)}
+
+    def freq(self, channel, value=None):
+        self._io()
+        if value is None:
+            return self.channels[channel].frequency
+        self.channels[channel].frequency = float(value)
+
+    def set_timeout(self, timeout):
+        pass
+
+    def rf_power(self, channel):
+        """RF power of a channel in W."""
+        return 1e-3 * 10 ** (self.channels[channel]._power / 10)
+
+
+class SimTEC(SimInstrument):
+    """Meerstetter TEC, the temperature relaxes exponentially to the target."""
+
+    kind = "tec"
+
+    def __init__(self, temperature=25.0, time_constant=5.0, tolerance=0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.time_constant = time_constant
+        self.tolerance = tolerance
+        self._start = temperature
+        self._target = temperature
+        self._set_time = time.monotonic()
+
+    def _temperature(self):
+        elapsed = time.monotonic() - self._set_time
+        decay = np.exp(-elapsed / self.time_constant)
+        return self._target + (self._start - self._target) * decay
+
+    @property
+    def target_object_temperature(self):
+        self._io()
+        return self._target
+
+    @target_object_temperature.setter
+    def target_object_temperature(self, value):
+        self._io()
+        self._start = self._temperature()
+        self._target = float(value)
+        self._set_time = time.monotonic()
+
+    @property
+    def object_temperature(self):
+        self._io()
+        return self._temperature() + 0.01 * self.rng.standard_normal()
+
+    @property
+    def sink_temperature(self):
+        self._io()
+        return 25.0
+
+    @property
+    def is_stable(self):
+        # 2 is "stable" in the temperature stability state of the TEC firmware
+        self._io()
+        return 2 if abs(self._temperature() - self._target) < self.tolerance else 1
+
+
+class SimCNT91(SimInstrument):
+    """Pendulum CNT-91 measuring a beat note with white and random walk FM noise."""
+
+    kind = "counter"
+
+    def __init__(self, frequency=10e6, white_noise=1e-2, random_walk=1e-3, **kwargs):
+        super().__init__(**kwargs)
+        self.frequency = frequency
+        self.white_noise = white_noise
+        self.random_walk = random_walk
+        self._n = 0
+        self._gate_time = 1.0
+        self._ready = 0.0
+
+    def buffer_frequency_time_series(
+        self, channel, n_samples, gate_time=1.0, trigger_source=None, back_to_back=True
+    ):
+        self._io()
+        self._n = n_samples
+        self._gate_time = gate_time
+        self._ready = time.monotonic() + n_samples * gate_time
+
+    @property
+    def measuring(self):
+        return time.monotonic() < self._ready
+
+    def write(self, command):
+        self._io()
+        if command.upper().startswith(":ABOR"):
+            self._ready = 0.0
+
+    def read_buffer(self, n=None):
+        n = self._n if n is None else n
+        # the counter only answers once the measurement is done
+        self._io(max(0.0, self._ready - time.monotonic()) + 1e-6 * n)
+        walk = np.cumsum(self.random_walk * self.rng.standard_normal(n))
+        white = self.white_noise * self.rng.standard_normal(n)
+        return list(self.frequency + walk + white)
+
+
+class SimLeCroy(SimInstrument):
+    """LeCroy oscilloscope showing a sine on every channel.
+
+    While running, every download is from a new trigger. A single acquisition
+    stops the scope after `acquisition_time`, and all downloads until the next
+    one return the same traces.
+    """
+
+    kind = "scope"
+
+    def __init__(
+        self,
+        frequency=1e3,
+        sample_rate=1e6,
+        points=10_000,
+        acquisition_time=0.01,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.frequency = frequency
+        self.sample_rate = sample_rate
+        self.points = points
+        self.acquisition_time = acquisition_time
+        self._mode = "normal"
+        self._ready = 0.0
+        self._acquisition = None
+
+    def _new_acquisition(self):
+        return {
+            "phase": self.rng.uniform(0, 2 * np.pi),
+            "seed": self.rng.integers(2**32),
+        }
+
+    @property
+    def trigger_mode(self):
+        self._io()
+        if self._mode == "single" and time.monotonic() >= self._ready:
+            self._mode = "stopped"
+        return self._mode
+
+    @trigger_mode.setter
+    def trigger_mode(self, mode):
+        self._io()
+        self._mode = mode
+        if mode == "single":
+            self._ready = time.monotonic() + self.acquisition_time
+            self._acquisition = self._new_acquisition()
+
+    def download_waveform(self, channel, requested_points=0, sparsing=1):
+        n = int(requested_points) or self.points // max(int(sparsing), 1)
+        # download time grows with the number of points
+        self._io(2e-7 * n)
+        acquisition = self._acquisition
+        if self._mode != "stopped" or acquisition is None:
+            acquisition = self._new_acquisition()
+        number = int(channel[-1])
+        rng = np.random.default_rng([acquisition["seed"], number])
+        t = np.arange(n) * max(int(sparsing), 1) / self.sample_rate
+        phase = acquisition["phase"] + 0.5 * np.pi * (number - 1)
+        wf = np.sin(2 * np.pi * self.frequency * t + phase)
+        wf = wf + self.noise * rng.standard_normal(n)
+        return wf, t, {"channel": channel}
+
+
+class SimAQ6370D(SimInstrument):
+    """Yokogawa AQ6370D looking at a single mode laser at `center` nm."""
+
+    kind = "osa"
+
+    def __init__(
+        self,
+        center=780.24,
+        peak_power=0.0,
+        linewidth=0.02,
+        noise_floor=-70.0,
+        sweep_time=1.0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.center = center
+        self.peak_power = peak_power
+        self.linewidth = linewidth
+        self.noise_floor = noise_floor
+        self.sweep_time = sweep_time
+        self.wavelength_start = 775.0
+        self.wavelength_stop = 785.0
+        self.resolution_bandwidth = 0.02
+        self.reference_level = 0.0
+        self.level_position = 8
+        self.automatic_sample_number = True
+        self.sample_number = 1001
+        self.sweep_mode = "SINGLE"
+        self._sweep_done = 0.0
+
+    def initiate_sweep(self):
+        self._io()
+        self._sweep_done = time.monotonic() + self.sweep_time
+
+    def values(self, command):
+        self._io()
+        if command == ":STAT:OPER:EVEN?":
+            return [int(time.monotonic() < self._sweep_done)]
+        raise ValueError(f"Command {command} is not simulated")
+
+    def _n_points(self):
+        if not self.automatic_sample_number:
+            return int(self.sample_number)
+        span = self.wavelength_stop - self.wavelength_start
+        return int(span / self.resolution_bandwidth * 5) + 1
+
+    def get_xdata(self):
+        n = self._n_points()
+        self._io(1e-6 * n)
+        return np.linspace(self.wavelength_start, self.wavelength_stop, n)
+
+    def get_ydata(self):
+        x = np.linspace(self.wavelength_start, self.wavelength_stop, self._n_points())
+        self._io(1e-6 * len(x))
+        # the measured line width is limited by the resolution bandwidth
+        width = np.hypot(self.linewidth, self.resolution_bandwidth)
+        line = 10 ** (self.peak_power / 10) * np.exp(
+            -4 * np.log(2) * ((x - self.center) / width) ** 2
+        )
+        floor = 10 ** (self.noise_floor / 10) * (1 + self.rng.exponential(size=len(x)))
+        return 10 * np.log10(line + floor)
+
+
+class SimTelescopeADBox(SimInstrument):
+    """ADBox with logarithmic RF detectors on all channels, `model()` in dBm."""
+
+    kind = "adbox"
+    CHANNELS = ["A1", "A2", "A3", "B1", "B2", "B3"]
+
+    def __init__(self, model, slope=50.0, intercept=2500.0, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.slope = slope
+        self.intercept = intercept
+        # every detector is coupled a bit differently
+        self.coupling = self.rng.uniform(-6.0, 0.0, len(self.CHANNELS))
+
+    def get_data(self, raw=False):
+        self._io()
+        power = self.model() + self.coupling
+        adc = self.intercept + self.slope * power
+        adc = adc + 2 * self.rng.standard_normal(len(adc))
+        # detector floor and saturation, 12 bit ADC
+        adc = np.clip(adc, 300, 4095)
+        if raw:
+            adc = np.round(adc).astype(int)
+        return dict(zip(self.CHANNELS, adc.tolist()))
+
+
+class SimCTL200(SimInstrument):
+    """Koheron CTL200 laser driver, current in mA."""
+
+    kind = "laser"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._status = 0
+        self._current = 0.0
+
+    @property
+    def laser_status(self):
+        self._io()
+        return self._status
+
+    @laser_status.setter
+    def laser_status(self, value):
+        self._io()
+        self._status = int(value)
+
+    @property
+    def laser_current(self):
+        self._io()
+        return self._current
+
+    @laser_current.setter
+    def laser_current(self, value):
+        self._io()
+        self._current = float(value)
+
+    @property
+    def current(self):
+        """Current actually flowing through the diode in mA."""
+        return self._current if self._status else 0.0
+
+
+class _Value:
+    def __init__(self, getter):
+        self._getter = getter
+
+    @property
+    def value(self):
+        return self._getter()
+
+
+class _Parameters:
+    def __init__(self, client):
+        self.to_plot = _Value(client._to_plot)
+
+
+class SimLinienClient(SimInstrument):
+    """Linien sweeping over a spectroscopy line that drifts slowly."""
+
+    kind = "linien"
+
+    def __init__(self, points=2048, width=0.05, drift=1e-3, **kwargs):
+        super().__init__(**kwargs)
+        self.points = points
+        self.width = width
+        self.drift = drift
+        self._start = time.monotonic()
+        self.parameters = _Parameters(self)
+
+    def _to_plot(self):
+        self._io()
+        x = np.linspace(-1, 1, self.points)
+        center = self.drift * (time.monotonic() - self._start)
+        detuning = (x - center) / self.width
+        absorption = 1 / (1 + detuning**2)
+        # dispersive error signal from modulation spectroscopy
+        error = -2 * detuning / (1 + detuning**2) ** 2
+        n = self.rng.standard_normal((2, self.points))
+        to_plot = {
+            "error_signal_1": (4000 * (error + self.noise * n[0])).astype(int),
+            "monitor_signal": (
+                4000 * (1 - 0.5 * absorption + self.noise * n[1])
+            ).astype(int),
+        }
+        return pickle.dumps(to_plot)
+
+    def disconnect(self):
+        pass
+
+
+def amplifier_power(voltage, max_power=0.05, v_half=5.0, width=0.8):
+    """Optical power after an AOM driven through a voltage controlled amplifier."""
+    rf_fraction = 1 / (1 + np.exp(-(voltage - v_half) / width))
+    return max_power * np.sin(0.5 * np.pi * np.sqrt(rf_fraction)) ** 2
+
+
+def aom_bandwidth(frequency, center=80.0, width=30.0):
+    """Relative diffraction efficiency of an AOM at an RF frequency in MHz."""
+    return np.exp(-2 * ((frequency - center) / width) ** 2)
+
+
+def aom_efficiency(rf_power, saturation_power=1.0):
+    """Diffraction efficiency of an AOM for an RF power in W."""
+    return (
+        np.sin(0.5 * np.pi * np.sqrt(np.minimum(rf_power / saturation_power, 1.0))) ** 2
+    )
+
+
+def cell_transmission(frequency, temperature, lines=(133.0, 212.0), width=6.0):
+    """Transmission of a vapour cell for a laser shifted by `frequency` in MHz.
+
+    The optical density roughly doubles every 8 K due to the vapour pressure.
+    """
+    optical_density = 0.5 * 2 ** ((temperature - 20.0) / 8.0)
+    profile = sum(1 / (1 + ((frequency - line) / (width / 2)) ** 2) for line in lines)
+    return np.exp(-optical_density * profile)
+
+
+def laser_power(current, threshold=30.0, slope_efficiency=0.8):
+    """Output power in W of a laser diode for a current in mA."""
+    spontaneous = 1e-6 * current
+    return spontaneous + slope_efficiency * 1e-3 * max(current - threshold, 0.0)
+
+
+def _module(procedure):
+    return sys.modules[type(procedure).__module__]
+
+
+def aom_amplifier_calibration(procedure, **options):
+    module = _module(procedure)
+    hmp = SimHMP4040(**options)
+    pm = SimPowerMeter(
+        lambda: amplifier_power(hmp.voltages[procedure.hmp_channel]), **options
+    )
+    return {module.HMP_ADDRESS: hmp, module.PM_ADDRESS: pm}
+
+
+def aom_frequency_map(procedure, **options):
+    module = _module(procedure)
+    hmp = SimHMP4040(**options)
+    qrf = SimQRF(**options)
+    pm = SimPowerMeter(
+        lambda: amplifier_power(hmp.voltages[procedure.hmp_channel])
+        * aom_bandwidth(qrf.channels[procedure.qrf_channel].frequency),
+        **options,
+    )
+    return {module.HMP_ADDRESS: hmp, module.QRF_ADDRESS: qrf, module.PM_ADDRESS: pm}
+
+
+def filter_cells(procedure, **options):
+    module = _module(procedure)
+    qrf = SimQRF(**options)
+    tec = SimTEC(**options)
+    pm = SimPowerMeter(
+        lambda: 1e-3
+        * cell_transmission(
+            qrf.channels[procedure.qrf_channel].frequency, tec._temperature()
+        ),
+        **options,
+    )
+    return {module.QRF_ADDRESS: qrf, module.TEC_PORT: tec, module.PM_ADDRESS: pm}
+
+
+def cnt91_ts(procedure, **options):
+    return {_module(procedure).COUNTER_ADDRESS: SimCNT91(**options)}
+
+
+def linien_spectrum(procedure, **options):
+    return {_module(procedure).REDPITAYA_HOST: SimLinienClient(**options)}
+
+
+def mot_telescope(procedure, **options):
+    module = _module(procedure)
+    qrf = SimQRF(**options)
+    instruments = {module.QRF_ADDRESS: qrf}
+
+    def rf_power():
+        return qrf.rf_power(procedure.qrf_channel)
+
+    if hasattr(module, "ADBOX_ADDRESS"):
+        instruments[module.ADBOX_ADDRESS] = SimTelescopeADBox(
+            lambda: 10 * np.log10(1e3 * rf_power()), **options
+        )
+    if hasattr(module, "PM_ADDRESS"):
+        instruments[module.PM_ADDRESS] = SimPowerMeter(
+            lambda: 0.02 * aom_efficiency(rf_power()), **options
+        )
+    return instruments
+
+
+def optical_spectrum(procedure, **options):
+    return {_module(procedure).OSA_ADDRESS: SimAQ6370D(**options)}
+
+
+def pi_curve(procedure, **options):
+    laser = SimCTL200(**options)
+    pm = SimPowerMeter(lambda: laser_power(laser.current), **options)
+    return {procedure.laser_port: laser, procedure.pm_address: pm}
+
+
+def oscilloscope_readout(procedure, **options):
+    return {_module(procedure).SCOPE_ADDRESS: SimLeCroy(**options)}
+
+
+SCENARIOS = {
+    "aom_amplifier_calibration.AOMAmplifierProcedure": aom_amplifier_calibration,
+    "aom_frequency_map.AOMFrequencyMapProcedure": aom_frequency_map,
+    "filter_cells.FilterCellProcedure": filter_cells,
+    "cnt91_ts.CounterTimeseriesProcedure": cnt91_ts,
+    "linien_spectrum.LinienSpectrumProcedure": linien_spectrum,
+    "mot_telescope_calibration.ReadoutPowerLevelProcedure": mot_telescope,
+    "qrf_vs_pm.ReadoutPowerLevelProcedure": mot_telescope,
+    "combined_calibration.CombinedReadoutProcedure": mot_telescope,
+    "optical_spectrum.ReadoutPowerLevelProcedure": optical_spectrum,
+    "pi_curve.PICharacteristicsProcedure": pi_curve,
+    "oscilloscope_readout.ScopeReadoutProcedure": oscilloscope_readout,
+}
+
+_install_lock = threading.Lock()
+
+
+def simulate(procedure, **options):
+    """Create the simulated instruments of a procedure, keyed by address."""
+    cls = type(procedure)
+    name = f"{cls.__module__}.{cls.__name__}"
+    if name not in SCENARIOS:
+        raise ValueError(f"There is no simulation for {name}")
+    return SCENARIOS[name](procedure, **options)
+
+
+def install(procedure, **options):
+    """Let `procedure` use simulated instruments.
+
+    The instruments are created when the procedure starts, so they see the final
+    parameter values, and are removed from the instrument pool when it shuts down.
+    `options` are passed to every simulated instrument, e.g. `latency`, `noise` or
+    `seed`.
+    """
+    simulate(procedure, **options)  # fail early if there is no simulation
+    startup = procedure.startup
+    shutdown = procedure.shutdown
+    addresses = []
+
+    def simulated_startup():
+        with _install_lock:
+            for address, instrument in simulate(procedure, **options).items():
+                log.info(f"Simulating {address} with {type(instrument).__name__}")
+                instrument_pool.override(
+                    address, lambda address, instrument=instrument: instrument
+                )
+                addresses.append(address)
+        startup()
+
+    def simulated_shutdown():
+        try:
+            shutdown()
+        finally:
+            # later procedures in the same process use the real instruments again
+            with _install_lock:
+                for address in addresses:
+                    instrument_pool.clear_override(address)
+                addresses.clear()
+
+    procedure.startup = simulated_startup
+    procedure.shutdown = simulated_shutdown
+    return procedure
@@ -0,0 +1,221 @@
+"""Timing of the phases of each step of a sweep.
+
+A sweep marks the end of each phase of a step with `lap`:
+
+    self.timer.start_step()
+    self.hmp.voltage = v
+    self.timer.lap("write")
+    sleep(self.step_time)
+    self.timer.lap("settle")
+    ...
+
+Profiling is opt-in, with the environment variable `LAB_PROCEDURES_PROFILE=1` or
+the `--profile` option of the runner, and otherwise `lap` returns immediately.
+When profiled, the timer keeps a histogram per phase, `summary()` tabulates them
+and `finish()` writes the summary next to the results file and stores the
+measured cost of a step without the settling time. The `get_estimates` of the
+procedures use that cost via `estimate_duration`.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+import results_files
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+PROFILE_VARIABLE = "LAB_PROCEDURES_PROFILE"
+COSTS_FILE = Path(
+    os.environ.get(
+        "LAB_PROCEDURES_COSTS", Path.home() / ".lab-procedures" / "step_costs.json"
+    )
+)
+SETTLE = "settle"
+
+
+def profiling_enabled():
+    return os.environ.get(PROFILE_VARIABLE, "") not in ("", "0")
+
+
+def enable_profiling():
+    os.environ[PROFILE_VARIABLE] = "1"
+
+
+class RunningHistogram:
+    """Histogram with logarithmic bins from 1 µs to 1000 s, 10 per decade."""
+
+    BINS_PER_DECADE = 10
+    MIN_EXPONENT = -6
+    MAX_EXPONENT = 3
+
+    def __init__(self):
+        n_bins = (self.MAX_EXPONENT - self.MIN_EXPONENT) * self.BINS_PER_DECADE
+        self.counts = [0] * (n_bins + 2)  # with under- and overflow
+        self.n = 0
+        self.total = 0.0
+        self.total_squared = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bin(self, value):
+        if value <= 0:
+            return 0
+        index = math.floor(
+            (math.log10(value) - self.MIN_EXPONENT) * self.BINS_PER_DECADE
+        )
+        return min(max(index + 1, 0), len(self.counts) - 1)
+
+    def _upper_edge(self, index):
+        return 10 ** (self.MIN_EXPONENT + index / self.BINS_PER_DECADE)
+
+    def add(self, value):
+        self.counts[self._bin(value)] += 1
+        self.n += 1
+        self.total += value
+        self.total_squared += value**2
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else math.nan
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return math.nan
+        variance = (self.total_squared - self.total**2 / self.n) / (self.n - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def quantile(self, q):
+        """Upper edge of the bin containing the quantile `q`."""
+        if not self.n:
+            return math.nan
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= q * self.n:
+                return min(self._upper_edge(index), self.max)
+        return self.max
+
+
+class StepTimer:
+    def __init__(self, procedure, enabled=None):
+        cls = type(procedure)
+        self.procedure = procedure
+        self.name = f"{cls.__module__}.{cls.__name__}"
+        self.enabled = profiling_enabled() if enabled is None else enabled
+        self.phases = {}
+        self.steps = RunningHistogram()
+        self._step_start = None
+        self._last = None
+
+    def start_step(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._end_step()
+        self._step_start = self._last = now
+
+    def lap(self, phase):
+        """Account the time since the last lap or the start of the step to `phase`."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if phase not in self.phases:
+            self.phases[phase] = RunningHistogram()
+        self.phases[phase].add(now - self._last)
+        self._last = now
+
+    def _end_step(self):
+        if self._step_start is not None:
+            self.steps.add(self._last - self._step_start)
+            self._step_start = None
+
+    @property
+    def overhead(self):
+        """Mean duration of a step without the settling time."""
+        settle = self.phases.get(SETTLE)
+        settle_time = settle.total / self.steps.n if settle else 0.0
+        return self.steps.mean - settle_time
+
+    def summary(self):
+        header = f"{'phase':<10}{'n':>7}" + "".join(
+            f"{column:>10}"
+            for column in ["mean/ms", "std/ms", "min/ms", "p50/ms", "p95/ms", "max/ms"]
+        )
+        lines = [f"Step timing of {self.name}", header + f"{'share':>8}"]
+        step_total = self.steps.total
+        for phase, histogram in [*self.phases.items(), ("step", self.steps)]:
+            values = [
+                histogram.mean,
+                histogram.std,
+                histogram.min,
+                histogram.quantile(0.5),
+                histogram.quantile(0.95),
+                histogram.max,
+            ]
+            share = histogram.total / step_total if step_total else math.nan
+            lines.append(
+                f"{phase:<10}{histogram.n:>7}"
+                + "".join(f"{1e3 * value:>10.3f}" for value in values)
+                + f"{share:>8.1%}"
+            )
+        lines.append(
+            f"Overhead per step without settling: {1e3 * self.overhead:.3f} ms"
+        )
+        return "\n".join(lines)
+
+    def write_summary(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.summary() + "\n")
+        log.info(f"Wrote the step timing to {filename}")
+
+    def finish(self):
+        """End the last step, log the summary and store the cost of a step.
+
+        The summary is also written next to the results file, with the suffix
+        `.timing.txt`.
+        """
+        if not self.enabled:
+            return
+        self._end_step()
+        if not self.steps.n:
+            return
+        log.info(self.summary())
+        filename = results_files.companion(self.procedure, ".timing.txt")
+        if filename is not None:
+            self.write_summary(filename)
+        save_overhead(self.name, self.overhead, self.steps.n)
+
+
+def load_costs():
+    try:
+        with open(COSTS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_overhead(name, overhead, n_steps):
+    costs = load_costs()
+    costs[name] = {"overhead": overhead, "steps": n_steps, "updated": time.time()}
+    try:
+        COSTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(COSTS_FILE, "w") as f:
+            json.dump(costs, f, indent=2)
+    except OSError:
+        log.exception(f"Could not store the step costs in {COSTS_FILE}")
+
+
+def estimate_duration(procedure, n_steps, settle_time, default_overhead=0.0):
+    """Duration of `n_steps` steps, using the measured overhead per step if known."""
+    cls = type(procedure)
+    cost = load_costs().get(f"{cls.__module__}.{cls.__name__}")
+    overhead = cost["overhead"] if cost else default_overhead
+    return n_steps * (settle_time + overhead)
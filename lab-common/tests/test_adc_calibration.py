@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import procedure_runner
+import sim_instruments
+from qrf_power_levels import get_power_values
+
+procedure_runner.add_repository_to_path()
+
+import adc_calibration  # noqa: E402
+
+
+def write_run(filename, rf_powers, adbox):
+    """Results file of a sweep over `rf_powers` read with a simulated ADBox."""
+    rf = iter(rf_powers)
+    adbox.model = lambda: current
+    with open(filename, "w") as f:
+        f.write("#Procedure: <combined_calibration.CombinedReadoutProcedure>\n")
+        f.write(",".join(["rf power", *adc_calibration.CHANNELS]) + "\n")
+        for current in rf:
+            values = adbox.get_data().values()
+            f.write(",".join(str(value) for value in [current, *values]) + "\n")
+
+
+def simulated_run(tmp_path, rf_powers, **options):
+    adbox = sim_instruments.SimTelescopeADBox(None, latency=0, seed=1, **options)
+    write_run(tmp_path / "run.csv", rf_powers, adbox)
+    return adbox
+
+
+def test_linear_run_is_linear_everywhere(tmp_path):
+    rf_powers = get_power_values(0, 33)
+    # points measured twice give no step in rf power
+    rf_powers = np.sort(np.concatenate([rf_powers, rf_powers[::70]]))
+    adbox = simulated_run(tmp_path, rf_powers, intercept=1000.0)
+    calibration = adc_calibration.ADCCalibration.from_runs(tmp_path)
+
+    np.testing.assert_allclose(calibration.slope, 50, rtol=0.01)
+    np.testing.assert_allclose(calibration.rf_min, rf_powers[0])
+    np.testing.assert_allclose(calibration.rf_max, rf_powers[-1])
+    # a reading at the low end of the range, the coupling is in the intercept
+    reading = adbox.intercept + adbox.slope * (0.37 + adbox.coupling)
+    np.testing.assert_allclose(calibration.rf_power(reading), 0.37, atol=0.05)
+
+
+def test_floor_and_saturation_are_excluded(tmp_path):
+    rf_powers = get_power_values(-40, 33)
+    adbox = simulated_run(tmp_path, rf_powers, slope=80.0, intercept=2000.0)
+    calibration = adc_calibration.ADCCalibration.from_runs(tmp_path)
+
+    floor = (300 - adbox.intercept) / adbox.slope - adbox.coupling
+    saturation = (4095 - adbox.intercept) / adbox.slope - adbox.coupling
+    np.testing.assert_allclose(calibration.slope, 80, rtol=0.01)
+    np.testing.assert_allclose(calibration.rf_max[0], saturation, atol=0.1)
+    # the steps are several dB below 0 dBm, one point next to the floor is lost
+    for rf_min, channel_floor in zip(calibration.rf_min[0], floor):
+        assert rf_min in rf_powers[rf_powers > channel_floor][:2]
+
+
+def test_directory_without_runs(tmp_path):
+    with pytest.raises(ValueError, match="no results files"):
+        adc_calibration.load_runs(tmp_path)
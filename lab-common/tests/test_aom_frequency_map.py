@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+import procedure_runner
+import sim_instruments
+
+procedure_runner.add_repository_to_path()
+
+import aom_frequency_map  # noqa: E402
+
+
+def test_coarse_nodes_include_the_last_point():
+    np.testing.assert_equal(aom_frequency_map.coarse_nodes(10, 4), [0, 4, 8, 9])
+    np.testing.assert_equal(aom_frequency_map.coarse_nodes(9, 4), [0, 4, 8])
+    np.testing.assert_equal(aom_frequency_map.coarse_nodes(3, 1), [0, 1, 2])
+
+
+def test_serpentine_reverses_every_row_with_points():
+    mask = np.array(
+        [
+            [True, True, False],
+            [False, False, False],
+            [True, False, True],
+            [False, True, True],
+        ]
+    )
+    order = list(aom_frequency_map.serpentine(mask))
+    assert order == [(0, 0), (0, 1), (2, 2), (2, 0), (3, 1), (3, 2)]
+
+
+def test_cells_below_the_threshold_are_masked():
+    power = np.full((5, 5), np.nan)
+    rows = columns = np.array([0, 2, 4])
+    coarse = np.array([[0.0, 0.0, 1.0], [0.0, 0.0, 0.0], [np.nan, 0.0, 0.0]])
+    power[np.ix_(rows, columns)] = coarse
+    mask = aom_frequency_map.below_threshold(power, rows, columns, 0.5)
+    expected = np.zeros((5, 5), dtype=bool)
+    # all cells but the one with the corner above and the one not measured
+    expected[0:3, 0:3] = True
+    expected[2:5, 2:5] = True
+    np.testing.assert_equal(mask, expected)
+
+
+def test_fine_pass_skips_dark_cells(tmp_path):
+    procedure = aom_frequency_map.AOMFrequencyMapProcedure()
+    procedure.set_parameters(
+        {
+            "start_frequency": 20.0,
+            "stop_frequency": 140.0,
+            "frequency_step": 5.0,
+            "start_voltage": 0.0,
+            "stop_voltage": 10.0,
+            "voltage_step": 0.5,
+            "step_time": 0.001,
+            "frequency_step_time": 0.001,
+            "coarse_factor": 4,
+            "power_threshold": 1e-3,
+        }
+    )
+    sim_instruments.install(procedure, latency=0)
+    assert procedure_runner.run(procedure, str(tmp_path / "map.csv"))
+    data = pd.read_csv(tmp_path / "map.csv", comment="#")
+
+    frequencies = procedure.get_frequencies()
+    voltages = procedure.get_voltages()
+    i = np.searchsorted(frequencies, data["Frequency"] - 1e-9)
+    j = np.searchsorted(voltages, data["Voltage"] - 1e-9)
+    measured = np.zeros((len(frequencies), len(voltages)), dtype=int)
+    np.add.at(measured, (i, j), 1)
+    assert measured.max() == 1
+
+    rows = aom_frequency_map.coarse_nodes(len(frequencies), 4)
+    columns = aom_frequency_map.coarse_nodes(len(voltages), 4)
+    coarse = data["Pass"] == aom_frequency_map.COARSE
+    power = np.full(measured.shape, np.nan)
+    power[i[coarse], j[coarse]] = data.loc[coarse, "Power"]
+    assert np.isfinite(power[np.ix_(rows, columns)]).all()
+    # the coarse pass comes first and runs along the voltage in both directions
+    assert not coarse[coarse.sum() :].any()
+    assert np.diff(j[:2]) > 0 and np.diff(j[len(columns) : len(columns) + 2]) < 0
+
+    skipped = aom_frequency_map.below_threshold(power, rows, columns, 1e-3)
+    assert 0 < skipped.sum() < skipped.size
+    np.testing.assert_equal(measured == 0, skipped & ~np.isfinite(power))
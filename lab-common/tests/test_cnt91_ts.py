@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+import procedure_runner
+
+procedure_runner.add_repository_to_path()
+
+import cnt91_ts  # noqa: E402
+
+
+def naive_adev(freqs, tau0, m):
+    phase = np.concatenate([[0], np.cumsum(freqs) * tau0])
+    n = len(phase) - 2 * m
+    total = sum((phase[i + 2 * m] - 2 * phase[i + m] + phase[i]) ** 2 for i in range(n))
+    return np.sqrt(total / (2 * (m * tau0) ** 2 * n))
+
+
+def test_single_block_matches_the_overlapping_adev():
+    freqs = 10e6 + np.random.default_rng(0).standard_normal(1000)
+    taus = cnt91_ts.octave_taus(len(freqs))
+    adev = cnt91_ts.blockwise_adev([freqs], 1e-3, taus, offset=10e6)
+    expected = [naive_adev(freqs - 10e6, 1e-3, m) for m in taus]
+    np.testing.assert_allclose(adev, expected)
+
+
+def test_frequency_steps_between_blocks_are_ignored():
+    rng = np.random.default_rng(0)
+    # the frequency changed during the dead time between the blocks
+    blocks = [10e6 + 100 * k + rng.standard_normal(1000) for k in range(4)]
+    taus = cnt91_ts.octave_taus(1000)
+    adev = cnt91_ts.blockwise_adev(blocks, 1e-3, taus, offset=10e6)
+    white = [naive_adev(rng.standard_normal(4000), 1e-3, m) for m in taus]
+    np.testing.assert_allclose(adev, white, rtol=0.5)
+
+
+def test_long_taus_without_averaging_match_the_overlapping_adev():
+    freqs = 10e6 + np.random.default_rng(0).standard_normal(1000)
+    taus = cnt91_ts.octave_taus(len(freqs))
+    adev = cnt91_ts.long_adev(freqs, 1e-3, taus, offset=10e6, factor=1)
+    expected = [naive_adev(freqs - 10e6, 1e-3, m) for m in taus]
+    np.testing.assert_allclose(adev, expected)
+
+
+def test_long_taus_from_means_are_exact_at_their_start_points():
+    freqs = 10e6 + np.random.default_rng(0).standard_normal(1024)
+    taus = np.array([8, 32, 128])
+    adev = cnt91_ts.long_adev(freqs, 1e-3, taus, offset=10e6, factor=8)
+    # the second differences starting at every 8th sample
+    phase = np.concatenate([[0], np.cumsum(freqs - 10e6) * 1e-3])[::8]
+    for m, ad in zip(taus, adev):
+        k = m // 8
+        difference = phase[2 * k :] - 2 * phase[k:-k] + phase[: -2 * k]
+        expected = np.sqrt(np.mean(difference**2) / (2 * (m * 1e-3) ** 2))
+        np.testing.assert_allclose(ad, expected)
+
+
+def test_taus_extend_beyond_a_block(tmp_path):
+    procedure = procedure_runner.load_procedure_class("cnt91-ts")()
+    n_samples = 4 * cnt91_ts.MAX_BUFFER_SIZE
+    procedure.set_parameters(
+        {"n_samples": n_samples, "gate_time": 1e-5, "raw_directory": str(tmp_path)}
+    )
+    procedure_runner.simulate(procedure, latency=0)
+    assert procedure_runner.run(procedure, str(tmp_path / "results.csv"))
+    data = pd.read_csv(tmp_path / "results.csv", comment="#")
+    taus = data["Tau"].dropna().to_numpy()
+    np.testing.assert_allclose(taus, cnt91_ts.octave_taus(n_samples) * 1e-5)
+    assert taus[-1] > cnt91_ts.MAX_BUFFER_SIZE * 1e-5
+    assert np.all(np.isfinite(data["Allan Deviation"].dropna()))
@@ -0,0 +1,75 @@
+import time
+
+from pymeasure.experiment import Procedure, Results
+from pymeasure.experiment.parameters import FloatParameter, Parameter
+
+import experiment_scheduler
+
+# start and end of every run by name
+RUNS = {}
+
+
+class Sleeping(Procedure):
+    """Sleeps for `duration` s, without declaring its resources."""
+
+    name = Parameter("Name", default="")
+    resources = Parameter("Resources", default="")
+    duration = FloatParameter("Duration", units="s", default=0.2)
+
+    DATA_COLUMNS = ["Time"]
+
+    def execute(self):
+        start = time.monotonic()
+        time.sleep(self.duration)
+        RUNS[self.name] = (start, time.monotonic())
+        self.emit("results", {"Time": time.monotonic() - start})
+
+
+class Holding(Sleeping):
+    """Holds its comma-separated resources while it sleeps."""
+
+    def get_resources(self):
+        return [r for r in self.resources.split(",") if r]
+
+
+def run(tmp_path, procedures):
+    RUNS.clear()
+    scheduler = experiment_scheduler.ResourceScheduler(poll_interval=0.01)
+    for procedure_class, name, resources in procedures:
+        procedure = procedure_class()
+        procedure.set_parameters({"name": name, "resources": resources})
+        scheduler.queue(Results(procedure, str(tmp_path / f"{name}.csv")))
+    return scheduler.run()
+
+
+def overlap(a, b):
+    return RUNS[a][0] < RUNS[b][1] and RUNS[b][0] < RUNS[a][1]
+
+
+def test_different_instruments_run_concurrently(tmp_path):
+    report = run(tmp_path, [(Holding, "a", "pm1"), (Holding, "b", "pm2,qrf")])
+    assert report["finished"] == 2
+    assert overlap("a", "b")
+    assert report["concurrency"] > 1.5
+
+
+def test_shared_instruments_run_in_queue_order(tmp_path):
+    report = run(
+        tmp_path,
+        [(Holding, "a", "pm1,qrf"), (Holding, "b", "pm2,qrf"), (Holding, "c", "pm2")],
+    )
+    assert report["finished"] == 3
+    assert RUNS["a"][1] <= RUNS["b"][0]
+    # c is free at the start, but waits for b that was queued before it
+    assert RUNS["b"][1] <= RUNS["c"][0]
+
+
+def test_unknown_resources_run_alone(tmp_path):
+    run(tmp_path, [(Holding, "a", "pm1"), (Sleeping, "b", ""), (Holding, "c", "pm2")])
+    assert not overlap("a", "b") and not overlap("b", "c")
+
+
+def test_conflicts():
+    assert experiment_scheduler.conflicts(frozenset("ab"), frozenset("bc"))
+    assert not experiment_scheduler.conflicts(frozenset("ab"), frozenset("cd"))
+    assert experiment_scheduler.conflicts(None, frozenset())
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+import instrument_pool
+
+
+class Channel:
+    def __init__(self, device):
+        self.device = device
+        self._power = 0.0
+
+    @property
+    def power(self):
+        return self._power
+
+    @power.setter
+    def power(self, value):
+        if self.device.broken:
+            raise OSError("Connection lost")
+        # the pool lock is held, another thread can not take it
+        self.device.lock_held.append(not _try_lock(self.device.address))
+        self._power = value
+
+
+class Device:
+    instances = []
+
+    def __init__(self, address):
+        self.address = address
+        self.broken = False
+        self.lock_held = []
+        self.channels = {1: Channel(self), 2: Channel(self)}
+        Device.instances.append(self)
+
+    def close(self):
+        pass
+
+
+def _try_lock(address):
+    result = []
+
+    def acquire():
+        lock = instrument_pool._entries[address].lock
+        result.append(lock.acquire(blocking=False))
+        if result[0]:
+            lock.release()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@pytest.fixture
+def device():
+    Device.instances.clear()
+    yield instrument_pool.get("sim::1", Device)
+    instrument_pool.release("sim::1")
+
+
+def test_nested_objects_hold_the_lock(device):
+    device.channels[2].power = 1.5
+    assert isinstance(device.channels, instrument_pool.PooledInstrument)
+    assert device.channels[2].power == 1.5
+    assert Device.instances[0].lock_held == [True]
+    assert sorted(device.channels) == [1, 2]
+
+
+def test_nested_objects_reconnect(device):
+    channel = device.channels[1]
+    Device.instances[0].broken = True
+    with pytest.raises(OSError):
+        channel.power = 1.0
+    # the next access goes to a new connection
+    channel.power = 2.0
+    assert len(Device.instances) == 2
+    assert Device.instances[1].channels[1].power == 2.0
+
+
+def test_health_check_reconnects():
+    def check(device):
+        if device.broken:
+            raise OSError("No answer")
+
+    Device.instances.clear()
+    instrument_pool.get("sim::2", Device, check=check)
+    Device.instances[0].broken = True
+    instrument_pool.get("sim::2", Device, check=check)
+    assert len(Device.instances) == 2
+    instrument_pool.release("sim::2")
@@ -0,0 +1,31 @@
+import numpy as np
+
+import procedure_runner
+
+procedure_runner.add_repository_to_path()
+
+import linien_analysis  # noqa: E402
+
+
+def test_slope_is_fitted_at_the_crossing():
+    n, width = 2048, 0.05
+    signal = linien_analysis.synthetic_error_signal(n, width=width, noise=0.0)
+    features = linien_analysis.find_features(signal)
+    k = linien_analysis.lock_point(features)
+    # derivative of the error signal at the center, per sample
+    expected = -2 * 4000 / width * 2 / (n - 1)
+    assert abs(features["slope"][k] / expected - 1) < 0.05
+
+
+def test_features_are_tracked_separately():
+    x = np.arange(2000)
+    reference = np.sin(2 * np.pi * x / 500)
+    tracker = linien_analysis.FeatureTracker()
+    tracker.update(linien_analysis.find_features(reference))
+    # only the second half of the spectrum moves
+    moved = np.where(x < 1000, reference, np.sin(2 * np.pi * (x - 20) / 500))
+    indices, drift = tracker.update(linien_analysis.find_features(moved))
+    reference_positions = tracker.reference
+    assert np.all(indices >= 0)
+    np.testing.assert_allclose(drift[reference_positions < 1000], 0, atol=0.5)
+    np.testing.assert_allclose(drift[reference_positions > 1050], 20, atol=0.5)
@@ -0,0 +1,28 @@
+import warnings
+
+import numpy as np
+
+import procedure_runner
+
+procedure_runner.add_repository_to_path()
+
+import pi_curve  # noqa: E402
+
+
+def test_fit_waits_for_different_currents():
+    fit = pi_curve.IncrementalPIFit(lasing_power=1e-4)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for power in [1e-3, 1.1e-3, 1.2e-3]:
+            assert not fit.update(33.3, power)
+            assert np.isnan(fit.slope) and np.isnan(fit.threshold)
+    fit.update(43.3, 2.2e-3)
+    assert np.isfinite(fit.slope) and np.isfinite(fit.threshold)
+
+
+def test_fit_of_a_straight_line():
+    fit = pi_curve.IncrementalPIFit(lasing_power=1e-4)
+    for current in [50.0, 60.0, 70.0]:
+        fit.update(current, 1e-4 * (current - 40))
+    assert np.isclose(fit.slope_efficiency, 0.1)
+    assert np.isclose(fit.threshold, 40)
@@ -0,0 +1,44 @@
+import procedure_runner
+import sim_instruments
+
+procedure_runner.add_repository_to_path()
+
+import pi_curve_batch  # noqa: E402
+
+
+def job(name, laser_port="", pm_address=""):
+    return {"name": name, "laser_port": laser_port, "pm_address": pm_address}
+
+
+def test_jobs_sharing_an_instrument_are_grouped():
+    jobs = [
+        job("a", "COM1", "USB::1"),
+        job("b", "COM2", "USB::2"),
+        job("c", "COM2", "USB::3"),
+        job("d", "COM4", "USB::4"),
+    ]
+    groups = pi_curve_batch.group_jobs(jobs)
+    assert sorted([j["name"] for j in g] for g in groups) == [["a"], ["b", "c"], ["d"]]
+
+
+def test_empty_addresses_are_the_default_instruments():
+    # both use the default power meter, a third job the default laser
+    jobs = [job("a", "COM1"), job("b", "COM2"), job("c", pm_address="USB::3")]
+    groups = pi_curve_batch.group_jobs(jobs)
+    assert [[j["name"] for j in g] for g in groups] == [["a", "b"], ["c"]]
+    jobs = [job("a", "COM8", "USB::1"), job("b", pm_address="USB::2")]
+    assert len(pi_curve_batch.group_jobs(jobs)) == 1
+
+
+def test_results_files_of_repeated_jobs_are_kept(tmp_path, monkeypatch):
+    make_procedure = pi_curve_batch.make_procedure
+    monkeypatch.setattr(
+        pi_curve_batch,
+        "make_procedure",
+        lambda job: sim_instruments.install(make_procedure(job), latency=0),
+    )
+    jobs = [dict(job("laser"), n_steps="5", delay="0")] * 2
+    summaries = pi_curve_batch.run_group(jobs, tmp_path)
+    assert [s["status"] for s in summaries] == ["Finished", "Finished"]
+    assert summaries[0]["filename"] != summaries[1]["filename"]
+    assert all(s["points"] == 5 for s in summaries)
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import pm_acquisition
+import sim_instruments
+
+
+def power_meter():
+    pm = sim_instruments.SimPowerMeter(lambda: 1e-3, latency=0)
+    pm.adapter = SimpleNamespace(connection=SimpleNamespace(timeout=2000))
+    return pm
+
+
+def test_settings_changed_elsewhere_are_written_again():
+    pm = power_meter()
+    pm_acquisition.PowerMeterAcquisition(pm, averaging=10, wavelength=1064.0)
+    # e.g. from the front panel between two runs
+    pm.averaging = 1
+    pm.wavelength = 780.0
+    acquisition = pm_acquisition.PowerMeterAcquisition(
+        pm, averaging=10, wavelength=1064.0
+    )
+    assert pm.averaging == 10
+    assert pm.wavelength == 1064.0
+    assert acquisition.averaging == 10
+
+
+def test_timeout_covers_long_averaging():
+    pm = power_meter()
+    pm_acquisition.PowerMeterAcquisition(pm, averaging=10_000)
+    assert pm.adapter.connection.timeout > 1e3 * pm_acquisition.burst_duration(
+        1, 10_000
+    )
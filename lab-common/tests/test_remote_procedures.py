@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+
+import pytest
+from pymeasure.experiment import (
+    FloatParameter,
+    IntegerParameter,
+    Metadata,
+    Procedure,
+    Results,
+    Worker,
+)
+
+import remote_procedures
+
+
+class CountingProcedure(Procedure):
+    n_rows = IntegerParameter("Number of rows", default=100)
+    delay = FloatParameter("Delay between rows", units="s", default=0.0)
+    label = Metadata("Label", default="")
+
+    DATA_COLUMNS = ["Index", "Value"]
+
+    def startup(self):
+        # evaluated on the server, the client has to receive it
+        self.label = f"counted to {self.n_rows}"
+
+    def execute(self):
+        for i in range(self.n_rows):
+            self.emit("results", {"Index": i, "Value": i**2})
+            if self.should_stop():
+                return
+            time.sleep(self.delay)
+
+
+SPEC = f"{__name__}:CountingProcedure"
+
+
+@pytest.fixture
+def address(tmp_path):
+    server = remote_procedures.ProcedureServer(
+        "127.0.0.1", 0, tmp_path / "server", procedures=[SPEC]
+    )
+    server.start()
+    yield server.address
+    server.shutdown()
+    remote_procedures.RemoteClient.get(server.address).close()
+
+
+def run(address, filename, action=None, after=0.3, **parameters):
+    procedure = CountingProcedure()
+    procedure.set_parameters(parameters)
+    remote_procedures.install(procedure, address)
+    worker = Worker(Results(procedure, str(filename)))
+    worker.start()
+    if action is not None:
+        threading.Thread.join(worker, after)
+        action(worker)
+    threading.Thread.join(worker, 30)
+    assert not worker.is_alive()
+    return procedure, Results.load(str(filename)).data
+
+
+def test_rows_and_metadata(address, tmp_path):
+    procedure, data = run(address, tmp_path / "client.csv", n_rows=700)
+    assert procedure.status == Procedure.FINISHED
+    assert list(data["Index"]) == list(range(700))
+    assert list(data["Value"]) == [i**2 for i in range(700)]
+    assert procedure.label == "counted to 700"
+    results = Results.load(str(tmp_path / "client.csv"))
+    assert results.procedure.label == "counted to 700"
+
+
+def test_stop(address, tmp_path):
+    procedure, data = run(
+        address,
+        tmp_path / "client.csv",
+        action=lambda worker: worker.stop(),
+        n_rows=10_000,
+        delay=0.001,
+    )
+    assert procedure.status == Procedure.ABORTED
+    assert 0 < len(data) < 10_000
+
+
+def test_reconnect(address, tmp_path):
+    def drop_connection(worker):
+        remote_procedures.RemoteClient.get(address).sock.shutdown(socket.SHUT_RDWR)
+
+    procedure, data = run(
+        address,
+        tmp_path / "client.csv",
+        action=drop_connection,
+        n_rows=500,
+        delay=0.002,
+    )
+    assert procedure.status == Procedure.FINISHED
+    assert list(data["Index"]) == list(range(500))
+
+
+def test_unregistered_procedure_is_refused(tmp_path):
+    server = remote_procedures.ProcedureServer("127.0.0.1", 0, tmp_path, procedures=[])
+    server.start()
+    try:
+        procedure, data = run(server.address, tmp_path / "client.csv")
+        assert procedure.status == Procedure.FAILED
+        assert len(data) == 0
+    finally:
+        server.shutdown()
+        remote_procedures.RemoteClient.get(server.address).close()
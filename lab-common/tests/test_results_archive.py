@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+from pymeasure.experiment import Procedure, Results
+from pymeasure.experiment.parameters import FloatParameter, Parameter
+
+import results_archive
+
+pytest.importorskip("pyarrow")
+
+
+class FilterCell(Procedure):
+    temperature = FloatParameter("Temperature", units="C", default=60.0)
+    channel = Parameter("Channel", default="A")
+
+    DATA_COLUMNS = ["Frequency", "Power"]
+
+
+class Counter(Procedure):
+    gate_time = FloatParameter("Gate time", units="s", default=1e-3)
+
+    DATA_COLUMNS = ["Time", "Frequency"]
+
+
+def write_results(filename, procedure_class, n_rows=3, **parameters):
+    procedure = procedure_class()
+    procedure.set_parameters(parameters)
+    results = Results(procedure, str(filename))
+    with open(filename, "a") as f:
+        for i in range(n_rows):
+            row = {column: i + 0.5 for column in procedure.DATA_COLUMNS}
+            f.write(results.format(row) + "\n")
+    return filename
+
+
+@pytest.mark.parametrize("format", list(results_archive.FORMATS))
+def test_convert_keeps_the_data_and_the_parameters(tmp_path, format):
+    filename = write_results(tmp_path / "cell.csv", FilterCell, temperature=55.0)
+    # the output directory is created
+    output = results_archive.convert(filename, tmp_path / "new" / "dir", format)
+    assert output == tmp_path / "new" / "dir" / f"cell{results_archive.FORMATS[format]}"
+
+    table, parameters = results_archive.load(output)
+    assert parameters == {"Channel": "A", "Temperature": "55 C"}
+    assert table.schema.metadata[results_archive.PROCEDURE_KEY].endswith(b"FilterCell")
+    expected = pd.read_csv(filename, comment="#")
+    pd.testing.assert_frame_equal(table.to_pandas(), expected)
+
+
+def test_convert_next_to_the_results_file(tmp_path):
+    filename = write_results(tmp_path / "cell.csv", FilterCell)
+    assert results_archive.convert(filename) == tmp_path / "cell.parquet"
+
+
+def test_files_without_header_are_rejected(tmp_path):
+    filename = tmp_path / "plain.csv"
+    filename.write_text("a,b\n1,2\n")
+    with pytest.raises(ValueError, match="not a pymeasure results file"):
+        results_archive.read_table(filename)
+
+
+def test_compact_merges_the_runs_of_each_procedure(tmp_path):
+    data = tmp_path / "data"
+    (data / "day2").mkdir(parents=True)
+    write_results(data / "cell50.csv", FilterCell, temperature=50.0)
+    write_results(data / "day2" / "cell60.csv", FilterCell, n_rows=2)
+    write_results(data / "counter.csv", Counter, n_rows=4)
+    (data / "plain.csv").write_text("a,b\n1,2\n")
+
+    outputs = results_archive.compact([data], tmp_path / "dataset")
+    assert sorted(f.parent.name for f in outputs) == [
+        f"procedure={Counter.__module__}.Counter",
+        f"procedure={FilterCell.__module__}.FilterCell",
+    ]
+
+    cells = pd.read_parquet(next(f for f in outputs if "FilterCell" in str(f)))
+    assert len(cells) == 5
+    assert cells.groupby("run")["Temperature"].first().to_dict() == {
+        "cell50": 50.0,
+        "cell60": 60.0,
+    }
+    # text parameters are only in the metadata of single runs
+    assert "Channel" not in cells.columns
+    counter = pd.read_parquet(next(f for f in outputs if "Counter" in str(f)))
+    assert list(counter.columns) == ["Time", "Frequency", "run", "Gate time"]
+    assert (counter["Gate time"] == 1e-3).all()
@@ -0,0 +1,134 @@
+import os
+
+import pytest
+from pymeasure.experiment import Procedure, Results
+from pymeasure.experiment.parameters import FloatParameter, Parameter
+
+import results_index
+
+
+class FilterCell(Procedure):
+    temperature = FloatParameter("Temperature", units="C", default=60.0)
+    start = FloatParameter("Start frequency", units="MHz", default=100.0)
+    channel = Parameter("Channel", default="A")
+
+    DATA_COLUMNS = ["Frequency", "Power"]
+
+
+class Counter(Procedure):
+    gate_time = FloatParameter("Gate time", units="s", default=1e-3)
+
+    DATA_COLUMNS = ["Time", "Frequency"]
+
+
+def write_results(filename, procedure_class, n_rows=3, **parameters):
+    procedure = procedure_class()
+    procedure.set_parameters(parameters)
+    results = Results(procedure, str(filename))
+    with open(filename, "a") as f:
+        for i in range(n_rows):
+            f.write(results.format(dict.fromkeys(procedure.DATA_COLUMNS, i)) + "\n")
+    return filename
+
+
+@pytest.fixture
+def data(tmp_path):
+    directory = tmp_path / "data"
+    (directory / "day2").mkdir(parents=True)
+    write_results(directory / "cell50.csv", FilterCell, temperature=50.0)
+    write_results(directory / "cell60.csv", FilterCell, n_rows=5)
+    write_results(directory / "day2" / "cell70.csv", FilterCell, temperature=70.0)
+    write_results(directory / "day2" / "counter.csv", Counter)
+    (directory / "notes.txt").write_text("no header\n")
+    (directory / "plot.png").write_bytes(b"")
+    return directory
+
+
+@pytest.fixture
+def index(tmp_path):
+    with results_index.ResultsIndex(tmp_path / "index.sqlite") as index:
+        yield index
+
+
+def names(rows):
+    return sorted(os.path.basename(row[0]) for row in rows)
+
+
+def test_parse_value_with_units():
+    assert results_index.parse_value("60.0 C") == (60.0, "C")
+    assert results_index.parse_value("1e-3") == (1e-3, None)
+    assert results_index.parse_value("A") == (None, None)
+
+
+def test_header_of_a_results_file(data):
+    header = results_index.read_header(data / "cell50.csv")
+    assert header["procedure"].endswith("FilterCell")
+    assert header["columns"] == ["Frequency", "Power"]
+    assert ("Parameters", "Temperature", "50 C", 50.0, "C") in header["parameters"]
+    assert results_index.read_header(data / "notes.txt") is None
+
+
+def test_rescan_only_indexes_changes(data, index):
+    # the text file without a header is indexed without a procedure
+    assert index.scan([data]) == (5, 0, 0)
+    assert index.scan([data]) == (0, 0, 0)
+
+    # two more rows of the existing file
+    write_results(data / "cell60.csv", FilterCell, n_rows=2)
+    (data / "day2" / "cell70.csv").unlink()
+    write_results(data / "cell80.csv", FilterCell, temperature=80.0)
+    assert index.scan([data]) == (1, 1, 1)
+
+    rows = {os.path.basename(path): n for path, _, n, _ in index.query("FilterCell")}
+    assert rows == {"cell50.csv": 3, "cell60.csv": 7, "cell80.csv": 3}
+
+
+def test_deleting_in_one_directory_keeps_the_others(data, index):
+    index.scan([data, data / "day2"])
+    (data / "cell50.csv").unlink()
+    assert index.scan([data / "day2"]) == (0, 0, 0)
+    assert index.scan([data]) == (0, 0, 1)
+
+
+@pytest.mark.parametrize(
+    "condition, expected",
+    [
+        ("Temperature=60", ["cell60.csv"]),
+        ("Temperature!=60", ["cell50.csv", "cell70.csv"]),
+        ("Temperature<60", ["cell50.csv"]),
+        ("Temperature<=60", ["cell50.csv", "cell60.csv"]),
+        ("Temperature>60", ["cell70.csv"]),
+        ("Temperature >= 60.0", ["cell60.csv", "cell70.csv"]),
+        # compared as numbers, as text "100.0" < "70.0"
+        ("Start frequency>70", ["cell50.csv", "cell60.csv", "cell70.csv"]),
+        ("Channel=A", ["cell50.csv", "cell60.csv", "cell70.csv"]),
+        ("Channel=B", []),
+        ("Temp%=70", ["cell70.csv"]),
+    ],
+)
+def test_conditions(data, index, condition, expected):
+    index.scan([data])
+    assert names(index.query("FilterCell", [condition])) == expected
+
+
+def test_conditions_are_combined(data, index):
+    index.scan([data])
+    rows = index.query(conditions=["Temperature>50", "Temperature<70"])
+    assert names(rows) == ["cell60.csv"]
+    assert names(index.query("Counter", ["Gate time<0.01"])) == ["counter.csv"]
+    assert names(index.query("Counter", ["Temperature=60"])) == []
+
+
+def test_invalid_condition(index):
+    with pytest.raises(ValueError, match="Invalid condition"):
+        index.query(conditions=["Temperature"])
+
+
+def test_parameters_of_a_file(data, index):
+    index.scan([data])
+    parameters = dict(index.parameters(data / "cell50.csv"))
+    assert parameters == {
+        "Temperature": "50 C",
+        "Start frequency": "100 MHz",
+        "Channel": "A",
+    }
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import instrument_pool
+import procedure_runner
+import sim_instruments
+
+procedure_runner.add_repository_to_path()
+
+import oscilloscope_readout  # noqa: E402
+import scope_spectra  # noqa: E402
+
+SAMPLE_RATE = 1e4
+
+
+def noise(n_channels=2, n_samples=4096, seed=0):
+    return np.random.default_rng(seed).standard_normal((n_channels, n_samples))
+
+
+def accumulate(frames, segment_length=256, overlap=0.5):
+    accumulator = scope_spectra.WelchAccumulator(
+        len(frames[0]), segment_length, SAMPLE_RATE, overlap
+    )
+    for frame in frames:
+        accumulator.add(frame)
+    return accumulator
+
+
+@pytest.mark.parametrize("rfft_out", [True, False])
+def test_matches_one_segment_at_a_time(rfft_out, monkeypatch):
+    if rfft_out and not scope_spectra.RFFT_OUT:
+        pytest.skip("numpy < 2.0 has no out argument for rfft")
+    monkeypatch.setattr(scope_spectra, "RFFT_OUT", rfft_out)
+    frames = [noise(3, seed=seed) for seed in range(3)]
+    accumulator = accumulate(frames)
+    expected = scope_spectra.naive_welch(frames, 256, SAMPLE_RATE)
+    np.testing.assert_allclose(accumulator.spectral_matrix(), expected, atol=1e-12)
+
+
+def test_power_spectral_density_integrates_to_the_variance():
+    accumulator = accumulate([noise(n_samples=2**16)])
+    df = accumulator.frequencies[1]
+    np.testing.assert_allclose(np.sum(accumulator.psd(), axis=-1) * df, 1, rtol=0.05)
+
+
+def test_cross_spectrum_phase_follows_scipy():
+    # scipy.signal.csd(x, y) averages conj(X) * Y, y lagging x gives a negative
+    # phase
+    delay = 3
+    x = noise(1, n_samples=2**14 + delay)[0]
+    frame = np.array([x[delay:], x[:-delay]])
+    accumulator = accumulate([frame])
+    f = accumulator.frequencies
+    low = (f > 0) & (f < 0.2 * SAMPLE_RATE)
+    expected = np.exp(-2j * np.pi * f[low] * delay / SAMPLE_RATE)
+    csd = accumulator.csd(0, 1)[low]
+    np.testing.assert_allclose(csd / np.abs(csd), expected, atol=0.1)
+
+
+def test_agrees_with_scipy():
+    signal = pytest.importorskip("scipy.signal")
+    frame = noise()
+    accumulator = accumulate([frame])
+    options = dict(fs=SAMPLE_RATE, window="hann", nperseg=256, noverlap=128)
+    f, psd = signal.welch(frame, **options)
+    np.testing.assert_allclose(accumulator.frequencies, f)
+    np.testing.assert_allclose(accumulator.psd(), psd)
+    _, csd = signal.csd(frame[0], frame[1], **options)
+    np.testing.assert_allclose(accumulator.csd(0, 1), csd)
+
+
+def run_scope(tmp_path, parameters):
+    procedure = oscilloscope_readout.ScopeReadoutProcedure()
+    procedure.set_parameters(parameters)
+    scope = sim_instruments.SimLeCroy(latency=0)
+    address = oscilloscope_readout.SCOPE_ADDRESS
+    instrument_pool.override(address, lambda address: scope)
+    try:
+        assert procedure_runner.run(procedure, str(tmp_path / "results.csv"))
+    finally:
+        instrument_pool.clear_override(address)
+    return scope, pd.read_csv(tmp_path / "results.csv", comment="#")
+
+
+def test_traces_are_read_from_the_running_scope(tmp_path):
+    scope, data = run_scope(tmp_path, {"ch1": True, "ch2": True, "sparsing": 10})
+    assert scope._mode == "normal" and scope._acquisition is None
+    assert len(data["CH1"].dropna()) == scope.points // 10
+
+
+def test_spectra_are_from_single_acquisitions(tmp_path):
+    parameters = {"ch1": True, "ch2": True, "spectrum": True, "n_captures": 3}
+    scope, data = run_scope(tmp_path, parameters)
+    # the mode before the captures is restored
+    assert scope._mode == "normal" and scope._acquisition is not None
+    assert data["Frames"].iloc[-1] == 3
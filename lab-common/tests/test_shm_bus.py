@@ -0,0 +1,117 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import shm_bus
+
+
+@pytest.fixture
+def bus():
+    bus = shm_bus.RingBuffer.create(n_columns=2, capacity=4)
+    yield bus
+    bus.close()
+
+
+def rows(start, stop):
+    return np.array([[i, -i] for i in range(start, stop)], dtype=float)
+
+
+def write(bus, start, stop):
+    for row in rows(start, stop):
+        bus.write(row)
+
+
+def test_read_new_rows(bus):
+    write(bus, 0, 3)
+    data, cursor, lost = bus.read(0)
+    np.testing.assert_equal(data, rows(0, 3))
+    assert (cursor, lost) == (3, 0)
+    write(bus, 3, 4)
+    data, cursor, lost = bus.read(cursor)
+    np.testing.assert_equal(data, rows(3, 4))
+    assert (cursor, lost) == (4, 0)
+    assert len(bus.read(cursor)[0]) == 0
+
+
+def test_read_across_the_wraparound(bus):
+    write(bus, 0, 3)
+    _, cursor, _ = bus.read(0)
+    write(bus, 3, 7)
+    data, cursor, lost = bus.read(cursor)
+    np.testing.assert_equal(data, rows(3, 7))
+    assert (cursor, lost) == (7, 0)
+
+
+def test_overwritten_rows_are_counted_as_lost(bus):
+    write(bus, 0, 10)
+    data, cursor, lost = bus.read(0)
+    np.testing.assert_equal(data, rows(6, 10))
+    assert (cursor, lost) == (10, 6)
+
+
+class WritingWhileCopied:
+    """Rows of a reader, the writer adds `n` rows while they are copied."""
+
+    def __init__(self, rows, writer, n):
+        self.rows = rows
+        self.writer = writer
+        self.n = n
+
+    def __getitem__(self, indices):
+        copy = self.rows[indices]
+        write(self.writer, self.writer.count, self.writer.count + self.n)
+        return copy
+
+
+def test_rows_overwritten_during_the_copy_are_dropped(bus):
+    write(bus, 0, 4)
+    reader = shm_bus.RingBuffer.attach(bus.name)
+    rows_of_reader = reader._rows
+    reader._rows = WritingWhileCopied(rows_of_reader, bus, 2)
+    try:
+        data, cursor, lost = reader.read(0)
+    finally:
+        reader._rows = rows_of_reader
+        reader.close()
+    # rows 0 and 1 may hold rows 4 and 5 in the copy
+    np.testing.assert_equal(data, rows(2, 4))
+    assert (cursor, lost) == (4, 2)
+
+
+def test_readers_attach_by_name(bus):
+    reader = shm_bus.RingBuffer.attach(bus.name)
+    try:
+        assert (reader.capacity, reader.n_columns) == (4, 2)
+        write(bus, 0, 2)
+        np.testing.assert_equal(reader.read(0)[0], rows(0, 2))
+    finally:
+        reader.close()
+    # closing a reader keeps the memory of the writer
+    write(bus, 2, 3)
+    assert bus.count == 3
+
+
+def write_in_child(name, n):
+    bus = shm_bus.RingBuffer.attach(name)
+    write(bus, 0, n)
+    bus.close()
+
+
+def test_rows_from_another_process():
+    bus = shm_bus.RingBuffer.create(n_columns=2, capacity=100)
+    try:
+        process = multiprocessing.Process(target=write_in_child, args=(bus.name, 50))
+        process.start()
+        process.join(timeout=30)
+        assert process.exitcode == 0
+        data, cursor, lost = bus.read(0)
+        np.testing.assert_equal(data, rows(0, 50))
+        assert (cursor, lost) == (50, 0)
+    finally:
+        bus.close()
+
+
+def test_records_become_rows():
+    row = shm_bus.to_row({"a": 1, "b": "text", "c": None}, ["a", "b", "c", "d"])
+    np.testing.assert_equal(row, [1, np.nan, np.nan, np.nan])
@@ -0,0 +1,20 @@
+import threading
+
+from pymeasure.experiment import Results, Worker
+
+import instrument_pool
+import procedure_runner
+import sim_instruments
+
+
+def test_overrides_are_cleared_after_a_simulated_run(tmp_path):
+    procedure_class = procedure_runner.load_procedure_class("aom-amplifier-calibration")
+    procedure = procedure_class()
+    procedure.set_parameters({"step_time": 0.001, "voltage_step": 1.0})
+    sim_instruments.install(procedure, latency=0)
+    addresses = procedure.get_resources()
+    worker = Worker(Results(procedure, str(tmp_path / "results.csv")))
+    worker.start()
+    threading.Thread.join(worker, 30)
+    assert procedure.status == procedure.FINISHED
+    assert not set(addresses) & set(instrument_pool._overrides)
@@ -0,0 +1,36 @@
+import threading
+
+from pymeasure.experiment import IntegerParameter, Procedure, Results, Worker
+
+import step_timing
+
+
+class SteppingProcedure(Procedure):
+    n_steps = IntegerParameter("Number of steps", default=10)
+
+    DATA_COLUMNS = ["Step"]
+
+    def startup(self):
+        self.timer = step_timing.StepTimer(self, enabled=True)
+
+    def execute(self):
+        for i in range(self.n_steps):
+            self.timer.start_step()
+            self.timer.lap(step_timing.SETTLE)
+            self.emit("results", {"Step": i})
+            self.timer.lap("emit")
+
+    def shutdown(self):
+        self.timer.finish()
+
+
+def test_summary_is_written_next_to_the_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(step_timing, "COSTS_FILE", tmp_path / "costs.json")
+    filename = tmp_path / "results.csv"
+    # as started by the GUI, without the runner
+    worker = Worker(Results(SteppingProcedure(), str(filename)))
+    worker.start()
+    threading.Thread.join(worker, 30)
+    summary = (tmp_path / "results.timing.txt").read_text()
+    assert "Step timing of" in summary
+    assert "emit" in summary
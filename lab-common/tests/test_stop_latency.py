@@ -0,0 +1,70 @@
+import importlib
+
+import pytest
+
+import cancellation
+import instrument_pool
+import procedure_runner
+import sim_instruments
+
+LATENCY = 0.02
+# a step writes and reads an instrument, shutdown resets one
+STEP = 3 * LATENCY
+# time for the worker thread to notice the stop flag and end
+SCHEDULING = 0.05
+
+# parameters that keep the procedures running for longer than a second
+LONG_RUNS = {
+    "aom-amplifier-calibration": {"step_time": 1.0},
+    "aom-frequency-map": {"step_time": 1.0, "frequency_step_time": 1.0},
+    "filter-cells": {"step_time": 1.0},
+    "pi-curve": {"n_steps": 1000, "delay": 1.0},
+    "mot-telescope-calibration": {},
+    "qrf-vs-pm": {},
+    "mot-telescope-combined": {},
+    "linien-spectrum": {"n_captures": 1000, "capture_interval": 1.0},
+    # the simulated sweep takes 1 s
+    "optical-spectrum": {},
+    "scope-readout": {"spectrum": True, "n_captures": 1_000_000},
+}
+
+
+def load(name):
+    try:
+        return procedure_runner.load_procedure_class(name)
+    except ModuleNotFoundError as e:
+        pytest.skip(f"{name} needs {e.name}")
+
+
+@pytest.mark.parametrize("name", LONG_RUNS)
+def test_stops_within_a_poll_interval(name, tmp_path):
+    procedure = load(name)()
+    procedure.set_parameters(LONG_RUNS[name])
+    procedure_runner.simulate(procedure, latency=LATENCY)
+    latency = procedure_runner.stop_latency(
+        procedure, str(tmp_path / "results.csv"), after=0.5
+    )
+    assert latency is not None, "finished before the stop request"
+    assert latency < cancellation.STOP_POLL_INTERVAL + STEP + SCHEDULING
+
+
+def test_counter_aborts_buffering_on_stop(tmp_path):
+    procedure = load("cnt91-ts")()
+    procedure.set_parameters(
+        {"n_samples": 100_000, "gate_time": 1e-3, "raw_directory": str(tmp_path)}
+    )
+    module = importlib.import_module(type(procedure).__module__)
+    counter = sim_instruments.SimCNT91(latency=LATENCY)
+    instrument_pool.override(module.COUNTER_ADDRESS, lambda address: counter)
+    try:
+        latency = procedure_runner.stop_latency(
+            procedure, str(tmp_path / "results.csv"), after=0.5
+        )
+    finally:
+        instrument_pool.clear_override(module.COUNTER_ADDRESS)
+    assert latency < cancellation.STOP_POLL_INTERVAL + STEP + SCHEDULING
+    assert not counter.measuring
+
+
+def test_every_procedure_is_covered():
+    assert set(procedure_runner.PROCEDURES) == {*LONG_RUNS, "cnt91-ts"}
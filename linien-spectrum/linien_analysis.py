@@ -0,0 +1,199 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+# crossings with a flanking extremum below this fraction of the largest extremum
+# are attributed to noise, e.g. on the baseline
+MIN_PEAK_FRACTION = 0.1
+# samples on each side of a crossing the slope is fitted to
+SLOPE_WINDOW = 5
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def smooth(signal, n):
+    if n <= 1:
+        return np.asarray(signal, dtype=float)
+    return np.convolve(signal, np.ones(n) / n, mode="same")
+
+
+def _segment_extrema(signal, starts, function):
+    """Value and first position of the extremum of each segment."""
+    values = function.reduceat(signal, starts)
+    lengths = np.diff(np.append(starts, len(signal)))
+    candidates = np.flatnonzero(signal == np.repeat(values, lengths))
+    positions = candidates[np.searchsorted(candidates, starts)]
+    return values, positions
+
+
+def _fitted_slopes(signal, crossings, lower, upper, half_width):
+    """Slopes of lines fitted to the samples around each crossing.
+
+    Only the samples within `half_width` of the crossing and between `lower` and
+    `upper` are used, the crossing itself and the next sample always are.
+    """
+    offsets = np.arange(-half_width + 1, half_width + 1)
+    index = crossings[:, np.newaxis] + offsets
+    weights = (
+        (index >= lower[:, np.newaxis]) & (index <= upper[:, np.newaxis])
+    ).astype(float)
+    y = signal[np.clip(index, 0, len(signal) - 1)]
+    n = weights.sum(axis=1, keepdims=True)
+    dx = offsets - (weights * offsets).sum(axis=1, keepdims=True) / n
+    dy = y - (weights * y).sum(axis=1, keepdims=True) / n
+    return (weights * dx * dy).sum(axis=1) / (weights * dx**2).sum(axis=1)
+
+
+def find_features(
+    error_signal,
+    smoothing=5,
+    min_peak_fraction=MIN_PEAK_FRACTION,
+    slope_window=SLOPE_WINDOW,
+):
+    """Locate the zero crossings of an error signal and characterize them.
+
+    Returns a dict of arrays, one entry per crossing:
+
+    - `position`: crossing, interpolated between samples
+    - `slope`: slope of a line fitted to the error signal within `slope_window`
+      samples of the crossing, not beyond the flanking extrema
+    - `peak_to_peak`: difference of the flanking extrema
+    - `capture_range`: distance of the flanking extrema in samples
+    """
+    error_signal = np.asarray(error_signal, dtype=float)
+    signal = smooth(error_signal, smoothing)
+    negative = np.signbit(signal)
+    crossings = np.flatnonzero(negative[:-1] != negative[1:])
+    if len(crossings) == 0:
+        return {
+            key: np.array([])
+            for key in ["position", "slope", "peak_to_peak", "capture_range"]
+        }
+
+    left, right = signal[crossings], signal[crossings + 1]
+    position = crossings + left / (left - right)
+
+    # the signal between two crossings has a single sign, its extremum is the
+    # peak flanking both crossings
+    starts = np.concatenate([[0], crossings + 1])
+    maxima, max_positions = _segment_extrema(signal, starts, np.maximum)
+    minima, min_positions = _segment_extrema(signal, starts, np.minimum)
+    positive_segment = maxima > 0
+    peaks = np.where(positive_segment, maxima, minima)
+    peak_positions = np.where(positive_segment, max_positions, min_positions)
+
+    peak_to_peak = np.abs(peaks[1:] - peaks[:-1])
+    capture_range = peak_positions[1:] - peak_positions[:-1]
+    slope = _fitted_slopes(
+        error_signal,
+        crossings,
+        peak_positions[:-1],
+        peak_positions[1:],
+        slope_window,
+    )
+
+    weaker_peak = np.minimum(np.abs(peaks[1:]), np.abs(peaks[:-1]))
+    keep = weaker_peak >= min_peak_fraction * np.abs(peaks).max()
+    return {
+        "position": position[keep],
+        "slope": slope[keep],
+        "peak_to_peak": peak_to_peak[keep],
+        "capture_range": capture_range[keep],
+    }
+
+
+def lock_point(features):
+    """Index of the feature with the largest peak-to-peak value or None."""
+    if len(features["peak_to_peak"]) == 0:
+        return None
+    return int(np.argmax(features["peak_to_peak"]))
+
+
+class FeatureTracker:
+    """Drift of each feature of successive captures relative to the first capture.
+
+    The features of the first capture with any are the reference. Each of them is
+    followed from capture to capture by matching it to the nearest feature within
+    half its capture range. A feature that is not found keeps its last position and
+    is searched for again in the next capture.
+    """
+
+    def __init__(self):
+        self.reference = None
+        self.positions = None
+        self.tolerances = None
+
+    def update(self, features):
+        """Match the features of a capture to the reference features.
+
+        Returns the index of the matching feature of the capture for every
+        reference feature, -1 if it was not found, and its drift in samples, NaN if
+        it was not found.
+        """
+        position = features["position"]
+        if self.reference is None:
+            if len(position) == 0:
+                return np.array([], dtype=int), np.array([])
+            self.reference = position.copy()
+            self.positions = position.copy()
+            self.tolerances = np.abs(features["capture_range"]) / 2
+            return np.arange(len(position)), np.zeros(len(position))
+
+        indices = np.full(len(self.reference), -1)
+        drift = np.full(len(self.reference), np.nan)
+        if len(position) == 0:
+            return indices, drift
+        distances = np.abs(position[np.newaxis, :] - self.positions[:, np.newaxis])
+        nearest = np.argmin(distances, axis=1)
+        found = distances[np.arange(len(nearest)), nearest] <= self.tolerances
+        indices[found] = nearest[found]
+        self.positions[found] = position[nearest[found]]
+        drift[found] = self.positions[found] - self.reference[found]
+        return indices, drift
+
+
+def synthetic_error_signal(n=2048, center=0.0, width=0.05, noise=0.02, rng=None):
+    rng = rng or np.random.default_rng()
+    x = np.linspace(-1, 1, n)
+    detuning = (x - center) / width
+    error = -2 * detuning / (1 + detuning**2) ** 2
+    return 4000 * (error + noise * rng.standard_normal(n))
+
+
+def benchmark(n_frames=1000, n_points=2048):
+    """Analysis rate for captures with a drifting feature."""
+    rng = np.random.default_rng(0)
+    frames = [
+        synthetic_error_signal(n_points, center=0.2 * i / n_frames, rng=rng)
+        for i in range(n_frames)
+    ]
+    tracker = FeatureTracker()
+    start = time.perf_counter()
+    for frame in frames:
+        features = find_features(frame)
+        if tracker.reference is None:
+            k = lock_point(features)
+        _, drift = tracker.update(features)
+    duration = time.perf_counter() - start
+    shift = drift[k]
+    expected = 0.2 * (n_frames - 1) / n_frames * (n_points - 1) / 2
+    print(f"{n_frames / duration:.0f} captures / s with {n_points} points")
+    print(f"Drift of the last capture: {shift:.2f} samples (true {expected:.2f})")
+    return n_frames / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the analysis of Linien error signals."
+    )
+    parser.add_argument("-n", "--frames", type=int, default=1000)
+    parser.add_argument("-p", "--points", type=int, default=2048)
+    args = parser.parse_args()
+    benchmark(args.frames, args.points)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,142 @@
 import logging
 import pickle
 import sys
+import time
 
-from linien_client.connection import LinienClient
-from pymeasure.display.Qt import QtGui
-from pymeasure.display.windows import ManagedWindow
-from pymeasure.experiment import Procedure, Results
-from pymeasure.experiment.results import unique_filename
+import cancellation
+import instrument_pool
+import numpy as np
+from pymeasure.experiment import (
+    BooleanParameter,
+    FloatParameter,
+    IntegerParameter,
+    Procedure,
+)
 
-log = logging.getLogger(__name__)
-log.addHandler(logging.NullHandler())
+from linien_analysis import FeatureTracker, find_features, lock_point
 
+REDPITAYA_HOST = "rp-f012ba.local"
 
-class LinienSpectrumProcedure(Procedure):
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
 
-    DATA_COLUMNS = ["Index", "Error Signal", "Monitor Signal"]
 
-    def startup(self):
-        log.info("Connecting to RedPitaya")
-        self.client = LinienClient(
-            {"host": "rp-f012ba.local", "username": "root", "password": "root"},
-            autostart_server=False,
-        )
+# the vendor driver is imported when connecting, so simulations run without it
+def connect_linien(host):
+    from linien_client.connection import LinienClient
 
-    def execute(self):
-        log.info("Taking the spectrum.")
+    return LinienClient(
+        {"host": host, "username": "root", "password": "root"},
+        autostart_server=False,
+    )
 
-        to_plot = pickle.loads(self.client.parameters.to_plot.value)
-        error_signal = to_plot["error_signal_1"]
-        monitor_signal = to_plot["monitor_signal"]
-        index = range(len(monitor_signal))
 
-        for i in index:
+def check_linien(client):
+    client.parameters.to_plot.value
 
-            es = error_signal[i]
-            ms = monitor_signal[i]
 
-            self.emit(
-                "results",
-                {
-                    "Index": i,
-                    "Error Signal": es,
-                    "Monitor Signal": ms,
-                },
-            )
+class LinienSpectrumProcedure(Procedure):
+    n_captures = IntegerParameter(
+        "Number of captures", default=1, minimum=1, maximum=1_000_000
+    )
+    capture_interval = FloatParameter(
+        "Time between captures", units="s", default=0.0, minimum=0.0, maximum=3600.0
+    )
+    store_traces = BooleanParameter("Store the traces", default=True)
+
+    # the traces and, after those of each capture, one row with its analysis
+    DATA_COLUMNS = [
+        "Index",
+        "Error Signal",
+        "Monitor Signal",
+        "Capture",
+        "Lock Point",
+        "Slope",
+        "Capture Range",
+        "Drift",
+    ]
+
+    def get_resources(self):
+        return [REDPITAYA_HOST]
 
-        if self.should_stop():
-            log.warning("Caught the stop flag in the procedure")
-            self.client.disconnect()
-            return
+    def startup(self):
+        log.info("Connecting to RedPitaya")
+        self.client = instrument_pool.get(
+            REDPITAYA_HOST, connect_linien, check=check_linien
+        )
 
-        self.client.disconnect()
+    def analyze(self, error_signal, capture):
+        features = find_features(error_signal)
+        indices, drift = self.tracker.update(features)
+        if self.lock_feature is None:
+            # chosen once, so that the drift of the same feature is followed
+            self.lock_feature = lock_point(features)
+        analysis = {
+            "Capture": capture,
+            "Lock Point": np.nan,
+            "Slope": np.nan,
+            "Capture Range": np.nan,
+            "Drift": np.nan,
+        }
+        if self.lock_feature is None:
+            log.warning(f"No lock point found in capture {capture}")
+            return analysis
+        k = indices[self.lock_feature]
+        if k < 0:
+            log.warning(f"Lost the lock point in capture {capture}")
+            return analysis
+        analysis["Lock Point"] = features["position"][k]
+        analysis["Slope"] = features["slope"][k]
+        analysis["Capture Range"] = features["capture_range"][k]
+        analysis["Drift"] = drift[self.lock_feature]
+        return analysis
 
+    def execute(self):
+        log.info("Taking the spectrum.")
 
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=LinienSpectrumProcedure,
-            x_axis="Index",
-            y_axis="Error Signal",
-            directory_input=True,
-        )
-        self.setWindowTitle("Take Linien Spectrum")
+        self.tracker = FeatureTracker()
+        self.lock_feature = None
+        for capture in range(self.n_captures):
+            capture_start = time.monotonic()
+            to_plot = pickle.loads(self.client.parameters.to_plot.value)
+            error_signal = to_plot["error_signal_1"]
+            monitor_signal = to_plot["monitor_signal"]
+
+            if self.store_traces:
+                for i in range(len(monitor_signal)):
+                    self.emit(
+                        "results",
+                        {
+                            "Index": i,
+                            "Error Signal": error_signal[i],
+                            "Monitor Signal": monitor_signal[i],
+                            "Capture": capture,
+                        },
+                    )
+                    if self.should_stop():
+                        log.warning("Caught the stop flag in the procedure")
+                        return
+            self.emit("results", self.analyze(error_signal, capture))
+
+            self.emit("progress", 100 * (capture + 1) / self.n_captures)
+            if capture + 1 < self.n_captures:
+                elapsed = time.monotonic() - capture_start
+                if not cancellation.wait(self, max(self.capture_interval - elapsed, 0)):
+                    log.warning("Caught the stop flag in the procedure")
+                    return
 
-    def queue(self):
-        directory = self.directory
-        filename = unique_filename(directory, prefix="LINIEN")
 
-        procedure = self.make_procedure()
-        results = Results(procedure, filename)
-        experiment = self.new_experiment(results)
+def main():
+    import remote_procedures
+    import shm_bus
+    from pymeasure.display.Qt import QtGui
 
-        self.manager.queue(experiment)
+    from linien_spectrum_gui import MainWindow
 
+    # with a procedure server, the acquisition runs there instead
+    if not remote_procedures.enable_from_environment() and shm_bus.process_enabled():
+        shm_bus.enable()
 
-def main():
     app = QtGui.QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,29 @@
+from pymeasure.display.windows import ManagedWindow
+from pymeasure.experiment.results import unique_filename
+from shm_bus import BusResults
+
+from linien_spectrum import LinienSpectrumProcedure
+
+
+class MainWindow(ManagedWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=LinienSpectrumProcedure,
+            inputs=["n_captures", "capture_interval", "store_traces"],
+            displays=["n_captures"],
+            x_axis="Index",
+            y_axis="Error Signal",
+            directory_input=True,
+        )
+        self.setWindowTitle("Take Linien Spectrum")
+
+    def queue(self):
+        directory = self.directory
+        filename = unique_filename(directory, prefix="LINIEN")
+
+        procedure = self.make_procedure()
+        # reads the rows from shared memory with the acquisition process enabled
+        results = BusResults(procedure, filename)
+        experiment = self.new_experiment(results)
+
+        self.manager.queue(experiment)
@@ -0,0 +1,242 @@
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+
+CHANNELS = ["a1", "a2", "a3", "b1", "b2", "b3"]
+
+# points where the local slope is below this fraction of the channel's typical
+# slope are treated as noise floor or saturation of the log detector
+MIN_SLOPE_FRACTION = 0.5
+# width in dB of the window the local slope is fitted over, the steps of the QRF
+# are much finer, so the slope between neighbouring points is dominated by noise
+SLOPE_WINDOW = 2.0
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def load_adc_values(filename):
+    with open(filename) as f:
+        lines = [line for line in f if not line.startswith("#")]
+    columns = lines[0].strip().split(",")
+    data = np.loadtxt(lines[1:], delimiter=",", ndmin=2)
+    rf_powers = data[:, columns.index("rf power")]
+    adc_values = data[:, [columns.index(ch) for ch in CHANNELS]]
+    # points measured at the same rf power are averaged
+    rf_powers, inverse, counts = np.unique(
+        rf_powers, return_inverse=True, return_counts=True
+    )
+    averaged = np.zeros((len(rf_powers), len(CHANNELS)))
+    np.add.at(averaged, inverse, adc_values)
+    return rf_powers, averaged / counts[:, np.newaxis]
+
+
+def load_runs(path):
+    path = Path(path)
+    filenames = sorted(path.glob("*.csv")) if path.is_dir() else [path]
+    runs = []
+    for fn in list(filenames):
+        try:
+            runs.append(load_adc_values(fn))
+        except ValueError:
+            log.warning(f"Skipping {fn}, it does not contain ADC values.")
+            filenames.remove(fn)
+    if not runs:
+        raise ValueError(f"There are no results files with ADC values in {path}")
+
+    # pad with nans so that all runs can be stacked into one array
+    n_points = max(len(rf_powers) for rf_powers, _ in runs)
+    rf_powers = np.full((len(runs), n_points), np.nan)
+    adc_values = np.full((len(runs), n_points, len(CHANNELS)), np.nan)
+    for i, (rf, adc) in enumerate(runs):
+        rf_powers[i, : len(rf)] = rf
+        adc_values[i, : len(rf)] = adc
+    return filenames, rf_powers, adc_values
+
+
+def local_slopes(rf_powers, adc_values, window=SLOPE_WINDOW):
+    """Slopes of lines fitted to the points within `window` dB around each point.
+
+    The window always includes the neighbouring points, so that the slope is also
+    defined where the rf steps are larger than the window.
+
+    `rf_powers` has shape (runs, points) and is ascending in each run, padded with
+    NaN, `adc_values` has shape (runs, points, channels).
+    """
+    valid = np.isfinite(rf_powers)[..., np.newaxis] & np.isfinite(adc_values)
+    x = np.where(valid, np.nan_to_num(rf_powers)[..., np.newaxis], 0.0)
+    y = np.where(valid, adc_values, 0.0)
+    # cumulative sums of the normal equations, the window sums are differences
+    sums = np.stack([valid, x, y, x * x, x * y]).astype(float)
+    cumulative = np.concatenate(
+        [np.zeros_like(sums[:, :, :1]), np.cumsum(sums, axis=2)], axis=2
+    )
+
+    slopes = np.full(adc_values.shape, np.nan)
+    for run, rf in enumerate(rf_powers):
+        n_points = np.count_nonzero(np.isfinite(rf))
+        rf = rf[:n_points]
+        # at least the neighbours, where the steps are coarse they are not noisy
+        index = np.arange(n_points)
+        lower = np.minimum(
+            np.searchsorted(rf, rf - window / 2, side="left"),
+            np.maximum(index - 1, 0),
+        )
+        upper = np.maximum(
+            np.searchsorted(rf, rf + window / 2, side="right"),
+            np.minimum(index + 2, n_points),
+        )
+        s0, sx, sy, sxx, sxy = cumulative[:, run, upper] - cumulative[:, run, lower]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slopes[run, :n_points] = (s0 * sxy - sx * sy) / (s0 * sxx - sx * sx)
+    return slopes
+
+
+def linear_region(
+    rf_powers,
+    adc_values,
+    min_slope_fraction=MIN_SLOPE_FRACTION,
+    window=SLOPE_WINDOW,
+):
+    """Mask of the points that lie in the linear-in-dBm range of each channel.
+
+    `rf_powers` has shape (runs, points), `adc_values` (runs, points, channels).
+    The slope at each point is fitted over a window of `window` dB, a point is
+    linear if its slope has the channel's sign and at least `min_slope_fraction`
+    of the channel's typical slope.
+    """
+    slopes = local_slopes(rf_powers, adc_values, window)
+    # the flat parts of the curve pull the median down, so use a high percentile
+    reference = np.nanpercentile(np.abs(slopes), 90, axis=1, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        steep = np.abs(slopes) >= min_slope_fraction * reference
+        direction = np.sign(np.sum(np.where(steep, slopes, 0.0), axis=1))
+        return steep & (np.sign(slopes) == direction[:, np.newaxis])
+
+
+def fit_channels(rf_powers, adc_values, mask):
+    """Weighted least squares fit `adc = slope * rf_power + intercept`.
+
+    All runs and channels are solved at once using the closed form of the normal
+    equations; points outside of `mask` get zero weight.
+    """
+    w = mask & np.isfinite(adc_values)
+    x = np.where(w, rf_powers[..., None], 0.0)
+    y = np.where(w, adc_values, 0.0)
+
+    s0 = w.sum(axis=1)
+    sx = x.sum(axis=1)
+    sy = y.sum(axis=1)
+    sxx = (x * x).sum(axis=1)
+    sxy = (x * y).sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (s0 * sxy - sx * sy) / (s0 * sxx - sx * sx)
+        intercept = (sy - slope * sx) / s0
+    return slope, intercept
+
+
+class ADCCalibration:
+    """Linear-in-dBm calibration of the six ADBox channels for one or more runs."""
+
+    def __init__(self, slope, intercept, rf_min, rf_max, names=None):
+        self.slope = np.atleast_2d(slope)
+        self.intercept = np.atleast_2d(intercept)
+        self.rf_min = np.atleast_2d(rf_min)
+        self.rf_max = np.atleast_2d(rf_max)
+        self.names = names if names is not None else [""] * len(self.slope)
+
+    @classmethod
+    def from_runs(
+        cls, path, min_slope_fraction=MIN_SLOPE_FRACTION, window=SLOPE_WINDOW
+    ):
+        filenames, rf_powers, adc_values = load_runs(path)
+        mask = linear_region(rf_powers, adc_values, min_slope_fraction, window)
+        slope, intercept = fit_channels(rf_powers, adc_values, mask)
+        rf = np.where(mask, rf_powers[..., None], np.nan)
+        return cls(
+            slope,
+            intercept,
+            np.nanmin(rf, axis=1),
+            np.nanmax(rf, axis=1),
+            names=[fn.name for fn in filenames],
+        )
+
+    def rf_power(self, adc_values, run=0):
+        """Convert ADC counts of shape (..., channels) to rf power in dBm.
+
+        Values outside of the calibrated range are clipped to its limits, as the
+        detector is saturated there.
+        """
+        rf_powers = (np.asarray(adc_values) - self.intercept[run]) / self.slope[run]
+        return np.clip(rf_powers, self.rf_min[run], self.rf_max[run])
+
+    def save(self, filename):
+        rows = [
+            [name, ch, *values]
+            for name, run in zip(self.names, self._coefficients())
+            for ch, values in zip(CHANNELS, run)
+        ]
+        with open(filename, "w") as f:
+            f.write("run,channel,slope,intercept,rf_min,rf_max\n")
+            for row in rows:
+                f.write(",".join(str(value) for value in row) + "\n")
+
+    @classmethod
+    def load(cls, filename):
+        data = np.genfromtxt(
+            filename, delimiter=",", names=True, dtype=None, encoding="utf-8"
+        )
+        names = [str(name) for name in dict.fromkeys(data["run"])]
+        shape = (len(names), len(CHANNELS))
+        return cls(
+            *(
+                data[key].reshape(shape)
+                for key in ["slope", "intercept", "rf_min", "rf_max"]
+            ),
+            names=names,
+        )
+
+    def _coefficients(self):
+        return np.stack([self.slope, self.intercept, self.rf_min, self.rf_max], -1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit the ADBox ADC values vs. rf power for all channels."
+    )
+    parser.add_argument("path", help="results file or directory of results files")
+    parser.add_argument(
+        "-o", "--output", default="adc_calibration.csv", help="calibration file"
+    )
+    parser.add_argument(
+        "--min-slope-fraction",
+        type=float,
+        default=MIN_SLOPE_FRACTION,
+        help="relative slope below which a channel counts as saturated",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=SLOPE_WINDOW,
+        help="width in dB of the window the local slope is fitted over",
+    )
+    args = parser.parse_args()
+
+    calibration = ADCCalibration.from_runs(
+        args.path, args.min_slope_fraction, args.window
+    )
+    for name, run in zip(calibration.names, calibration._coefficients()):
+        print(name)
+        for ch, (slope, intercept, rf_min, rf_max) in zip(CHANNELS, run):
+            print(
+                f"  {ch}: {slope:.4g} counts/dBm, {intercept:.4g} counts, "
+                f"linear from {rf_min:.2f} to {rf_max:.2f} dBm"
+            )
+    calibration.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
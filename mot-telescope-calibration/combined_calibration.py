@@ -0,0 +1,166 @@
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import instrument_pool
+import pm_acquisition
+import step_timing
+from pymeasure.experiment import Procedure
+from pymeasure.experiment.parameters import FloatParameter, ListParameter
+from pymeasure.instruments.thorlabs.thorlabspm100usb import ThorlabsPM100USB
+from qrf_power_levels import get_power_values
+
+SLEEP_TIME = 0.1
+ADBOX_ADDRESS = "ASRL10::INSTR"
+PM_ADDRESS = "USB0::0x1313::0x8078::P0032734::INSTR"
+QRF_ADDRESS = "192.168.123.51"
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+# the vendor drivers are imported when connecting, so simulations run without them
+def connect_adbox(address):
+    from adboxes import TelescopeADBox
+
+    return TelescopeADBox(address)
+
+
+def connect_qrf(address):
+    from mogdevice.qrf import QRF
+
+    return QRF(address)
+
+
+def check_qrf(qrf):
+    qrf.channels[1].power
+
+
+class CombinedReadoutProcedure(Procedure):
+
+    start_rf_power = FloatParameter(
+        "rf power start",
+        default=0.0,
+        units="dBm",
+        minimum=-50.0,
+        maximum=34.5,
+    )
+
+    stop_rf_power = FloatParameter(
+        "rf power stop",
+        default=33.0,
+        units="dBm",
+        minimum=-50.0,
+        maximum=34.5,
+    )
+
+    qrf_channel = ListParameter(
+        "QRF channel",
+        default=4,
+        choices=[1, 2, 3, 4],
+    )
+
+    DATA_COLUMNS = [
+        "rf power",
+        "a1",
+        "a2",
+        "a3",
+        "b1",
+        "b2",
+        "b3",
+        "optical power",
+    ]
+
+    def get_resources(self):
+        return [ADBOX_ADDRESS, PM_ADDRESS, QRF_ADDRESS]
+
+    def startup(self):
+        log.info("Connecting to Telescope AD Box")
+        self.adbox = instrument_pool.get(
+            ADBOX_ADDRESS, connect_adbox, check=lambda adbox: adbox.get_data()
+        )
+        log.info("Connecting to Thorlabs PM100USB")
+        self.pm = instrument_pool.get(
+            PM_ADDRESS,
+            ThorlabsPM100USB,
+            check=instrument_pool.query_id,
+        )
+        # single samples, another procedure may have left the meter averaging
+        self.acquisition = pm_acquisition.PowerMeterAcquisition(self.pm, averaging=1)
+        log.info("Connecting to QRF")
+        self.qrf = instrument_pool.get(QRF_ADDRESS, connect_qrf, check=check_qrf)
+        # one worker per instrument, so the serial and the USB read overlap
+        self.readers = ThreadPoolExecutor(max_workers=2)
+        self.timer = step_timing.StepTimer(self)
+
+    def get_estimates(self):
+        n_points = len(get_power_values(self.start_rf_power, self.stop_rf_power))
+        # without a measurement, assume that a step takes 1.5 times the settling time
+        duration = step_timing.estimate_duration(
+            self, n_points, SLEEP_TIME, default_overhead=0.5 * SLEEP_TIME
+        )
+        estimates = [
+            ("Duration / s", f"{duration:.1f}"),
+        ]
+        return estimates
+
+    def read_instruments(self):
+        adc_future = self.readers.submit(self.adbox.get_data, raw=True)
+        power_future = self.readers.submit(self.acquisition.read)
+        return adc_future.result(), power_future.result()
+
+    def execute(self):
+        rf_powers = get_power_values(self.start_rf_power, self.stop_rf_power)
+        n_points = len(rf_powers)
+
+        for i, rf_power in enumerate(rf_powers):
+            self.timer.start_step()
+            self.qrf.channels[self.qrf_channel].power = rf_power
+            self.timer.lap("write")
+            sleep(SLEEP_TIME)
+            self.timer.lap("settle")
+            adc_values, optical_power = self.read_instruments()
+            self.timer.lap("read")
+            self.emit("progress", 100 * i / n_points)
+            self.emit(
+                "results",
+                {
+                    "rf power": rf_power,
+                    "a1": adc_values["A1"],
+                    "a2": adc_values["A2"],
+                    "a3": adc_values["A3"],
+                    "b1": adc_values["B1"],
+                    "b2": adc_values["B2"],
+                    "b3": adc_values["B3"],
+                    "optical power": optical_power,
+                },
+            )
+            self.timer.lap("emit")
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                break
+
+    def shutdown(self):
+        if hasattr(self, "readers"):
+            self.readers.shutdown()
+        if hasattr(self, "timer"):
+            self.timer.finish()
+
+
+def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
+
+    from combined_calibration_gui import MainWindow
+
+    remote_procedures.enable_from_environment()
+
+    app = QtWidgets.QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    sys.exit(app.exec())
+
+
+if __name__ == "__main__":
+    main()
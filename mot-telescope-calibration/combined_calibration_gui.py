@@ -0,0 +1,25 @@
+from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+
+from combined_calibration import CombinedReadoutProcedure
+
+
+class MainWindow(ManagedDockWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=CombinedReadoutProcedure,
+            inputs=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+            ],
+            displays=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+            ],
+            x_axis=["rf power", "rf power", "rf power"],
+            y_axis=["a1", "b1", "optical power"],
+            enable_file_input=True,
+        )
+        self.setWindowTitle("QRF power vs. ADBox ADC values and Powermeter")
+        self.filename = "adc_values_and_pm.csv"
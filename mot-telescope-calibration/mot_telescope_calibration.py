@@ -1,29 +1,36 @@
 import logging
 import sys
-from pathlib import Path
 from time import sleep
 
-import numpy as np
-from adboxes import TelescopeADBox
-from mogdevice.qrf import QRF
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+import instrument_pool
+import step_timing
 from pymeasure.experiment import Procedure
 from pymeasure.experiment.parameters import FloatParameter, ListParameter
+from qrf_power_levels import get_power_values
 
 SLEEP_TIME = 0.1
+ADBOX_ADDRESS = "ASRL10::INSTR"
+QRF_ADDRESS = "192.168.123.51"
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
-def get_power_values(start, stop):
-    all_power_levels = np.loadtxt(
-        Path(__file__).parent / "possible_power_values_qrf.txt"
-    )
-    rf_powers = all_power_levels[all_power_levels >= start]
-    rf_powers = rf_powers[rf_powers <= stop]
-    return rf_powers
+# the vendor drivers are imported when connecting, so simulations run without them
+def connect_adbox(address):
+    from adboxes import TelescopeADBox
+
+    return TelescopeADBox(address)
+
+
+def connect_qrf(address):
+    from mogdevice.qrf import QRF
+
+    return QRF(address)
+
+
+def check_qrf(qrf):
+    qrf.channels[1].power
 
 
 class ReadoutPowerLevelProcedure(Procedure):
@@ -52,17 +59,26 @@ class ReadoutPowerLevelProcedure(Procedure):
 
     DATA_COLUMNS = ["rf power", "a1", "a2", "a3", "b1", "b2", "b3"]
 
+    def get_resources(self):
+        return [ADBOX_ADDRESS, QRF_ADDRESS]
+
     def startup(self):
         log.info("Connecting to Telescope AD Box")
-        self.adbox = TelescopeADBox("ASRL10::INSTR")
+        self.adbox = instrument_pool.get(
+            ADBOX_ADDRESS, connect_adbox, check=lambda adbox: adbox.get_data()
+        )
         log.info("Connecting to QRF")
-        self.qrf = QRF("192.168.123.51")
+        self.qrf = instrument_pool.get(QRF_ADDRESS, connect_qrf, check=check_qrf)
+        self.timer = step_timing.StepTimer(self)
 
     def get_estimates(self):
-        factor = 1.5  # roughly determined...
         n_points = len(get_power_values(self.start_rf_power, self.stop_rf_power))
+        # without a measurement, assume that a step takes 1.5 times the settling time
+        duration = step_timing.estimate_duration(
+            self, n_points, SLEEP_TIME, default_overhead=0.5 * SLEEP_TIME
+        )
         estimates = [
-            ("Duration / s", f"{factor * n_points * SLEEP_TIME:.1f}"),
+            ("Duration / s", f"{duration:.1f}"),
         ]
         return estimates
 
@@ -71,9 +87,13 @@ class ReadoutPowerLevelProcedure(Procedure):
         n_points = len(rf_powers)
 
         for i, rf_power in enumerate(rf_powers):
+            self.timer.start_step()
             self.qrf.channels[self.qrf_channel].power = rf_power
+            self.timer.lap("write")
             sleep(SLEEP_TIME)
+            self.timer.lap("settle")
             adc_values = self.adbox.get_data(raw=True)
+            self.timer.lap("read")
             self.emit("progress", 100 * i / n_points)
             self.emit(
                 "results",
@@ -87,31 +107,24 @@ class ReadoutPowerLevelProcedure(Procedure):
                     "b3": adc_values["B3"],
                 },
             )
+            self.timer.lap("emit")
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                break
 
-
-class MainWindow(ManagedDockWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=ReadoutPowerLevelProcedure,
-            inputs=[
-                "start_rf_power",
-                "stop_rf_power",
-                "qrf_channel",
-            ],
-            displays=[
-                "start_rf_power",
-                "stop_rf_power",
-                "qrf_channel",
-            ],
-            x_axis=["rf power", "rf power"],
-            y_axis=["a1", "b1"],
-            enable_file_input=True,
-        )
-        self.setWindowTitle("QRF power vs. ADBox ADC values")
-        self.filename = "adc_values.csv"
+    def shutdown(self):
+        if hasattr(self, "timer"):
+            self.timer.finish()
 
 
 def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
+
+    from mot_telescope_calibration_gui import MainWindow
+
+    remote_procedures.enable_from_environment()
+
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
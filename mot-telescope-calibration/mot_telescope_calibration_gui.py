@@ -0,0 +1,25 @@
+from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+
+from mot_telescope_calibration import ReadoutPowerLevelProcedure
+
+
+class MainWindow(ManagedDockWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=ReadoutPowerLevelProcedure,
+            inputs=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+            ],
+            displays=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+            ],
+            x_axis=["rf power", "rf power"],
+            y_axis=["a1", "b1"],
+            enable_file_input=True,
+        )
+        self.setWindowTitle("QRF power vs. ADBox ADC values")
+        self.filename = "adc_values.csv"
@@ -1,29 +1,36 @@
 import logging
 import sys
-from pathlib import Path
 from time import sleep
 
-import numpy as np
-from mogdevice.qrf import QRF
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows import ManagedWindow
+import instrument_pool
+import pm_acquisition
+import step_timing
 from pymeasure.experiment import Procedure
-from pymeasure.experiment.parameters import FloatParameter, ListParameter
+from pymeasure.experiment.parameters import (
+    FloatParameter,
+    IntegerParameter,
+    ListParameter,
+)
 from pymeasure.instruments.thorlabs.thorlabspm100usb import ThorlabsPM100USB
+from qrf_power_levels import get_power_values
 
 SLEEP_TIME = 0.1
+PM_ADDRESS = "USB0::0x1313::0x8078::P0032734::INSTR"
+QRF_ADDRESS = "192.168.123.51"
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
-def get_power_values(start, stop):
-    all_power_levels = np.loadtxt(
-        Path(__file__).parent / "possible_power_values_qrf.txt"
-    )
-    rf_powers = all_power_levels[all_power_levels >= start]
-    rf_powers = rf_powers[rf_powers <= stop]
-    return rf_powers
+# the vendor driver is imported when connecting, so simulations run without it
+def connect_qrf(address):
+    from mogdevice.qrf import QRF
+
+    return QRF(address)
+
+
+def check_qrf(qrf):
+    qrf.channels[1].power
 
 
 class ReadoutPowerLevelProcedure(Procedure):
@@ -50,19 +57,40 @@ class ReadoutPowerLevelProcedure(Procedure):
         choices=[1, 2, 3, 4],
     )
 
-    DATA_COLUMNS = ["rf power", "optical power"]
+    pm_averaging = IntegerParameter(
+        "Power meter averaging count", default=1, minimum=1, maximum=10000
+    )
+    pm_samples = IntegerParameter(
+        "Power meter samples per step", default=1, minimum=1, maximum=1000
+    )
+
+    DATA_COLUMNS = ["rf power", "optical power", "optical power std"]
+
+    def get_resources(self):
+        return [PM_ADDRESS, QRF_ADDRESS]
 
     def startup(self):
         log.info("Connecting to Thorlabs PM100USB")
-        self.pm = ThorlabsPM100USB("USB0::0x1313::0x8078::P0032734::INSTR")
+        self.pm = instrument_pool.get(
+            PM_ADDRESS,
+            ThorlabsPM100USB,
+            check=instrument_pool.query_id,
+        )
+        self.acquisition = pm_acquisition.PowerMeterAcquisition(
+            self.pm, averaging=self.pm_averaging
+        )
         log.info("Connecting to QRF")
-        self.qrf = QRF("192.168.123.51")
+        self.qrf = instrument_pool.get(QRF_ADDRESS, connect_qrf, check=check_qrf)
+        self.timer = step_timing.StepTimer(self)
 
     def get_estimates(self):
-        factor = 1.5  # roughly determined...
         n_points = len(get_power_values(self.start_rf_power, self.stop_rf_power))
+        # without a measurement, assume that a step takes 1.5 times the settling time
+        duration = step_timing.estimate_duration(
+            self, n_points, SLEEP_TIME, default_overhead=0.5 * SLEEP_TIME
+        )
         estimates = [
-            ("Duration / s", f"{factor * n_points * SLEEP_TIME:.1f}"),
+            ("Duration / s", f"{duration:.1f}"),
         ]
         return estimates
 
@@ -71,36 +99,40 @@ class ReadoutPowerLevelProcedure(Procedure):
         n_points = len(rf_powers)
 
         for i, rf_power in enumerate(rf_powers):
+            self.timer.start_step()
             self.qrf.channels[self.qrf_channel].power = rf_power
+            self.timer.lap("write")
             sleep(SLEEP_TIME)
-            optical_power = self.pm.power
+            self.timer.lap("settle")
+            burst = self.acquisition.read_burst(self.pm_samples)
+            self.timer.lap("read")
             self.emit("progress", 100 * i / n_points)
-            self.emit("results", {"rf power": rf_power, "optical power": optical_power})
-
-
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=ReadoutPowerLevelProcedure,
-            inputs=[
-                "start_rf_power",
-                "stop_rf_power",
-                "qrf_channel",
-            ],
-            displays=[
-                "start_rf_power",
-                "stop_rf_power",
-                "qrf_channel",
-            ],
-            x_axis="rf power",
-            y_axis="optical power",
-            enable_file_input=True,
-        )
-        self.setWindowTitle("QRF power vs. Powermeter")
-        self.filename = "qrf_vs_pm.csv"
+            self.emit(
+                "results",
+                {
+                    "rf power": rf_power,
+                    "optical power": burst.mean,
+                    "optical power std": burst.std,
+                },
+            )
+            self.timer.lap("emit")
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                break
+
+    def shutdown(self):
+        if hasattr(self, "timer"):
+            self.timer.finish()
 
 
 def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
+
+    from qrf_vs_pm_gui import MainWindow
+
+    remote_procedures.enable_from_environment()
+
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,27 @@
+from pymeasure.display.windows import ManagedWindow
+
+from qrf_vs_pm import ReadoutPowerLevelProcedure
+
+
+class MainWindow(ManagedWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=ReadoutPowerLevelProcedure,
+            inputs=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+                "pm_averaging",
+                "pm_samples",
+            ],
+            displays=[
+                "start_rf_power",
+                "stop_rf_power",
+                "qrf_channel",
+            ],
+            x_axis="rf power",
+            y_axis="optical power",
+            enable_file_input=True,
+        )
+        self.setWindowTitle("QRF power vs. Powermeter")
+        self.filename = "qrf_vs_pm.csv"
@@ -2,8 +2,7 @@ import logging
 import sys
 from time import sleep
 
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows import ManagedWindow
+import instrument_pool
 from pymeasure.experiment import Procedure
 from pymeasure.experiment.parameters import (
     BooleanParameter,
@@ -13,10 +12,16 @@ from pymeasure.experiment.parameters import (
 )
 from pymeasure.instruments.yokogawa.aq6370series import AQ6370D
 
+OSA_ADDRESS = "TCPIP::192.168.123.169::INSTR"
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
+def connect_osa(address):
+    return AQ6370D(address, timeout=10_000)
+
+
 class ReadoutPowerLevelProcedure(Procedure):
 
     resolution_bandwidth = ListParameter(
@@ -72,9 +77,14 @@ class ReadoutPowerLevelProcedure(Procedure):
 
     DATA_COLUMNS = ["wavelength", "power level"]
 
+    def get_resources(self):
+        return [OSA_ADDRESS]
+
     def startup(self):
         log.info("Connecting to AQ6370D")
-        self.osa = AQ6370D("TCPIP::192.168.123.169::INSTR", timeout=10_000)
+        self.osa = instrument_pool.get(
+            OSA_ADDRESS, connect_osa, check=instrument_pool.query_id
+        )
         self.osa.sweep_mode = "REPEAT"
 
     def execute(self):
@@ -89,6 +99,9 @@ class ReadoutPowerLevelProcedure(Procedure):
         self.osa.sweep_mode = "SINGLE"
         self.osa.initiate_sweep()
         while self.osa.values(":STAT:OPER:EVEN?")[0]:
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                return
             sleep(0.1)
         x_data = self.osa.get_xdata()
         y_data = self.osa.get_ydata()
@@ -97,41 +110,19 @@ class ReadoutPowerLevelProcedure(Procedure):
                 "results",
                 {"wavelength": x, "power level": y},
             )
-
-        del self.osa
-
-
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=ReadoutPowerLevelProcedure,
-            inputs=[
-                "wavelength_start",
-                "wavelength_stop",
-                "resolution_bandwidth",
-                "reference_level",
-                "level_position",
-                "manual_sample_number",
-                "sample_number",
-            ],
-            displays=[
-                "wavelength_start",
-                "wavelength_stop",
-                "resolution_bandwidth",
-                "reference_level",
-                "level_position",
-                "manual_sample_number",
-                "sample_number",
-            ],
-            x_axis="wavelength",
-            y_axis="power level",
-            enable_file_input=True,
-        )
-        self.setWindowTitle("Optical Spectral Analyzer AQ6370D")
-        self.filename = "optical_spectrum.csv"
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                return
 
 
 def main():
+    import remote_procedures
+    from pymeasure.display.Qt import QtWidgets
+
+    from optical_spectrum_gui import MainWindow
+
+    remote_procedures.enable_from_environment()
+
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
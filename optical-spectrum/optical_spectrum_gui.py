@@ -0,0 +1,33 @@
+from pymeasure.display.windows import ManagedWindow
+
+from optical_spectrum import ReadoutPowerLevelProcedure
+
+
+class MainWindow(ManagedWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=ReadoutPowerLevelProcedure,
+            inputs=[
+                "wavelength_start",
+                "wavelength_stop",
+                "resolution_bandwidth",
+                "reference_level",
+                "level_position",
+                "manual_sample_number",
+                "sample_number",
+            ],
+            displays=[
+                "wavelength_start",
+                "wavelength_stop",
+                "resolution_bandwidth",
+                "reference_level",
+                "level_position",
+                "manual_sample_number",
+                "sample_number",
+            ],
+            x_axis="wavelength",
+            y_axis="power level",
+            enable_file_input=True,
+        )
+        self.setWindowTitle("Optical Spectral Analyzer AQ6370D")
+        self.filename = "optical_spectrum.csv"
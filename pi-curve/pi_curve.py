@@ -1,12 +1,15 @@
 import logging
-from time import sleep
 
+import cancellation
+import instrument_pool
 import numpy as np
-from ctl200 import laser
-from pymeasure.display import Plotter
+import pm_acquisition
+import step_timing
 from pymeasure.experiment import (
+    BooleanParameter,
     FloatParameter,
     IntegerParameter,
+    Parameter,
     Procedure,
     Results,
     Worker,
@@ -18,46 +21,223 @@ log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
+# the vendor driver is imported when connecting, so simulations run without it
+def connect_laser(port):
+    from ctl200 import laser
+
+    ctl = laser.Laser(port)
+    ctl.connect()
+    return ctl
+
+
+class IncrementalPIFit:
+    """Running linear fit of the part of a PI curve above the lasing threshold.
+
+    Points are added one at a time with `update`, the fit only keeps the sums of the
+    normal equations. Currents are in mA, powers in W.
+    """
+
+    def __init__(
+        self,
+        lasing_power,
+        kink_tolerance=0.2,
+        convergence_tolerance=0.01,
+        n_converged=5,
+    ):
+        self.lasing_power = lasing_power
+        self.kink_tolerance = kink_tolerance
+        self.convergence_tolerance = convergence_tolerance
+        self.n_converged = n_converged
+
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.slope = np.nan
+        self.threshold = np.nan
+        self.kinks = []
+        self._last_point = None
+        self._first_current = None
+        self._currents_differ = False
+        self._deviating = False
+        self._n_stable = 0
+
+    @property
+    def slope_efficiency(self):
+        """Slope efficiency in W/A."""
+        return 1e3 * self.slope
+
+    @property
+    def converged(self):
+        return self._n_stable >= self.n_converged
+
+    def update(self, current, power):
+        """Add a point, returns True if it shows a kink in the PI curve."""
+        if power < self.lasing_power:
+            return False
+
+        # only the onset of a deviation from the fitted slope counts as a kink
+        kink = False
+        if self.n >= 2 and current != self._last_point[0]:
+            last_current, last_power = self._last_point
+            local_slope = (power - last_power) / (current - last_current)
+            deviating = abs(local_slope - self.slope) > self.kink_tolerance * abs(
+                self.slope
+            )
+            kink = deviating and not self._deviating
+            self._deviating = deviating
+            if kink:
+                self.kinks.append(current)
+        self._last_point = (current, power)
+
+        self.n += 1
+        self.sx += current
+        self.sy += power
+        self.sxx += current**2
+        self.sxy += current * power
+        if self._first_current is None:
+            self._first_current = current
+        # the fit is undefined as long as all currents are equal, rounding errors
+        # would leave a tiny determinant instead of zero
+        self._currents_differ |= current != self._first_current
+        if not self._currents_differ:
+            return kink
+
+        slope = (self.n * self.sxy - self.sx * self.sy) / (
+            self.n * self.sxx - self.sx**2
+        )
+        threshold = (slope * self.sx - self.sy) / (self.n * slope)
+
+        tolerance = self.convergence_tolerance
+        stable = abs(slope - self.slope) <= tolerance * abs(slope)
+        stable &= abs(threshold - self.threshold) <= tolerance * abs(threshold)
+        self._n_stable = self._n_stable + 1 if stable else 0
+        self.slope = slope
+        self.threshold = threshold
+        return kink
+
+
 class PICharacteristicsProcedure(Procedure):
     n_steps = IntegerParameter("Number of steps")
     min_current = FloatParameter("Minimum Current", units="mA", default=0)
     max_current = FloatParameter("Maximum Current", units="mA", default=100)
     delay = FloatParameter("Delay", units="s", default=0.1)
     wavelength = FloatParameter("Wavelength", units="nm", default=780)
+    laser_port = Parameter("CTL200 port", default="COM8")
+    pm_address = Parameter(
+        "Power meter address", default="USB0::0x1313::0x8079::P1001003::INSTR"
+    )
+    lasing_power = FloatParameter(
+        "Minimum power counted as lasing", units="W", default=1e-4
+    )
+    power_limit = FloatParameter("Power limit", units="W", default=0.1)
+    pm_averaging = IntegerParameter(
+        "Power meter averaging count", default=1, minimum=1, maximum=10000
+    )
+    pm_samples = IntegerParameter(
+        "Power meter samples per step", default=1, minimum=1, maximum=1000
+    )
+    stop_on_convergence = BooleanParameter(
+        "Stop when threshold and slope efficiency converged", default=False
+    )
 
-    DATA_COLUMNS = ["Current", "Power"]
+    DATA_COLUMNS = [
+        "Current",
+        "Power",
+        "Power Std",
+        "Threshold",
+        "Slope Efficiency",
+        "Kink",
+    ]
+
+    def get_resources(self):
+        return [self.laser_port, self.pm_address]
 
     def startup(self):
         log.info("Connecting to Thorlabs PM100D.")
-        self.pm = ThorlabsPM100USB("USB0::0x1313::0x8079::P1001003::INSTR")
-        self.pm.wavelength = self.wavelength
+        self.pm = instrument_pool.get(
+            self.pm_address, ThorlabsPM100USB, check=instrument_pool.query_id
+        )
+        self.acquisition = pm_acquisition.PowerMeterAcquisition(
+            self.pm, averaging=self.pm_averaging, wavelength=self.wavelength
+        )
         log.info("Connecting to koheron CTL200.")
-        self.laser = laser.Laser("COM8")
-        self.laser.connect()
+        self.laser = instrument_pool.get(
+            self.laser_port,
+            connect_laser,
+            check=instrument_pool.reads("laser_status"),
+        )
         self.laser.laser_status = 0
         self.laser.laser_current = self.min_current
-        sleep(self.delay)
+        # execute notices a stop request during the wait
+        cancellation.wait(self, self.delay)
         self.laser.laser_status = 1
+        self.timer = step_timing.StepTimer(self)
+
+    def get_estimates(self):
+        duration = step_timing.estimate_duration(self, self.n_steps or 0, self.delay)
+        estimates = [
+            ("Maximum duration / s", f"{duration:.1f}"),
+        ]
+        return estimates
 
     def execute(self):
         log.info("Starting the loop with {} steps".format(self.n_steps))
         currents = np.linspace(self.min_current, self.max_current, num=self.n_steps)
-        for curr in currents:
-            power = self.pm.power
+        fit = IncrementalPIFit(self.lasing_power)
+        for i, curr in enumerate(currents):
+            self.timer.start_step()
             self.laser.laser_current = curr
-            self.emit("results", {"Current": curr, "Power": power})
+            self.timer.lap("write")
+            if not cancellation.wait(self, self.delay):
+                log.warning("Caught the stop flag in the procedure")
+                break
+            self.timer.lap("settle")
+            burst = self.acquisition.read_burst(self.pm_samples)
+            power = burst.mean
+            self.timer.lap("read")
+            kink = fit.update(curr, power)
+            self.timer.lap("fit")
+            self.emit("progress", 100 * i / len(currents))
+            self.emit(
+                "results",
+                {
+                    "Current": curr,
+                    "Power": power,
+                    "Power Std": burst.std,
+                    "Threshold": fit.threshold,
+                    "Slope Efficiency": fit.slope_efficiency,
+                    "Kink": kink,
+                },
+            )
+            self.timer.lap("emit")
             log.debug("Emitting results: {}".format(power))
-            sleep(self.delay)
+            if kink:
+                log.warning("Kink in the PI curve at {} mA".format(curr))
+            if power >= self.power_limit:
+                log.warning("Reached the power limit at {} mA".format(curr))
+                break
+            if self.stop_on_convergence and fit.converged:
+                log.info(
+                    "Fit converged: threshold {:.2f} mA, slope {:.3f} W/A".format(
+                        fit.threshold, fit.slope_efficiency
+                    )
+                )
+                break
             if self.should_stop():
                 log.warning("Caught the stop flag in the procedure")
-                self.laser.laser_status = 0
-                self.laser.close()
                 break
         self.laser.laser_status = 0
-        self.laser.close()
+
+    def shutdown(self):
+        # first, switching the laser off can fail
+        if hasattr(self, "timer"):
+            self.timer.finish()
+        if hasattr(self, "laser"):
+            self.laser.laser_status = 0
 
 
 def main():
+    from pymeasure.display import Plotter
+
     console_log(log)
 
     log.info("Constructing PICharacteristicsProcedure")
@@ -80,8 +260,8 @@ def main():
     worker.start()
     log.info("Started the Worker")
 
-    log.info("Joining with the worker in at most 20 s.")
-    worker.join(timeout=20)
+    log.info("Joining with the worker until the sweep is finished.")
+    worker.join(timeout=None)
     log.info("Finished the measurement")
 
 
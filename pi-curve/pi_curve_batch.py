@@ -0,0 +1,145 @@
+import argparse
+import csv
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pymeasure.experiment import Procedure, Results, Worker
+from pymeasure.experiment.results import unique_filename
+from pymeasure.log import console_log
+
+from pi_curve import PICharacteristicsProcedure
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+SUMMARY_COLUMNS = [
+    "name",
+    "laser_port",
+    "pm_address",
+    "status",
+    "duration",
+    "points",
+    "threshold",
+    "slope_efficiency",
+    "kinks",
+    "filename",
+]
+
+
+def read_jobs(filename):
+    """Read the job list, one job per row.
+
+    Every column except `name` is the attribute name of a parameter of
+    `PICharacteristicsProcedure`, e.g. `laser_port`, `pm_address`, `min_current`,
+    `max_current`, `n_steps` or `wavelength`.
+    """
+    with open(filename, newline="") as f:
+        jobs = [row for row in csv.DictReader(f)]
+    for i, job in enumerate(jobs):
+        job.setdefault("name", f"job{i}")
+        job["name"] = job["name"] or f"job{i}"
+    return jobs
+
+
+def make_procedure(job):
+    """The procedure of a job, empty columns keep the default parameters."""
+    procedure = PICharacteristicsProcedure()
+    procedure.set_parameters(
+        {key: value for key, value in job.items() if key != "name" and value != ""}
+    )
+    return procedure
+
+
+def group_jobs(jobs):
+    """Group jobs that share a laser or a power meter.
+
+    Groups run in parallel, the jobs within a group one after the other.
+    """
+    groups = []
+    for job in jobs:
+        resources = set(make_procedure(job).get_resources())
+        overlapping = [g for g in groups if g["resources"] & resources]
+        merged = {"resources": set(resources), "jobs": []}
+        for group in overlapping:
+            merged["resources"] |= group["resources"]
+            merged["jobs"] += group["jobs"]
+            groups.remove(group)
+        merged["jobs"].append(job)
+        groups.append(merged)
+    return [group["jobs"] for group in groups]
+
+
+def run_job(job, directory):
+    procedure = make_procedure(job)
+    filename = unique_filename(directory, prefix=f"{job['name']}-")
+    results = Results(procedure, filename)
+    worker = Worker(results)
+
+    start = time.monotonic()
+    worker.start()
+    worker.join(timeout=None)
+    duration = time.monotonic() - start
+
+    data = results.data
+    summary = {
+        "name": job["name"],
+        "laser_port": procedure.laser_port,
+        "pm_address": procedure.pm_address,
+        "status": Procedure.STATUS_STRINGS[procedure.status],
+        "duration": f"{duration:.1f}",
+        "points": len(data),
+        "filename": filename,
+    }
+    if len(data):
+        summary["threshold"] = data["Threshold"].iloc[-1]
+        summary["slope_efficiency"] = data["Slope Efficiency"].iloc[-1]
+        summary["kinks"] = " ".join(str(c) for c in data.loc[data["Kink"], "Current"])
+    return summary
+
+
+def run_group(jobs, directory):
+    summaries = []
+    for job in jobs:
+        log.info(f"Starting {job['name']}")
+        try:
+            summaries.append(run_job(job, directory))
+        except Exception:
+            log.exception(f"{job['name']} failed")
+            summaries.append({"name": job["name"], "status": "Failed"})
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record PI curves of several lasers in parallel."
+    )
+    parser.add_argument("jobs", help="CSV file with one job per row")
+    parser.add_argument(
+        "-d", "--directory", default=".", help="directory for the results files"
+    )
+    parser.add_argument(
+        "-n", "--processes", type=int, default=None, help="number of processes"
+    )
+    args = parser.parse_args()
+    console_log(log)
+
+    Path(args.directory).mkdir(parents=True, exist_ok=True)
+    groups = group_jobs(read_jobs(args.jobs))
+    log.info(f"Running {sum(map(len, groups))} jobs in {len(groups)} groups")
+
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = [executor.submit(run_group, g, args.directory) for g in groups]
+        summaries = [summary for future in futures for summary in future.result()]
+
+    summary_filename = Path(args.directory) / "summary.csv"
+    with open(summary_filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, restval="")
+        writer.writeheader()
+        writer.writerows(summaries)
+    log.info(f"Wrote summary to {summary_filename}")
+
+
+if __name__ == "__main__":
+    main()
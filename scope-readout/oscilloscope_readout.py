@@ -1,19 +1,46 @@
 import logging
 import sys
+import time
 
-from pymeasure.display.Qt import QtWidgets
-from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+import cancellation
+import instrument_pool
+import numpy as np
 from pymeasure.experiment import Procedure
-from pymeasure.experiment.parameters import BooleanParameter, IntegerParameter
+from pymeasure.experiment.parameters import (
+    BooleanParameter,
+    FloatParameter,
+    IntegerParameter,
+)
 from pymeasure.instruments.lecroy.lecroyT3DSO1204 import LeCroyT3DSO1204
 
+from scope_spectra import WelchAccumulator, channel_pairs
+
+SCOPE_ADDRESS = "TCPIP::192.168.123.158::INSTR"
+
+CHANNELS = ["CH1", "CH2", "CH3", "CH4"]
+PSD_COLUMNS = [f"PSD {ch}" for ch in CHANNELS]
+CSD_COLUMNS = [f"CSD {CHANNELS[i]}-{CHANNELS[j]}" for i, j in channel_pairs(4)]
+PHASE_COLUMNS = [f"CSD Phase {CHANNELS[i]}-{CHANNELS[j]}" for i, j in channel_pairs(4)]
+
+# how often the trigger state is polled while waiting for an acquisition
+POLL_INTERVAL = 0.05
+
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
 
 class ScopeReadoutProcedure(Procedure):
 
-    DATA_COLUMNS = ["Time", "CH1", "CH2", "CH3", "CH4"]
+    # the time traces, or the averaged spectra in the spectrum mode
+    DATA_COLUMNS = [
+        "Time",
+        *CHANNELS,
+        "Frequency",
+        "Frames",
+        *PSD_COLUMNS,
+        *CSD_COLUMNS,
+        *PHASE_COLUMNS,
+    ]
 
     ch1 = BooleanParameter("CH1", default=True)
     ch2 = BooleanParameter("CH2", default=False)
@@ -24,46 +51,175 @@ class ScopeReadoutProcedure(Procedure):
         "Requested Points", default=0, units="pts", minimum=0, maximum=175000
     )
     sparsing = IntegerParameter("Sparsing", default=1000, minimum=1, maximum=10000)
+    capture_timeout = FloatParameter(
+        "Capture timeout", units="s", default=10.0, minimum=0.1, maximum=3600.0
+    )
 
-    def startup(self):
-        self.scope = LeCroyT3DSO1204("TCPIP::192.168.123.158::INSTR")
+    spectrum = BooleanParameter("Noise spectrum", default=False)
+    n_captures = IntegerParameter(
+        "Number of captures",
+        default=10,
+        minimum=1,
+        maximum=1_000_000,
+        group_by="spectrum",
+    )
+    segment_length = IntegerParameter(
+        "Segment length",
+        units="pts",
+        default=1024,
+        minimum=16,
+        maximum=175000,
+        group_by="spectrum",
+    )
+    update_interval = IntegerParameter(
+        "Spectrum update interval",
+        units="captures",
+        default=0,
+        minimum=0,
+        maximum=1_000_000,
+        group_by="spectrum",
+    )
 
-    def execute(self):
-        requested_channels = []
-        for i, request in enumerate([self.ch1, self.ch2, self.ch3, self.ch4]):
-            if request:
-                requested_channels.append(f"CH{i + 1}")
+    def get_resources(self):
+        return [SCOPE_ADDRESS]
+
+    def startup(self):
+        self.scope = instrument_pool.get(
+            SCOPE_ADDRESS,
+            LeCroyT3DSO1204,
+            check=instrument_pool.query_id,
+        )
 
+    def acquire(self):
+        """Arm a single acquisition and wait until the scope has stopped.
+
+        All channels downloaded afterwards are from this acquisition. Returns False
+        if the procedure was stopped.
+        """
+        self.scope.trigger_mode = "single"
+        end = time.monotonic() + self.capture_timeout
+        while self.scope.trigger_mode != "stopped":
+            if time.monotonic() > end:
+                raise TimeoutError(
+                    f"The scope did not trigger within {self.capture_timeout} s"
+                )
+            if not cancellation.wait(self, POLL_INTERVAL):
+                log.warning("Caught the stop flag in the procedure")
+                return False
+        return True
+
+    def requested_channels(self):
+        requests = [self.ch1, self.ch2, self.ch3, self.ch4]
+        return [ch for ch, request in zip(CHANNELS, requests) if request]
+
+    def download(self, channels, sparsing=None):
+        """Waveforms of the channels and the time axis, None if stopped.
+
+        The scope keeps running unless an acquisition was stopped with `acquire`
+        before, then all channels are from the same trigger.
+        """
+        if sparsing is None:
+            sparsing = self.sparsing
         wfs = {}
-        for ch in requested_channels:
+        for ch in channels:
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                return None
             log.info(f"Downloading waveform for {ch}")
             wf, ts, _ = self.scope.download_waveform(
-                ch, requested_points=self.requested_points, sparsing=self.sparsing
+                ch, requested_points=self.requested_points, sparsing=sparsing
             )
             wfs[ch] = wf
+        return wfs, ts
+
+    def execute(self):
+        channels = self.requested_channels()
+        if self.spectrum:
+            self.record_spectrum(channels)
+            return
+
+        waveforms = self.download(channels)
+        if waveforms is None:
+            return
+        wfs, ts = waveforms
 
         for i, t in enumerate(ts):
             self.emit("results", {"Time": t, **{ch: wfs[ch][i] for ch in wfs}})
+            if self.should_stop():
+                log.warning("Caught the stop flag in the procedure")
+                return
+
+    def record_spectrum(self, channels):
+        """Average the spectra of repeated captures, the traces are not stored."""
+        if self.sparsing > 1:
+            # every n-th point without a low-pass filter aliases the noise
+            log.warning(
+                f"Ignoring the sparsing of {self.sparsing} for the spectra, "
+                "downloading every point"
+            )
+        # the captures are single acquisitions, the mode is restored at shutdown
+        self.trigger_mode = self.scope.trigger_mode
+        accumulator = None
+        for capture in range(self.n_captures):
+            if not self.acquire():
+                break
+            waveforms = self.download(channels, sparsing=1)
+            if waveforms is None:
+                break
+            wfs, ts = waveforms
+            if accumulator is None:
+                sample_rate = 1 / (ts[1] - ts[0])
+                log.info(f"Averaging spectra at a sample rate of {sample_rate:g} Hz")
+                accumulator = WelchAccumulator(
+                    len(channels), self.segment_length, sample_rate
+                )
+                frames = np.empty((len(channels), len(ts)))
+            for k, ch in enumerate(channels):
+                frames[k] = wfs[ch]
+            accumulator.add(frames)
+            self.emit("progress", 100 * (capture + 1) / self.n_captures)
+
+            # intermediate spectra, the final one is written after the loop
+            n = capture + 1
+            if self.update_interval and n % self.update_interval == 0:
+                if n < self.n_captures:
+                    self.emit_spectrum(accumulator, channels)
+        if accumulator is not None:
+            # also after a stop, with the captures averaged so far
+            self.emit_spectrum(accumulator, channels)
+
+    def shutdown(self):
+        if hasattr(self, "trigger_mode"):
+            self.scope.trigger_mode = self.trigger_mode
+
+    def emit_spectrum(self, accumulator, channels):
+        log.info(f"Writing the spectra averaged over {accumulator.n_frames} captures")
+        matrix = accumulator.spectral_matrix()
+        columns = {}
+        for k, ch in enumerate(channels):
+            columns[f"PSD {ch}"] = matrix[k, k].real
+        for i, j in channel_pairs(len(channels)):
+            pair = f"{channels[i]}-{channels[j]}"
+            columns[f"CSD {pair}"] = np.abs(matrix[i, j])
+            columns[f"CSD Phase {pair}"] = np.angle(matrix[i, j])
+        for k, f in enumerate(accumulator.frequencies):
+            row = {name: values[k] for name, values in columns.items()}
+            self.emit(
+                "results", {"Frequency": f, "Frames": accumulator.n_frames, **row}
+            )
 
-        if self.should_stop():
-            log.warning("Caught the stop flag in the procedure")
-            return
 
+def main():
+    import remote_procedures
+    import shm_bus
+    from pymeasure.display.Qt import QtWidgets
 
-class MainWindow(ManagedDockWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=ScopeReadoutProcedure,
-            inputs=["requested_points", "sparsing", "ch1", "ch2", "ch3", "ch4"],
-            displays=["requested_points", "sparsing"],
-            x_axis="Time",
-            y_axis=["CH1", "CH2", "CH3", "CH4"],
-            enable_file_input=True,
-        )
-        self.setWindowTitle("Scope Readout")
+    from oscilloscope_readout_gui import MainWindow
 
+    # with a procedure server, the acquisition runs there instead
+    if not remote_procedures.enable_from_environment() and shm_bus.process_enabled():
+        shm_bus.enable()
 
-def main():
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,28 @@
+from pymeasure.display.windows.managed_dock_window import ManagedDockWindow
+
+from oscilloscope_readout import ScopeReadoutProcedure
+
+
+class MainWindow(ManagedDockWindow):
+    def __init__(self):
+        super(MainWindow, self).__init__(
+            procedure_class=ScopeReadoutProcedure,
+            inputs=[
+                "requested_points",
+                "sparsing",
+                "capture_timeout",
+                "ch1",
+                "ch2",
+                "ch3",
+                "ch4",
+                "spectrum",
+                "n_captures",
+                "segment_length",
+                "update_interval",
+            ],
+            displays=["requested_points", "sparsing", "spectrum", "n_captures"],
+            x_axis=["Time", "Time", "Time", "Time", "Frequency"],
+            y_axis=["CH1", "CH2", "CH3", "CH4", "PSD CH1"],
+            enable_file_input=True,
+        )
+        self.setWindowTitle("Scope Readout")
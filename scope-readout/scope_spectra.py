@@ -0,0 +1,206 @@
+import argparse
+import inspect
+import itertools
+import logging
+import time
+
+import numpy as np
+
+# numpy < 2.0 returns the spectra in a new array instead
+RFFT_OUT = "out" in inspect.signature(np.fft.rfft).parameters
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def hann(n):
+    """Periodic Hann window, the usual choice for spectral estimation."""
+    return 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)
+
+
+def channel_pairs(n_channels):
+    return list(itertools.combinations(range(n_channels), 2))
+
+
+class WelchAccumulator:
+    """Running Welch estimate of the spectra of several simultaneously sampled channels.
+
+    Every frame, an array of shape (channels, samples), is split into segments of
+    `segment_length` samples overlapping by `overlap`. The segments are
+    detrended by their mean, windowed and transformed with one real FFT over all
+    channels and segments. The products of the spectra of all channel pairs are
+    summed up, so the averaged power and cross spectral densities are available
+    after every frame without keeping the frames.
+
+    The segment, spectrum and product buffers are allocated for the first frame
+    and reused as long as the frame length does not change. The spectra are
+    stored frequency-major, so the products of all channel pairs are a single
+    batched matrix product over the segments.
+
+    The cross spectral density of channels i and j is the average of
+    conj(X_i) * X_j, the convention of `scipy.signal.csd(x_i, x_j)`.
+    """
+
+    def __init__(self, n_channels, segment_length, sample_rate, overlap=0.5):
+        if not 0 <= overlap < 1:
+            raise ValueError("The overlap has to be in [0, 1)")
+        self.n_channels = n_channels
+        self.segment_length = segment_length
+        self.sample_rate = sample_rate
+        self.step = max(int(round(segment_length * (1 - overlap))), 1)
+        self.window = hann(segment_length)
+        self.frequencies = np.fft.rfftfreq(segment_length, 1 / sample_rate)
+
+        # one-sided density, the DC and Nyquist bins only appear once
+        self.scale = np.full(len(self.frequencies), 2.0)
+        self.scale[0] = 1.0
+        if segment_length % 2 == 0:
+            self.scale[-1] = 1.0
+        self.scale /= sample_rate * np.sum(self.window**2)
+
+        self.n_frames = 0
+        self.n_segments = 0
+        self._sum = np.zeros(
+            (len(self.frequencies), n_channels, n_channels), dtype=complex
+        )
+        self._frame_length = None
+
+    def _allocate(self, frame_length):
+        n_segments = (frame_length - self.segment_length) // self.step + 1
+        if n_segments < 1:
+            raise ValueError(
+                f"Frames of {frame_length} samples are shorter than the segment "
+                f"length of {self.segment_length}"
+            )
+        n_frequencies = len(self.frequencies)
+        self._segments = np.empty((self.n_channels, n_segments, self.segment_length))
+        # (frequency, channel, segment), conjugated after the transpose is taken
+        self._spectra = np.empty(
+            (n_frequencies, self.n_channels, n_segments), dtype=complex
+        )
+        self._transposed = np.empty(
+            (n_frequencies, n_segments, self.n_channels), dtype=complex
+        )
+        self._products = np.empty_like(self._sum)
+        self._frame_length = frame_length
+
+    def add(self, frames):
+        """Add a frame of shape (channels, samples), returns the number of segments."""
+        frames = np.asarray(frames, dtype=float)
+        if frames.shape[0] != self.n_channels:
+            raise ValueError(f"Expected {self.n_channels} channels")
+        if frames.shape[1] != self._frame_length:
+            self._allocate(frames.shape[1])
+
+        segments = np.lib.stride_tricks.sliding_window_view(
+            frames, self.segment_length, axis=-1
+        )[:, :: self.step]
+        n_segments = segments.shape[1]
+        np.subtract(segments, segments.mean(axis=-1, keepdims=True), out=self._segments)
+        self._segments *= self.window
+        spectra = self._spectra.transpose(1, 2, 0)
+        if RFFT_OUT:
+            np.fft.rfft(self._segments, axis=-1, out=spectra)
+        else:
+            spectra[...] = np.fft.rfft(self._segments, axis=-1)
+        self._transposed[...] = self._spectra.transpose(0, 2, 1)
+        np.conjugate(self._spectra, out=self._spectra)
+        np.matmul(self._spectra, self._transposed, out=self._products)
+        self._sum += self._products
+
+        self.n_frames += 1
+        self.n_segments += n_segments
+        return n_segments
+
+    def spectral_matrix(self):
+        """Averaged cross spectral densities of all channel pairs, (i, j, frequency).
+
+        The diagonal holds the power spectral densities in units²/Hz.
+        """
+        if self.n_segments == 0:
+            return np.full(np.roll(self._sum.shape, -1), np.nan, dtype=complex)
+        return np.moveaxis(self._sum, 0, -1) * (self.scale / self.n_segments)
+
+    def psd(self):
+        """Averaged power spectral densities of the channels, (channel, frequency)."""
+        return np.diagonal(self.spectral_matrix()).T.real
+
+    def csd(self, i, j):
+        """Averaged cross spectral density of channels `i` and `j`."""
+        return self.spectral_matrix()[i, j]
+
+
+def naive_welch(frames, segment_length, sample_rate, overlap=0.5):
+    """Reference implementation transforming one segment at a time."""
+    accumulator = WelchAccumulator(len(frames[0]), segment_length, sample_rate, overlap)
+    n_channels = len(frames[0])
+    total = np.zeros(
+        (n_channels, n_channels, len(accumulator.frequencies)), dtype=complex
+    )
+    n_segments = 0
+    for frame in frames:
+        for start in range(0, len(frame[0]) - segment_length + 1, accumulator.step):
+            spectra = []
+            for channel in frame:
+                segment = channel[start : start + segment_length]
+                segment = (segment - segment.mean()) * accumulator.window
+                spectra.append(np.fft.rfft(segment))
+            for i, j in itertools.product(range(n_channels), repeat=2):
+                total[i, j] += np.conj(spectra[i]) * spectra[j]
+            n_segments += 1
+    return total * (accumulator.scale / n_segments)
+
+
+def synthetic_frames(
+    n_frames, n_channels=2, n_samples=100_000, sample_rate=1e6, seed=None
+):
+    """Frames of sines with a 90° phase step between the channels in white noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sample_rate
+    phases = 0.5 * np.pi * np.arange(n_channels)[:, np.newaxis]
+    for _ in range(n_frames):
+        sine = np.sin(2 * np.pi * 1e3 * t + phases + rng.uniform(0, 2 * np.pi))
+        yield sine + 0.01 * rng.standard_normal((n_channels, n_samples))
+
+
+def benchmark(n_frames=20, n_channels=4, n_samples=100_000, segment_length=4096):
+    """Compare the accumulator to transforming one segment at a time."""
+    sample_rate = 1e6
+    frames = list(synthetic_frames(n_frames, n_channels, n_samples, sample_rate, 0))
+
+    start = time.perf_counter()
+    expected = naive_welch(frames, segment_length, sample_rate)
+    naive_time = time.perf_counter() - start
+
+    accumulator = WelchAccumulator(n_channels, segment_length, sample_rate)
+    start = time.perf_counter()
+    for frame in frames:
+        accumulator.add(frame)
+    accumulated_time = time.perf_counter() - start
+
+    matrix = accumulator.spectral_matrix()
+    deviation = np.max(np.abs(matrix - expected)) / np.max(np.abs(expected))
+    print(
+        f"{n_frames} frames of {n_channels} x {n_samples} samples, "
+        f"{accumulator.n_segments} segments of {segment_length}"
+    )
+    print(f"per segment:  {1e3 * naive_time / n_frames:8.2f} ms per frame")
+    print(f"accumulator:  {1e3 * accumulated_time / n_frames:8.2f} ms per frame")
+    print(f"relative deviation: {deviation:.1e}")
+    return naive_time, accumulated_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the streaming Welch estimate of the scope spectra."
+    )
+    parser.add_argument("-n", "--frames", type=int, default=20)
+    parser.add_argument("-c", "--channels", type=int, default=4)
+    parser.add_argument("-s", "--samples", type=int, default=100_000)
+    parser.add_argument("-l", "--segment-length", type=int, default=4096)
+    args = parser.parse_args()
+    benchmark(args.frames, args.channels, args.samples, args.segment_length)
+
+
+if __name__ == "__main__":
+    main()